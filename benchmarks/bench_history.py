@@ -0,0 +1,56 @@
+"""
+History write throughput benchmark.
+
+    python -m benchmarks.bench_history [--updates 10000]
+
+Runs N update_state calls against a fresh database in synchronous mode and in
+write-behind mode, from one thread and from several, and prints updates/sec.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from src.history import HistoryManager
+
+
+def run(updates, write_behind, threads):
+    with tempfile.TemporaryDirectory() as tmp:
+        history = HistoryManager(os.path.join(tmp, "history.db"), write_behind=write_behind)
+        per_thread = updates // threads
+
+        def worker(n):
+            for i in range(per_thread):
+                # Re-use a bounded set of paths so both inserts and updates are exercised
+                path = f"/input/book-{n}-{i % 1000}"
+                history.update_state(path, f"hash-{i}", "pending", [f"{path}/ch1.mp3"], {"title": f"Book {i}"})
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        history.close()  # includes the final flush
+        elapsed = time.perf_counter() - start
+        return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=10000)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    for write_behind in (False, True):
+        for threads in (1, 4):
+            rate = run(args.updates, write_behind, threads)
+            mode = "write-behind" if write_behind else "synchronous"
+            print(f"{mode:13s} threads={threads}: {rate:10.0f} updates/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Micro-benchmarks for the code paths that scale with library size.
+
+    python -m benchmarks.bench_hotpaths [--sizes 1000,10000,100000] [--repeat 3] [--output results.json]
+
+Covers the per-tick structures (StabilityChecker.tracked_files,
+FileGrouper.groups), Identifier._extract_from_string and
+HistoryManager.calculate_hash. os.stat and os.path.exists are replaced by a
+fixed result, so only our own code is timed, not the filesystem. Each case is
+timed over --repeat passes (best pass reported, as items/sec), then run once
+more under tracemalloc for its peak allocation and the memory it retains.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import time
+import tracemalloc
+from unittest import mock
+
+from src.config import config
+from src.history import HistoryManager
+from src.identifier import Identifier
+from src.ingest import FileGrouper
+from src.monitor import StabilityChecker
+
+# Files per book folder; --group-size changes it
+GROUP_SIZE = 10
+
+# Regular file, 1 MB, fixed mtime
+FAKE_STAT = os.stat_result((0o100644, 0, 0, 1, 0, 0, 1024 * 1024, 0, 1_700_000_000, 0))
+
+NAME_TEMPLATES = [
+    "{author} - {title}",
+    "{author} - {title} [{year}] (Unabridged)",
+    "{author} - {title} [MP3] 64kbps",
+    "{title} (Audiobook)",
+    "{title_}_128kbps",
+    "{author} - {title} - Part {n:02d}.mp3",
+]
+WORDS = ["Silent", "Iron", "Last", "Hidden", "Broken", "Red", "Glass", "Hollow", "Winter", "Star", "Empire",
+         "River", "Machine", "Garden", "Memory", "Shadow", "Crown", "Signal", "Harbor", "Tide"]
+
+
+def fake_paths(n, files_per_dir=None):
+    files_per_dir = files_per_dir or GROUP_SIZE
+    return [f"/input/Book {i // files_per_dir:06d}/{i % files_per_dir + 1:02d} - Chapter.mp3" for i in range(n)]
+
+
+def fake_names(n, seed=0):
+    rng = random.Random(seed)
+    names = []
+    for i in range(n):
+        title = " ".join(rng.sample(WORDS, 3))
+        names.append(rng.choice(NAME_TEMPLATES).format(
+            author=f"{rng.choice(WORDS)} {rng.choice(WORDS)}son", title=title, title_=title.replace(" ", "_"),
+            year=rng.randint(1960, 2024), n=i % 20 + 1))
+    return names
+
+
+def _fake_stat(path, *args, **kwargs):
+    return FAKE_STAT
+
+
+def _fake_exists(path):
+    return True
+
+
+def patched_fs():
+    # Plain functions rather than mocks, which would record (and retain) every call
+    return mock.patch("os.stat", _fake_stat), mock.patch("os.path.exists", _fake_exists)
+
+
+# Each case is setup(n) -> state, run(state) -> None; run is what gets timed.
+
+def stability_add(n):
+    paths = fake_paths(n)
+
+    def run(checker):
+        for path in paths:
+            checker.add_file(path)
+    return lambda: StabilityChecker(lambda path: None), run
+
+
+def stability_tick(n):
+    # Steady state: every file tracked and unchanged, none stable yet (one tick = one pass)
+    def setup():
+        checker = StabilityChecker(lambda path: None)
+        for path in fake_paths(n):
+            checker.add_file(path)
+        checker.check()
+        return checker
+    return setup, lambda checker: checker.check()
+
+
+def grouper_add(n):
+    paths = fake_paths(n)
+
+    def run(grouper):
+        for path in paths:
+            grouper.add_file(path)
+    return lambda: FileGrouper(lambda dirpath, files: None, window=3600), run
+
+
+def grouper_tick(n):
+    # No group is due: the cost paid on every tick while books trickle in
+    def setup():
+        grouper = FileGrouper(lambda dirpath, files: None, window=3600)
+        for path in fake_paths(n):
+            grouper.add_file(path)
+        return grouper
+    return setup, lambda grouper: grouper.check_groups()
+
+
+def grouper_emit(n):
+    # Every group is due: existence checks and callbacks for all n files
+    def setup():
+        grouper = FileGrouper(lambda dirpath, files: None, window=0)
+        for path in fake_paths(n):
+            grouper.add_file(path)
+        return grouper
+    return setup, lambda grouper: grouper.check_groups()
+
+
+def identifier_parse(n):
+    names = fake_names(n)
+    identifier = Identifier()
+
+    def run(ident):
+        for name in names:
+            ident._extract_from_string(name)
+    return lambda: identifier, run
+
+
+def _history_case(n, warm):
+    # The library as groups of GROUP_SIZE files (one calculate_hash call per group)
+    paths = fake_paths(n)
+    groups = [(os.path.dirname(paths[i]), paths[i:i + GROUP_SIZE]) for i in range(0, n, GROUP_SIZE)]
+
+    def setup():
+        history = HistoryManager(":memory:")
+        if warm:
+            for dirpath, files in groups:
+                history.calculate_hash(dirpath, files)
+        return history
+
+    def run(history):
+        for dirpath, files in groups:
+            history.calculate_hash(dirpath, files)
+    return setup, run
+
+
+def history_hash_cold(n):
+    # Not memoized: one stat per file + sha256 per group
+    return _history_case(n, warm=False)
+
+
+def history_hash_warm(n):
+    # Memoized: sort + cache lookup only
+    return _history_case(n, warm=True)
+
+
+CASES = [
+    ("StabilityChecker.add_file", stability_add),
+    ("StabilityChecker.check", stability_tick),
+    ("FileGrouper.add_file", grouper_add),
+    ("FileGrouper.check_groups (idle)", grouper_tick),
+    ("FileGrouper.check_groups (emit)", grouper_emit),
+    ("Identifier._extract_from_string", identifier_parse),
+    ("HistoryManager.calculate_hash (cold)", history_hash_cold),
+    ("HistoryManager.calculate_hash (warm)", history_hash_warm),
+]
+
+
+def measure(case, n, repeat):
+    setup, run = case(n)
+    stat_patch, exists_patch = patched_fs()
+    with stat_patch, exists_patch:
+        best = float("inf")
+        for _ in range(repeat):
+            state = setup()
+            start = time.perf_counter()
+            run(state)
+            best = min(best, time.perf_counter() - start)
+            del state
+
+        # Separate pass: tracemalloc slows allocation-heavy code several-fold
+        tracemalloc.start()
+        state = setup()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run(state)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del state
+
+    return {
+        "items": n,
+        "seconds": round(best, 6),
+        "items_per_sec": round(n / best) if best else None,
+        "peak_kb": round((peak - baseline) / 1024, 1),
+        "retained_kb": round((current - baseline) / 1024, 1),
+    }
+
+
+def main():
+    global GROUP_SIZE
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--group-size", type=int, default=GROUP_SIZE, help="Files per book folder")
+    parser.add_argument("--only", help="Run only cases whose name contains this text")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    GROUP_SIZE = args.group_size
+    logging.disable(logging.CRITICAL)
+    # Nothing becomes stable while the tick is being measured
+    config.STABILITY_CHECK_DURATION = 3600
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    results = {}
+    print(f"{'case':40s} {'items':>8s} {'items/sec':>12s} {'peak KB':>10s} {'retained KB':>12s}")
+    for name, case in CASES:
+        if args.only and args.only not in name:
+            continue
+        for n in sizes:
+            result = measure(case, n, args.repeat)
+            results.setdefault(name, []).append(result)
+            print(f"{name:40s} {n:8d} {result['items_per_sec']:12,d} {result['peak_kb']:10.1f} {result['retained_kb']:12.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
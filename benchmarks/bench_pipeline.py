@@ -0,0 +1,247 @@
+"""
+End-to-end pipeline benchmark.
+
+    python -m benchmarks.bench_pipeline [--books 50] [--files 5] [--archive-format zip] [--latency 0.05] [--error-rate 0]
+                                        [--baseline PATH] [--save-baseline] [--output PATH]
+
+Generates a synthetic library (tagged MP3/M4A files, archives, messy folder
+names), points every metadata provider at a local HTTP stand-in replaying
+recorded responses, and runs AutoLibrarian over it: monitor, stability checks,
+archive extraction, grouping, identification, enrichment and organizing into a
+temporary output directory.
+
+Reports books/minute, per-stage latencies (from the tracing spans) and peak RSS.
+The stability window is 0 and the grouping window short, so the numbers measure
+processing rather than configured waits. With a baseline (by default
+benchmarks/results/baseline.json, written with --save-baseline) the run is
+compared against it and exits non-zero on a regression beyond --tolerance.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+
+from src.config import config
+from src import tracing
+from src.events import event_bus
+from src.tracing import SpanStore
+from benchmarks.provider_stub import ProviderStub
+from benchmarks.synthetic import ARCHIVE_FORMATS, generate_library
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "baseline.json")
+
+# Stage regressions below this many milliseconds are noise, whatever the ratio
+MIN_REGRESSION_MS = 1.0
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[int(round(q * (len(ordered) - 1)))]
+
+
+def stage_latencies(db_path):
+    """Per span name: count and p50/p95/max in milliseconds. Provider calls are split per provider."""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT name, attrs, duration FROM spans").fetchall()
+    finally:
+        conn.close()
+    durations = {}
+    for name, attrs, duration in rows:
+        if name.startswith("provider."):
+            name = f"{name}[{json.loads(attrs or '{}').get('provider')}]"
+        durations.setdefault(name, []).append(duration * 1000)
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 0.5), 3),
+            "p95_ms": round(percentile(values, 0.95), 3),
+            "max_ms": round(max(values), 3),
+        }
+        for name, values in sorted(durations.items())
+    }
+
+
+def drive(app, expected, timeout, tick):
+    """Runs the tick loop until every book is processed or failed. Returns (processed, failed)."""
+    deadline = time.monotonic() + timeout
+    last_event = event_bus.last_id
+    failed = set()
+    processed = 0
+    while time.monotonic() < deadline:
+        app.monitor.tick()
+        app.ingestion.tick()
+        events, _ = event_bus.since(last_event)
+        if events:
+            last_event = events[-1].id
+        failed.update(e.data["path"] for e in events if e.type == "progress" and e.data.get("stage") == "failed")
+        processed = app.history.count_by_status("processed")
+        if processed + len(failed) >= expected:
+            break
+        time.sleep(tick)
+    return processed, len(failed)
+
+
+def run(args):
+    # Imported here so logging can be silenced before AutoLibrarian configures it
+    from src.main import AutoLibrarian
+
+    with tempfile.TemporaryDirectory(prefix="abs-bench-") as tmp:
+        input_dir = os.path.join(tmp, "input")
+        library = generate_library(input_dir, args.books, args.files, archive_ratio=args.archives, seed=args.seed,
+                                   archive_format=args.archive_format)
+
+        stub = ProviderStub(latency=args.latency, jitter=args.latency / 4, error_rate=args.error_rate, seed=args.seed)
+        stub.start()
+        for key, value in stub.urls().items():
+            setattr(config, key, value)
+        config.INPUT_DIR = input_dir
+        config.OUTPUT_DIR = os.path.join(tmp, "output")
+        config.STABILITY_CHECK_DURATION = 0
+        config.WEB_UI_ENABLED = False
+        config.DRY_RUN = False
+        config.CONVERT_TO_M4B = args.convert
+        config.METADATA_PROVIDERS = ["openlibrary", "googlebooks", "audible"]
+        if hasattr(os, "getuid"):
+            config.PUID, config.PGID = os.getuid(), os.getgid()
+
+        traces_db = os.path.join(tmp, "traces.db")
+        tracing.store = SpanStore(traces_db, max_spans=10_000_000)
+        app = AutoLibrarian(history_path=os.path.join(tmp, "history.db"))
+        app.ingestion.grouper.window = args.group_window
+
+        start = time.perf_counter()
+        app.monitor.start()
+        try:
+            processed, failed = drive(app, len(library), args.timeout, args.tick)
+            extract_throughput = app.ingestion.get_stats()["extract_mb_per_second"]
+            # Organizing runs on the worker pool; wait for the stragglers
+            app.executor.shutdown(wait=True)
+            elapsed = time.perf_counter() - start
+        finally:
+            app.monitor.stop()
+            app.history.close()
+            tracing.store.close()
+            stub.stop()
+
+        return {
+            "params": {
+                "books": args.books, "files": args.files, "archives": args.archives, "latency": args.latency,
+                "error_rate": args.error_rate, "group_window": args.group_window, "convert": args.convert,
+                "seed": args.seed, "archive_format": args.archive_format,
+            },
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "processed": processed,
+            "failed": failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "books_per_minute": round(processed / elapsed * 60, 2) if elapsed else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stage_latencies(traces_db),
+            "provider_requests": stub.get_stats(),
+            "extract_mb_per_second": extract_throughput,
+        }
+
+
+def compare(result, baseline, tolerance):
+    """Returns human-readable regressions of result against baseline."""
+    regressions = []
+    if result["books_per_minute"] < baseline["books_per_minute"] * (1 - tolerance):
+        regressions.append(f"throughput {result['books_per_minute']} books/min "
+                           f"(baseline {baseline['books_per_minute']})")
+    if result["peak_rss_mb"] and baseline.get("peak_rss_mb") and \
+            result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(f"peak RSS {result['peak_rss_mb']} MB (baseline {baseline['peak_rss_mb']} MB)")
+    for stage, before in baseline.get("stages", {}).items():
+        after = result["stages"].get(stage)
+        if not after:
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance) and after["p95_ms"] - before["p95_ms"] > MIN_REGRESSION_MS:
+            regressions.append(f"{stage} p95 {after['p95_ms']} ms (baseline {before['p95_ms']} ms)")
+    return regressions
+
+
+def report(result):
+    print(f"Books: {result['processed']} processed, {result['failed']} failed "
+          f"in {result['elapsed_seconds']}s -> {result['books_per_minute']} books/minute")
+    print(f"Peak RSS: {result['peak_rss_mb']} MB")
+    print(f"Provider requests: {result['provider_requests']['requests']} errors: {result['provider_requests']['errors']}")
+    if result["extract_mb_per_second"]:
+        print(f"Archive extraction MB/s: {result['extract_mb_per_second']}")
+    print(f"{'stage':45s} {'count':>7s} {'p50 ms':>10s} {'p95 ms':>10s} {'max ms':>10s}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:45s} {stats['count']:7d} {stats['p50_ms']:10.2f} {stats['p95_ms']:10.2f} {stats['max_ms']:10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--files", type=int, default=5, help="Audio files per book")
+    parser.add_argument("--archives", type=float, default=0.1, help="Fraction of books delivered as archives")
+    parser.add_argument("--archive-format", choices=sorted(ARCHIVE_FORMATS), default="zip")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean provider latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of provider requests answered with 503")
+    parser.add_argument("--group-window", type=float, default=1.0, help="FileGrouper quiet window in seconds")
+    parser.add_argument("--convert", action="store_true", help="Merge to M4B with ffmpeg instead of copying")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tick", type=float, default=0.1, help="Seconds between monitor/ingestion ticks")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application log")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    result = run(args)
+    report(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("params") != result["params"]:
+        print(f"Not comparing: the baseline was recorded with different parameters {baseline.get('params')}")
+        return
+    regressions = compare(result, baseline, args.tolerance)
+    if result["processed"] < baseline.get("processed", 0):
+        regressions.append(f"only {result['processed']} books processed (baseline {baseline['processed']})")
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No regressions against baseline (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Local HTTP stand-in for the metadata providers.
+
+Replays the recorded OpenLibrary, Google Books, Audible and Audnexus responses
+in benchmarks/fixtures with a configurable latency and error rate. The recorded
+book's title, author and identifiers are rewritten from the query so every
+synthetic book gets a plausible, distinct match.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Title and author of the recorded responses
+RECORDED_TITLE = "The Martian"
+RECORDED_AUTHOR = "Andy Weir"
+
+ASIN_RE = re.compile(r"\bB0[0-9A-Z]{8}\b")
+ISBN_RE = re.compile(r"\b(97[89])?\d{9}[\dX]\b")
+
+# Tiny JPEG payload served for every cover URL
+COVER_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f"
+    "141d1a1f1e1d1a1c1c20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b08000100010101"
+    "1100ffc4001f0000010501010101010100000000000000000102030405060708090a0bffc400b5100002010303020403050504"
+    "040000017d01020300041105122131410613516107227114328191a1082342b1c11552d1f02433627282090a161718191a25"
+    "262728292a3435363738393a434445464748494a535455565758595a636465666768696a737475767778797a838485868788"
+    "898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3"
+    "e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda0008010100003f00fbd3ffd9"
+)
+
+
+def _load(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _digest(*parts):
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ProviderStub:
+    """
+    ThreadingHTTPServer on 127.0.0.1 serving:
+
+        /openlibrary/search.json              (OPENLIBRARY_URL)
+        /googlebooks/volumes                  (GOOGLE_BOOKS_URL)
+        /audible/catalog/products[/<asin>]    (AUDIBLE_API_URL)
+        /audnexus/books/<asin>                (AUDNEXUS_URL)
+        /covers/<name>.jpg
+
+    Each request sleeps for a gauss(latency, jitter) delay and fails with a
+    503 with probability error_rate. Seeded, so runs are repeatable.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.requests = {}
+        self.errors = {}
+        self.fixtures = {
+            "openlibrary": _load("openlibrary_search.json"),
+            "googlebooks": _load("googlebooks_volumes.json"),
+            "audible_search": _load("audible_products.json"),
+            "audible_product": _load("audible_product.json"),
+            "audnexus": _load("audnexus_book.json"),
+        }
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self):
+        """Config overrides pointing every provider at this server."""
+        base = self.base_url
+        return {
+            "OPENLIBRARY_URL": f"{base}/openlibrary",
+            "GOOGLE_BOOKS_URL": f"{base}/googlebooks",
+            "AUDIBLE_API_URL": f"{base}/audible",
+            "AUDNEXUS_URL": f"{base}/audnexus",
+        }
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="provider-stub", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def get_stats(self):
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+    def _handle(self, handler):
+        url = urlparse(handler.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split("/") if p]
+        provider = parts[0] if parts else ""
+
+        with self._lock:
+            self.requests[provider] = self.requests.get(provider, 0) + 1
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter)) if self.latency else 0.0
+            failed = provider != "covers" and self._random.random() < self.error_rate
+            if failed:
+                self.errors[provider] = self.errors.get(provider, 0) + 1
+        if delay:
+            time.sleep(delay)
+
+        if failed:
+            return self._send(handler, 503, b'{"error": "Service Unavailable"}')
+        if provider == "covers":
+            return self._send(handler, 200, COVER_JPEG, "image/jpeg")
+
+        body = self._route(provider, parts[1:], params)
+        if body is None:
+            return self._send(handler, 404, b'{"error": "Not Found"}')
+        return self._send(handler, 200, json.dumps(body).encode("utf-8"))
+
+    def _route(self, provider, path, params):
+        if provider == "openlibrary" and path == ["search.json"]:
+            return self._render("openlibrary", params.get("q", ""), params.get("author"))
+        if provider == "googlebooks" and path == ["volumes"]:
+            title, _, author = params.get("q", "").partition("+inauthor:")
+            return self._render("googlebooks", title, author or None)
+        if provider == "audible" and path[:2] == ["catalog", "products"]:
+            if len(path) == 3:
+                return self._render("audible_product", None, None, asin=path[2])
+            # Audible gets "title author" in one field; the recorded author is kept
+            return self._render("audible_search", params.get("title", ""), None)
+        if provider == "audnexus" and len(path) == 2 and path[0] == "books":
+            return self._render("audnexus", None, None, asin=path[1])
+        return None
+
+    def _render(self, fixture, title, author, asin=None):
+        # Rewrites the recorded book as the queried one, with identifiers derived
+        # from the query so distinct books never share an ASIN or ISBN
+        def rewrite(value):
+            if isinstance(value, dict):
+                return {k: rewrite(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [rewrite(v) for v in value]
+            if not isinstance(value, str):
+                return value
+            if title:
+                value = value.replace(RECORDED_TITLE, title)
+            if author:
+                value = value.replace(RECORDED_AUTHOR, author)
+            value = ASIN_RE.sub(lambda m: asin or ("B0" + _digest(title or "", m.group())[:8].upper()), value)
+            value = ISBN_RE.sub(lambda m: "978" + str(int(_digest(title or "", m.group()), 16))[:10], value)
+            return value.replace("{base}", self.base_url)
+
+        return rewrite(self.fixtures[fixture])
+
+    def _send(self, handler, status, body, content_type="application/json"):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
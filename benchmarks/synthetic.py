@@ -0,0 +1,161 @@
+"""
+Synthetic audiobook library generator.
+
+Books are folders of tiny but valid MP3/M4A files (a few silent frames, so
+mutagen parses them) with the folder names, tag coverage and zip archives seen
+in real download folders. Generation is seeded, so a given set of arguments
+always produces the same library.
+"""
+import os
+import random
+import struct
+import tarfile
+import zipfile
+from typing import Dict, List
+
+from mutagen.id3 import ID3, TALB, TIT2, TPE1, TXXX
+from mutagen.mp4 import MP4
+
+FIRST_NAMES = ["Andy", "Frank", "Ursula", "Becky", "Pierce", "Martha", "Brandon", "Naomi", "Terry", "Octavia",
+               "Neal", "Ann", "Iain", "Lois", "Dennis", "Ada", "Hugh", "Nnedi", "Kim", "Arkady"]
+LAST_NAMES = ["Weir", "Herbert", "Le Guin", "Chambers", "Brown", "Wells", "Sanderson", "Novik", "Pratchett",
+              "Butler", "Stephenson", "Leckie", "Banks", "Bujold", "Taylor", "Palmer", "Howey", "Okorafor",
+              "Robinson", "Martine"]
+TITLE_WORDS = ["Silent", "Iron", "Last", "Hidden", "Broken", "Red", "Glass", "Hollow", "Burning", "Distant",
+               "Winter", "Star", "Empire", "River", "Machine", "Garden", "Memory", "Shadow", "Crown", "Signal",
+               "Harbor", "Tide", "Orbit", "Lantern", "Archive", "Storm", "Ember", "Station", "Forest", "Echo"]
+
+# One MPEG-1 Layer III frame (128 kbps, 44.1 kHz) of silence
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+MP3_FRAMES = 8
+
+
+def _atom(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+def _m4a_template() -> bytes:
+    # ftyp + moov with a single sound track; enough for mutagen to read and tag
+    mvhd = _atom(b"mvhd", b"\x00" * 12 + struct.pack(">II", 1000, 1000) + b"\x00" * 80)
+    mdhd = _atom(b"mdhd", b"\x00" * 12 + struct.pack(">II", 44100, 44100) + b"\x00" * 4)
+    hdlr = _atom(b"hdlr", b"\x00" * 8 + b"soun" + b"\x00" * 13)
+    trak = _atom(b"trak", _atom(b"mdia", mdhd + hdlr))
+    return _atom(b"ftyp", b"M4A \x00\x00\x00\x00M4A mp42isom") + _atom(b"moov", mvhd + trak) + _atom(b"mdat", b"\x00" * 256)
+
+
+M4A_TEMPLATE = _m4a_template()
+
+
+def write_mp3(path, title=None, author=None, album=None, asin=None):
+    with open(path, "wb") as f:
+        f.write(MP3_FRAME * MP3_FRAMES)
+    if title or author:
+        tags = ID3()
+        if title:
+            tags.add(TIT2(encoding=3, text=title))
+        if author:
+            tags.add(TPE1(encoding=3, text=author))
+        if album:
+            tags.add(TALB(encoding=3, text=album))
+        if asin:
+            tags.add(TXXX(encoding=3, desc="ASIN", text=asin))
+        tags.save(path)
+
+
+def write_m4a(path, title=None, author=None, album=None, asin=None):
+    with open(path, "wb") as f:
+        f.write(M4A_TEMPLATE)
+    if title or author:
+        audio = MP4(path)
+        if title:
+            audio["\xa9nam"] = [title]
+        if author:
+            audio["\xa9ART"] = [author]
+        if album:
+            audio["\xa9alb"] = [album]
+        if asin:
+            audio["----:com.apple.iTunes:ASIN"] = [asin.encode("utf-8")]
+        audio.save()
+
+
+def _folder_name(rng, title, author, year):
+    # Naming styles seen in the wild; all of them go through Identifier._extract_from_string
+    style = rng.randrange(5)
+    if style == 0:
+        return f"{author} - {title}"
+    if style == 1:
+        return f"{author} - {title} [{year}] (Unabridged)"
+    if style == 2:
+        return f"{author} - {title} [MP3] 64kbps"
+    if style == 3:
+        return f"{title} (Audiobook)"
+    return f"{title.replace(' ', '_')}_128kbps"
+
+
+# Archive formats generate_library can write -> tarfile mode (None for zip)
+ARCHIVE_FORMATS = {"zip": None, "tar": "w", "tar.gz": "w:gz", "tar.bz2": "w:bz2", "tar.xz": "w:xz"}
+
+
+def generate_library(root: str, books: int, files_per_book: int = 5, archive_ratio: float = 0.1,
+                     tagged_ratio: float = 0.7, m4a_ratio: float = 0.3, seed: int = 0,
+                     archive_format: str = "zip") -> List[Dict]:
+    """
+    Writes `books` book folders (or archives of them, in archive_format) under root
+    and returns one entry per book: {"name", "title", "author", "files", "archive", "tagged"}.
+    """
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    library = []
+    used = set()
+
+    for n in range(books):
+        title = " ".join(rng.sample(TITLE_WORDS, rng.choice((2, 3))))
+        if title in used:
+            # Folder names must be unique; large libraries run out of word combinations
+            title = f"{title} {n}"
+        used.add(title)
+        author = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        year = str(rng.randint(1960, 2024))
+        name = _folder_name(rng, title, author, year)
+        tagged = rng.random() < tagged_ratio
+        asin = f"B0{rng.randrange(16 ** 8):08X}" if tagged and rng.random() < 0.3 else None
+        ext = ".m4a" if rng.random() < m4a_ratio else ".mp3"
+        archive = rng.random() < archive_ratio
+
+        book_dir = os.path.join(root, name)
+        os.makedirs(book_dir)
+        files = []
+        for i in range(files_per_book):
+            filename = rng.choice((f"{i + 1:02d} - Chapter {i + 1}{ext}", f"Track{i + 1:02d}{ext}",
+                                   f"{title} - Part {i + 1}{ext}"))
+            path = os.path.join(book_dir, filename)
+            writer = write_m4a if ext == ".m4a" else write_mp3
+            if tagged:
+                writer(path, title=title, author=author, album=title, asin=asin)
+            else:
+                writer(path)
+            files.append(path)
+        if rng.random() < 0.2:
+            cover = os.path.join(book_dir, "cover.jpg")
+            with open(cover, "wb") as f:
+                f.write(b"\xff\xd8\xff\xe0" + bytes(rng.getrandbits(8) for _ in range(512)) + b"\xff\xd9")
+            files.append(cover)
+
+        if archive:
+            # Packed flat, as most releases are; IngestionManager extracts it to <name>/
+            archive_path = os.path.join(root, f"{name}.{archive_format}")
+            if ARCHIVE_FORMATS[archive_format] is None:
+                with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as zf:
+                    for path in files:
+                        zf.write(path, os.path.basename(path))
+            else:
+                with tarfile.open(archive_path, ARCHIVE_FORMATS[archive_format]) as tf:
+                    for path in files:
+                        tf.add(path, os.path.basename(path))
+            for path in files:
+                os.remove(path)
+            os.rmdir(book_dir)
+
+        library.append({"name": name, "title": title, "author": author, "files": len(files),
+                        "archive": archive, "tagged": tagged})
+    return library
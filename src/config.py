@@ -20,13 +20,45 @@ class Settings(BaseSettings):
     
     # Operations
     DRY_RUN: bool = False
+    COPY_WORKERS: int = 4
+    TAG_WORKERS: int = 4
+    EXTRACT_WORKERS: int = 2
+    EXTRACT_MEMBER_WORKERS: int = 4
+    EXTRACT_MAX_SIZE_MB: int = 51200 # 0 disables the limit
+    ALLOW_HARDLINKS: bool = False
+    # Extra staging roots for destinations on other devices (bind mounts, subvolumes)
+    STAGING_DIRS: List[str] | str = []
     
     METADATA_PROVIDERS: List[str] | str = ["openlibrary", "googlebooks", "audible"]
+    SEARCH_DEADLINE: float = 8.0
+    OPENLIBRARY_URL: str = "https://openlibrary.org"
+    GOOGLE_BOOKS_URL: str = "https://www.googleapis.com/books/v1"
+    AUDIBLE_API_URL: str = "https://api.audible.com/1.0"
     
+    # History database
+    HISTORY_WRITE_BEHIND: bool = False
+    HISTORY_FLUSH_INTERVAL: float = 0.5
+    HASH_CACHE_TTL: int = 600
+    CONTENT_FINGERPRINTS: bool = False
+    HISTORY_RETENTION_DAYS: int = 30
+    HISTORY_MAINTENANCE_INTERVAL: int = 3600
+
     # Web UI
     WEB_UI_ENABLED: bool = True
     WEB_PORT: int = 3000
     API_PORT: int = 8000
+    EVENT_BUFFER_SIZE: int = 1000
+    STATUS_PUSH_INTERVAL: int = 2
+    JOB_WORKERS: int = 2
+    JOB_QUEUE_MAX: int = 5000
+
+    # Tracing (per-book spans in traces.db)
+    TRACING_ENABLED: bool = True
+    TRACE_MAX_SPANS: int = 100000
+
+    # On-demand profiling via /api/admin/profile (empty dir -> ./profiles)
+    PROFILING_ENABLED: bool = False
+    PROFILE_DIR: str = ""
     
     # Conversion
     CONVERT_TO_M4B: bool = True
@@ -34,6 +66,19 @@ class Settings(BaseSettings):
     FFMPEG_HW_ACCEL: str = "auto"
     AUDNEXUS_URL: str = "https://api.audnexus.com"
 
+    # Cover Art Cache (empty dir -> OUTPUT_DIR/.cache/covers)
+    COVER_CACHE_DIR: str = ""
+    COVER_MAX_BYTES: int = 10 * 1024 * 1024
+    COVER_CACHE_TTL: int = 86400
+    COVER_CACHE_MAX_MB: int = 512
+
+    @field_validator("STAGING_DIRS", mode="before")
+    @classmethod
+    def parse_staging_dirs(cls, v):
+        if isinstance(v, str):
+            return [p.strip() for p in v.split(",") if p.strip()]
+        return v
+
     @field_validator("METADATA_PROVIDERS", mode="before")
     @classmethod
     def parse_providers(cls, v):
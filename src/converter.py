@@ -5,6 +5,8 @@ from mutagen.mp3 import MP3
 from mutagen.mp4 import MP4
 from mutagen.flac import FLAC
 from src.config import config
+from src import permissions
+from src import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +45,8 @@ class AudioConverter:
         # 4. Run FFMPEG
         # Command: ffmpeg -f concat -safe 0 -i files.txt -i ffmetadata.txt -map_metadata 1 -c:a aac -b:a 128k -vn output.m4b
         # -map_metadata 1 tells ffmpeg to use the global metadata from the second input (ffmetadata.txt)
+        # No -movflags +faststart: with moov after mdat, tagging only rewrites the trailing moov
+        # atom and the audio never moves, so the output needs no reserved free atom
         
         cmd = [
             self.ffmpeg_path,
@@ -62,8 +66,12 @@ class AudioConverter:
         
         try:
             # Run ffmpeg (blocking for now - parallel processing handled at book level)
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            with metrics.convert_seconds.time():
+                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            metrics.convert_bytes_total.inc(os.path.getsize(output_path))
             logger.info("Conversion complete.")
+            # Written by ffmpeg, so ownership can only be applied by path
+            permissions.apply_to_path(output_path, permissions.FILE_MODE)
             
             # Cleanup temp files
             if os.path.exists(list_file_path):
@@ -0,0 +1,221 @@
+import os
+import errno
+import shutil
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.config import config
+from src import permissions
+from src import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ioctl request number for FICLONE (Linux, Btrfs/XFS/OCFS2/bcachefs)
+FICLONE = 0x40049409
+# Chunk size for kernel-side copies (copy_file_range / sendfile)
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Errors that mean "this strategy is not available here", not "the copy failed"
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL,
+    errno.ENOSYS, errno.EPERM, errno.EBADF, errno.ETXTBSY,
+}
+if hasattr(errno, "ENOTSUP"):
+    _UNSUPPORTED_ERRNOS.add(errno.ENOTSUP)
+
+
+class CopyStats:
+    """Thread-safe per-strategy counters shared by every CopyEngine."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, strategy, nbytes, seconds):
+        with self._lock:
+            entry = self._stats.setdefault(strategy, {"files": 0, "bytes": 0, "seconds": 0.0})
+            entry["files"] += 1
+            entry["bytes"] += nbytes
+            entry["seconds"] += seconds
+
+    def get_stats(self):
+        with self._lock:
+            result = {}
+            for strategy, entry in self._stats.items():
+                seconds = entry["seconds"]
+                result[strategy] = {
+                    "files": entry["files"],
+                    "bytes": entry["bytes"],
+                    "bytes_per_sec": int(entry["bytes"] / seconds) if seconds > 0 else None,
+                }
+            return {"copy_stats": result}
+
+
+copy_stats = CopyStats()
+
+
+class CopyEngine:
+    """
+    Copies files into staging using the cheapest strategy the filesystem supports:
+    reflink (FICLONE) -> hardlink (if allowed) -> copy_file_range/sendfile -> shutil.copy2.
+    """
+
+    STRATEGIES = ("reflink", "hardlink", "copy_file_range", "sendfile", "copy")
+
+    def __init__(self, max_workers=None, allow_hardlinks=None, stats=None):
+        self.max_workers = max_workers or config.COPY_WORKERS
+        self.allow_hardlinks = config.ALLOW_HARDLINKS if allow_hardlinks is None else allow_hardlinks
+        self.stats = stats or copy_stats
+
+    def copy_files(self, jobs):
+        """
+        Copies a list of (src, dst, allow_hardlink[, head]) jobs in parallel.
+        Returns a dict of dst -> strategy used. Raises the first failure.
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return {}
+
+        if len(jobs) == 1 or self.max_workers <= 1:
+            return {job[1]: self.copy_file(*job) for job in jobs}
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+            futures = {job[1]: pool.submit(self.copy_file, *job) for job in jobs}
+            return {dst: future.result() for dst, future in futures.items()}
+
+    def copy_file(self, src, dst, allow_hardlink=True, head=None):
+        """
+        Copies a single file, returning the name of the strategy that succeeded.
+        head = (data, skip) writes data in place of the first skip bytes of src,
+        which rules out reflinks and hardlinks.
+        """
+        size = os.path.getsize(src)
+        start = time.monotonic()
+
+        strategy = None
+        if head is not None:
+            strategy = self._copy_with_head(src, dst, *head)
+        elif self._try_reflink(src, dst):
+            strategy = "reflink"
+        elif allow_hardlink and self.allow_hardlinks and self._try_hardlink(src, dst):
+            # Shares the source inode, so ownership and mode are left alone
+            strategy = "hardlink"
+        else:
+            strategy = self._try_kernel_copy(src, dst)
+            if strategy is None:
+                shutil.copy2(src, dst)
+                permissions.apply_to_path(dst, permissions.FILE_MODE)
+                strategy = "copy"
+
+        elapsed = time.monotonic() - start
+        self.stats.record(strategy, size, elapsed)
+        metrics.copy_bytes_total.inc(size, strategy=strategy)
+        logger.debug(f"Copied {src} -> {dst} via {strategy} ({size} bytes in {elapsed:.3f}s)")
+        return strategy
+
+    def _copy_with_head(self, src, dst, data, skip):
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fdst.write(data)
+            fdst.flush()
+            in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+            strategy = "copy"
+            if hasattr(os, "copy_file_range"):
+                try:
+                    offset = skip
+                    while True:
+                        written = os.copy_file_range(in_fd, out_fd, CHUNK_SIZE, offset)
+                        if written == 0:
+                            break
+                        offset += written
+                    if offset < os.fstat(in_fd).st_size:
+                        raise OSError(errno.EINVAL, "copy_file_range copied nothing")
+                    strategy = "copy_file_range"
+                except OSError as e:
+                    if e.errno not in _UNSUPPORTED_ERRNOS:
+                        raise
+                    fdst.seek(len(data))
+                    fdst.truncate()
+            if strategy == "copy":
+                fsrc.seek(skip)
+                shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+                fdst.flush()
+            self._finish(in_fd, out_fd, dst)
+        return strategy
+
+    def _try_reflink(self, src, dst):
+        if fcntl is None:
+            return False
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                self._finish(fsrc.fileno(), fdst.fileno(), dst)
+            return True
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS:
+                logger.debug(f"Reflink failed for {src}: {e}")
+            self._discard(dst)
+            return False
+
+    def _try_hardlink(self, src, dst):
+        try:
+            self._discard(dst)
+            os.link(src, dst)
+            return True
+        except OSError as e:
+            logger.debug(f"Hardlink failed for {src}: {e}")
+            return False
+
+    def _try_kernel_copy(self, src, dst):
+        """Copies via copy_file_range, falling back to sendfile. Returns strategy name or None."""
+        for strategy, available in (
+            ("copy_file_range", hasattr(os, "copy_file_range")),
+            ("sendfile", hasattr(os, "sendfile") and os.name == "posix"),
+        ):
+            if not available:
+                continue
+            try:
+                with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+                    offset = 0
+                    while True:
+                        if strategy == "copy_file_range":
+                            written = os.copy_file_range(in_fd, out_fd, CHUNK_SIZE)
+                        else:
+                            written = os.sendfile(out_fd, in_fd, offset, CHUNK_SIZE)
+                        if written == 0:
+                            break
+                        offset += written
+                    self._finish(in_fd, out_fd, dst)
+                # A zero-length result on a non-empty file means the call silently did nothing
+                # (e.g. some FUSE or procfs sources); fall through to the next strategy.
+                if offset == 0 and os.path.getsize(src) > 0:
+                    self._discard(dst)
+                    continue
+                return strategy
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                self._discard(dst)
+        return None
+
+    def _finish(self, in_fd, out_fd, dst):
+        # Preserve timestamps and apply library ownership/mode on the open descriptor
+        src_stat = os.fstat(in_fd)
+        times = (src_stat.st_atime_ns, src_stat.st_mtime_ns)
+        if os.utime in os.supports_fd:
+            os.utime(out_fd, ns=times)
+        else:
+            os.utime(dst, ns=times)
+        permissions.apply_to_fd(out_fd, permissions.FILE_MODE, dst)
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import requests
+from src.config import config
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+# Covers are only ever served as one of these types, whatever the provider sent
+EXTENSION_MEDIA_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp", ".gif": "image/gif"}
+
+# Upper bound on cached URLs, independent of blob sizes
+MAX_INDEX_ENTRIES = 10000
+
+
+class CoverTooLarge(Exception):
+    pass
+
+
+class NotAnImage(Exception):
+    pass
+
+
+class CoverCache:
+    """
+    Content-addressed cache for cover art.
+
+    Images are stored once under blobs/<sha256><ext>; index.json maps each
+    source URL to its blob along with the validators (ETag/Last-Modified) used
+    to revalidate it. Identical images fetched from different URLs share a blob.
+    The cache is capped at COVER_CACHE_MAX_MB; the least recently fetched
+    entries are evicted first. Entries a queued item still points at (pinned)
+    and blobs being served or copied (held) are never evicted.
+    """
+
+    _lock = threading.Lock()
+    # blob name -> number of readers; shared by every instance over the same process
+    _in_use = {}
+
+    def __init__(self, cache_dir=None, pinned=None):
+        self._cache_dir = cache_dir
+        # Callable url -> bool, e.g. QueueManager.has_cover
+        self.pinned = pinned
+
+    @property
+    def cache_dir(self):
+        # Resolved lazily so OUTPUT_DIR overrides (CLI, tests) are honoured
+        return self._cache_dir or config.COVER_CACHE_DIR or os.path.join(config.OUTPUT_DIR, ".cache", "covers")
+
+    @property
+    def blob_dir(self):
+        return os.path.join(self.cache_dir, "blobs")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def _blob_name(entry):
+        return entry["hash"] + entry.get("ext", ".jpg")
+
+    def _blob_path(self, entry):
+        return os.path.join(self.blob_dir, self._blob_name(entry))
+
+    def hold(self, entry):
+        """Keeps entry's blob from being evicted until release() is called with the returned name."""
+        blob = self._blob_name(entry)
+        with self._lock:
+            self._in_use[blob] = self._in_use.get(blob, 0) + 1
+        return blob
+
+    def release(self, blob):
+        with self._lock:
+            count = self._in_use.get(blob, 0) - 1
+            if count > 0:
+                self._in_use[blob] = count
+            else:
+                self._in_use.pop(blob, None)
+
+    def get_cached(self, url):
+        """Returns (path, entry) for a cached URL without touching the network, or (None, None)."""
+        with self._lock:
+            entry = self._load_index().get(url)
+        if entry and os.path.exists(self._blob_path(entry)):
+            return self._blob_path(entry), entry
+        return None, None
+
+    def fetch(self, url):
+        """
+        Returns (path, entry) for the cover at url, downloading or revalidating it
+        as needed. Returns (None, None) if the image cannot be fetched.
+        """
+        path, entry = self.get_cached(url)
+        if path and time.time() - entry.get("checked", 0) < config.COVER_CACHE_TTL:
+            metrics.cache_requests_total.inc(cache="cover", result="hit")
+            return path, entry
+
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            os.makedirs(self.blob_dir, exist_ok=True)
+            with requests.get(url, headers=headers, timeout=10, stream=True) as response:
+                if response.status_code == 304 and path:
+                    logger.debug(f"Cover not modified: {url}")
+                    metrics.cache_requests_total.inc(cache="cover", result="revalidated")
+                    entry["checked"] = time.time()
+                    self._store_entry(url, entry)
+                    return path, entry
+
+                response.raise_for_status()
+                metrics.cache_requests_total.inc(cache="cover", result="miss")
+                digest, ext, size = self._stream_to_blob(response)
+                entry = {
+                    "hash": digest,
+                    "ext": ext,
+                    "size": size,
+                    "content_type": EXTENSION_MEDIA_TYPES[ext],
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "checked": time.time(),
+                }
+                self._store_entry(url, entry)
+                logger.info(f"Cached cover {url} ({size} bytes, {digest[:12]})")
+                return self._blob_path(entry), entry
+        except Exception as e:
+            logger.error(f"Failed to download cover {url}: {e}")
+            # Serve a stale copy rather than nothing
+            if path:
+                metrics.cache_requests_total.inc(cache="cover", result="stale")
+                return path, entry
+            return None, None
+
+    def _stream_to_blob(self, response):
+        max_bytes = config.COVER_MAX_BYTES
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise CoverTooLarge(f"Cover is {declared} bytes (limit {max_bytes})")
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not content_type.startswith("image/"):
+            raise NotAnImage(f"Cover has content type {content_type or 'none'}")
+        ext = CONTENT_TYPE_EXTENSIONS.get(content_type, ".jpg")
+
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise CoverTooLarge(f"Cover exceeds {max_bytes} bytes")
+                    hasher.update(chunk)
+                    f.write(chunk)
+
+            digest = hasher.hexdigest()
+            blob_path = os.path.join(self.blob_dir, digest + ext)
+            if os.path.exists(blob_path):
+                # Same image already cached from another URL
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob_path)
+            return digest, ext, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def media_type(self, entry):
+        return EXTENSION_MEDIA_TYPES.get(entry.get("ext"), "image/jpeg")
+
+    def _store_entry(self, url, entry):
+        with self._lock:
+            index = self._load_index()
+            index[url] = entry
+            self._evict(index, keep=url)
+            self._save_index(index)
+
+    def _evict(self, index, keep=None):
+        # Drops the entries checked longest ago until the cap holds, then the blobs
+        # no remaining entry refers to. The entry just stored (keep), pinned entries
+        # and held blobs are skipped, so the cache may stay over the cap meanwhile.
+        max_bytes = config.COVER_CACHE_MAX_MB * 1024 * 1024
+        blob_sizes = {self._blob_name(entry): entry.get("size", 0) for entry in index.values()}
+        total = sum(blob_sizes.values())
+        if total <= max_bytes and len(index) <= MAX_INDEX_ENTRIES:
+            return
+        refs = {}
+        for entry in index.values():
+            blob = self._blob_name(entry)
+            refs[blob] = refs.get(blob, 0) + 1
+        for url in sorted(index, key=lambda u: index[u].get("checked", 0)):
+            if total <= max_bytes and len(index) <= MAX_INDEX_ENTRIES:
+                break
+            blob = self._blob_name(index[url])
+            if url == keep or blob in self._in_use or (self.pinned and self.pinned(url)):
+                continue
+            del index[url]
+            refs[blob] -= 1
+            if refs[blob] == 0:
+                total -= blob_sizes[blob]
+                try:
+                    os.remove(os.path.join(self.blob_dir, blob))
+                except OSError:
+                    pass
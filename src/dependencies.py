@@ -1,3 +1,8 @@
+import os
 from .queue_manager import QueueManager
+from .jobs import JobQueue
 
 queue_manager = QueueManager()
+
+# Lives next to history.db; workers are started by AutoLibrarian.start()
+job_queue = JobQueue(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobs.db"))
@@ -0,0 +1,93 @@
+import threading
+import uuid
+from collections import deque
+from typing import List, NamedTuple, Optional, Tuple
+from src.config import config
+
+
+class Event(NamedTuple):
+    id: int
+    type: str
+    data: dict
+    key: Optional[str]
+
+
+class EventBus:
+    """
+    In-memory change stream for push clients (/api/events).
+
+    Events get increasing ids and are kept in a bounded ring buffer, so a client
+    that reconnects with its last id receives only what it missed. If that id has
+    already been evicted (or came from a previous process), the client is told to
+    resync instead.
+    """
+
+    def __init__(self, max_events=None):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events or config.EVENT_BUFFER_SIZE)
+        self._last_id = 0
+        self._subscribers = 0
+        # Event ids are only meaningful within one process
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def publish(self, event_type: str, data: dict, key: Optional[str] = None) -> int:
+        with self._lock:
+            self._last_id += 1
+            self._events.append(Event(self._last_id, event_type, data, key))
+            return self._last_id
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def since(self, last_id: int) -> Tuple[List[Event], bool]:
+        """Returns (events after last_id, resync needed)."""
+        with self._lock:
+            if last_id >= self._last_id:
+                return [], last_id > self._last_id
+            oldest = self._events[0].id if self._events else self._last_id + 1
+            if last_id < oldest - 1:
+                return [], True
+            return [e for e in self._events if e.id > last_id], False
+
+    def format_id(self, event_id: int) -> str:
+        return f"{self.epoch}-{event_id}"
+
+    def parse_id(self, value: Optional[str]) -> Optional[int]:
+        """Parses a client's Last-Event-ID. None means it can't be resumed."""
+        if not value:
+            return None
+        epoch, _, number = value.rpartition("-")
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    @staticmethod
+    def coalesce(events: List[Event]) -> List[Event]:
+        """
+        Keeps only the newest event per key. Keyed events carry the full current
+        state (an item, the stats), so a client that fell behind skips straight to it.
+        """
+        latest = {}
+        for event in events:
+            if event.key is not None:
+                latest[event.key] = event.id
+        return [e for e in events if e.key is None or latest[e.key] == e.id]
+
+    def subscribe(self):
+        with self._lock:
+            self._subscribers += 1
+
+    def unsubscribe(self):
+        with self._lock:
+            self._subscribers -= 1
+
+    @property
+    def has_subscribers(self) -> bool:
+        return self._subscribers > 0
+
+    def get_stats(self):
+        return {"event_stream": {"last_id": self._last_id, "buffered": len(self._events), "subscribers": self._subscribers}}
+
+
+event_bus = EventBus()
@@ -1,48 +1,499 @@
-
 import sqlite3
 import json
 import os
 import hashlib
 import time
 import logging
-from typing import List, Optional, Dict, Any
+import threading
+import shutil
+import zlib
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional, Dict, Any, Tuple
+from src import metrics
 
 logger = logging.getLogger(__name__)
 
+# Large JSON columns live in file_history_blobs so status scans and counts
+# never read them; they are joined in only when a caller asks for them.
+UPSERT_SQL = """
+    INSERT INTO file_history (path, content_hash, status, last_updated, fingerprint)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        content_hash = excluded.content_hash,
+        status = excluded.status,
+        last_updated = excluded.last_updated,
+        fingerprint = COALESCE(excluded.fingerprint, file_history.fingerprint)
+"""
+
+UPSERT_BLOBS_SQL = """
+    INSERT INTO file_history_blobs (path, file_list, metadata)
+    VALUES (?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        file_list = COALESCE(excluded.file_list, file_history_blobs.file_list),
+        metadata = COALESCE(excluded.metadata, file_history_blobs.metadata)
+"""
+
+# Upper bound on memoized group hashes (LRU)
+HASH_CACHE_SIZE = 10000
+
+# Seconds /api/status may reuse database size and row counts
+DB_STATS_TTL = 30
+
+# Bytes read from the start, middle and end of each file for content fingerprints
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+STATE_COLUMNS = "h.path, h.content_hash, h.status, h.last_updated, h.fingerprint"
+BLOB_COLUMNS = "b.file_list, b.metadata"
+
+
+def _sample_file(filepath: str, size: int) -> bytes:
+    hasher = hashlib.sha256(str(size).encode('utf-8'))
+    with open(filepath, 'rb') as f:
+        if size <= 3 * FINGERPRINT_BLOCK_SIZE:
+            hasher.update(f.read())
+        else:
+            for offset in (0, size // 2, size - FINGERPRINT_BLOCK_SIZE):
+                f.seek(offset)
+                hasher.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    return hasher.digest()
+
+
+def _migration_base(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_history (
+            path TEXT PRIMARY KEY,
+            content_hash TEXT,
+            status TEXT,
+            last_updated REAL,
+            file_list TEXT,
+            metadata TEXT
+        )
+    """)
+
+
+def _migration_split_blobs(conn):
+    conn.execute("""
+        CREATE TABLE file_history_blobs (
+            path TEXT PRIMARY KEY,
+            file_list TEXT,
+            metadata TEXT
+        )
+    """)
+    conn.execute("""
+        INSERT INTO file_history_blobs (path, file_list, metadata)
+        SELECT path, file_list, metadata FROM file_history
+        WHERE file_list IS NOT NULL OR metadata IS NOT NULL
+    """)
+    # Rebuild without the JSON columns (DROP COLUMN needs SQLite 3.35+)
+    conn.execute("""
+        CREATE TABLE file_history_new (
+            path TEXT PRIMARY KEY,
+            content_hash TEXT,
+            status TEXT,
+            last_updated REAL
+        )
+    """)
+    conn.execute("""
+        INSERT INTO file_history_new (path, content_hash, status, last_updated)
+        SELECT path, content_hash, status, last_updated FROM file_history
+    """)
+    conn.execute("DROP TABLE file_history")
+    conn.execute("ALTER TABLE file_history_new RENAME TO file_history")
+
+
+def _migration_indexes(conn):
+    # (status, path) serves both status filters and keyset pagination by path
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_history_status ON file_history (status, path)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_history_last_updated ON file_history (last_updated)")
+
+
+def _migration_fingerprints(conn):
+    conn.execute("ALTER TABLE file_history ADD COLUMN fingerprint TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_history_fingerprint ON file_history (fingerprint)")
+
+
+def _migration_archive(conn):
+    # Cold tier for old processed/ignored rows; JSON is zlib-compressed into one blob
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_history_archive (
+            path TEXT PRIMARY KEY,
+            content_hash TEXT,
+            status TEXT,
+            last_updated REAL,
+            fingerprint TEXT,
+            archived_at REAL,
+            data BLOB
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_history_archive_hash ON file_history_archive (content_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_history_archive_fingerprint ON file_history_archive (fingerprint)")
+
+
+def _migration_pending_groups(conn):
+    # Book groups still waiting in the FileGrouper, so a restart doesn't lose them
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pending_groups (
+            path TEXT PRIMARY KEY,
+            files TEXT,
+            created REAL,
+            last_update REAL
+        )
+    """)
+
+
+def _migration_library_index(conn):
+    # Source directory -> library folder it was last published to
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS library_index (
+            source_dir TEXT PRIMARY KEY,
+            book_dir TEXT
+        )
+    """)
+
+
+# Applied in order; PRAGMA user_version records how many have run.
+# Append new migrations, never reorder or edit released ones.
+MIGRATIONS = [
+    _migration_base,
+    _migration_split_blobs,
+    _migration_indexes,
+    _migration_fingerprints,
+    _migration_archive,
+    _migration_pending_groups,
+    _migration_library_index,
+]
+
+# Statuses eligible for archival; pending/error rows always stay hot
+ARCHIVE_STATUSES = ('processed', 'ignored')
+
 class HistoryManager:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, write_behind: bool = False, flush_interval: float = 0.5,
+                 hash_cache_ttl: float = 600):
         self.db_path = db_path
+        # One connection per thread; sqlite3 caches prepared statements per connection
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        # Optional write-behind batching: updates are coalesced per path and
+        # flushed in a single transaction every flush_interval seconds
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._closed = False
+        self._flusher = None
+
+        # Memoized group hashes: (dirpath, sorted files) -> (digest, computed_at),
+        # plus a reverse index so a single file event can invalidate its groups
+        self.hash_cache_ttl = hash_cache_ttl
+        self._hash_cache: "OrderedDict[tuple, Tuple[str, float]]" = OrderedDict()
+        self._hash_index: Dict[str, set] = {}
+        self._hash_lock = threading.Lock()
+        self._hash_generation = 0
+        self._hash_hits = 0
+        self._hash_misses = 0
+        self._db_stats = None
+        # (path, size, mtime_ns) -> sampled file digest
+        self._fingerprint_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+
         self._init_db()
 
+        if self.write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, name="HistoryWriter", daemon=True)
+            self._flusher.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, cached_statements=64)
+            conn.row_factory = sqlite3.Row
+            # Takes effect on a new file only (before WAL is set); run_maintenance converts older ones
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
     def _init_db(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS file_history (
-                        path TEXT PRIMARY KEY,
-                        content_hash TEXT,
-                        status TEXT,
-                        last_updated REAL,
-                        file_list TEXT,
-                        metadata TEXT
-                    )
-                """)
-                conn.commit()
+            conn = self._connect()
+            self._migrate(conn)
         except Exception as e:
             logger.error(f"Failed to initialize history database: {e}")
 
+    def _enable_incremental_vacuum(self, conn):
+        # auto_vacuum can only be switched on an existing database by a full VACUUM,
+        # which rewrites the file; done once, and only with room for the copy
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        size = os.path.getsize(self.db_path)
+        free = shutil.disk_usage(os.path.dirname(os.path.abspath(self.db_path))).free
+        if free < 2 * size:
+            logger.warning(f"Not enabling incremental vacuum: {free} bytes free, need {2 * size}")
+            return
+        logger.info(f"Enabling incremental vacuum on history database ({size} bytes)")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+    def _migrate(self, conn):
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            # Each migration and its version bump commit atomically; the version is
+            # re-read under the write lock in case another process migrated first
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+                    conn.rollback()
+                    continue
+                logger.info(f"Applying history database migration {number} ({migration.__name__})")
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def schema_version(self) -> int:
+        return self._connect().execute("PRAGMA user_version").fetchone()[0]
+
     def calculate_hash(self, dirpath: str, files: List[str]) -> str:
         """
         Calculates a hash based on the file paths (relative to dirpath), sizes, and mtimes.
+        Results are memoized per file set until a monitor event touches one of the
+        files (see invalidate_path) or the entry is older than hash_cache_ttl.
         """
-        hasher = hashlib.sha256()
         # Sort files to ensure deterministic hash
-        sorted_files = sorted(files)
-        
-        for filepath in sorted_files:
+        sorted_files = tuple(sorted(files))
+        key = (dirpath, sorted_files)
+        now = time.monotonic()
+
+        with self._hash_lock:
+            cached = self._hash_cache.get(key)
+            if cached and now - cached[1] < self.hash_cache_ttl:
+                self._hash_cache.move_to_end(key)
+                self._hash_hits += 1
+                metrics.cache_requests_total.inc(cache="content_hash", result="hit")
+                return cached[0]
+            self._hash_misses += 1
+            metrics.cache_requests_total.inc(cache="content_hash", result="miss")
+            generation = self._hash_generation
+
+        digest = self._compute_hash(dirpath, sorted_files)
+
+        with self._hash_lock:
+            # Don't cache a result that raced with an invalidation
+            if generation == self._hash_generation:
+                self._hash_cache[key] = (digest, now)
+                self._hash_cache.move_to_end(key)
+                for filepath in sorted_files:
+                    self._hash_index.setdefault(filepath, set()).add(key)
+                while len(self._hash_cache) > HASH_CACHE_SIZE:
+                    old_key, _ = self._hash_cache.popitem(last=False)
+                    self._unindex(old_key)
+        return digest
+
+    def invalidate_path(self, path: str, is_directory: bool = False):
+        """Drops cached hashes for any group containing path (or anything under it, for directories)."""
+        with self._hash_lock:
+            self._hash_generation += 1
+            keys = set(self._hash_index.get(path, ()))
+            if is_directory:
+                prefix = path.rstrip(os.sep) + os.sep
+                keys.update(k for k in self._hash_cache if k[0] == path or k[0].startswith(prefix))
+            for key in keys:
+                self._hash_cache.pop(key, None)
+                self._unindex(key)
+
+    def _unindex(self, key):
+        for filepath in key[1]:
+            keys = self._hash_index.get(filepath)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._hash_index[filepath]
+
+    def calculate_fingerprint(self, files: List[str]) -> Optional[str]:
+        """
+        Path-independent content fingerprint: per file, size plus sampled head,
+        middle and tail blocks; the group digest is over the sorted file digests,
+        so renaming the folder or its files leaves it unchanged.
+        """
+        digests = []
+        for filepath in files:
             try:
-                if not os.path.exists(filepath):
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            cache_key = (filepath, stat.st_size, stat.st_mtime_ns)
+            with self._hash_lock:
+                digest = self._fingerprint_cache.get(cache_key)
+            if digest is None:
+                try:
+                    digest = _sample_file(filepath, stat.st_size)
+                except OSError:
                     continue
+                with self._hash_lock:
+                    self._fingerprint_cache[cache_key] = digest
+                    while len(self._fingerprint_cache) > HASH_CACHE_SIZE:
+                        self._fingerprint_cache.popitem(last=False)
+            digests.append(digest)
+
+        if not digests:
+            return None
+        hasher = hashlib.sha256()
+        for digest in sorted(digests):
+            hasher.update(digest)
+        return hasher.hexdigest()
+
+    def find_by_fingerprint(self, fingerprint: str, exclude_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Most recently updated row (with blobs) whose content fingerprint matches."""
+        if not fingerprint:
+            return None
+        self.flush()
+        try:
+            row = self._connect().execute(f"""
+                SELECT {STATE_COLUMNS}, {BLOB_COLUMNS}
+                FROM file_history h LEFT JOIN file_history_blobs b ON b.path = h.path
+                WHERE h.fingerprint = ? AND h.path != ?
+                ORDER BY h.last_updated DESC
+                LIMIT 1
+            """, (fingerprint, exclude_path or "")).fetchone()
+            if row:
+                return dict(row)
+            row = self._connect().execute("""
+                SELECT * FROM file_history_archive
+                WHERE fingerprint = ? AND path != ?
+                ORDER BY last_updated DESC
+                LIMIT 1
+            """, (fingerprint, exclude_path or "")).fetchone()
+            return self._unpack_archived(row) if row else None
+        except Exception as e:
+            logger.error(f"Error looking up fingerprint {fingerprint}: {e}")
+            return None
+
+    def get_stats(self):
+        with self._hash_lock:
+            stats = {
+                "hash_cache_entries": len(self._hash_cache),
+                "hash_cache_hits": self._hash_hits,
+                "hash_cache_misses": self._hash_misses,
+            }
+        stats["history_db"] = self.get_db_stats()
+        return stats
+
+    def _get_archived(self, path: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM file_history_archive WHERE path = ?", (path,)).fetchone()
+        return self._unpack_archived(row) if row else None
+
+    def _unpack_archived(self, row) -> Dict[str, Any]:
+        data = json.loads(zlib.decompress(row["data"])) if row["data"] else {}
+        return {
+            "path": row["path"],
+            "content_hash": row["content_hash"],
+            "status": row["status"],
+            "last_updated": row["last_updated"],
+            "fingerprint": row["fingerprint"],
+            "file_list": data.get("file_list"),
+            "metadata": data.get("metadata"),
+            "archived": True,
+        }
+
+    def has_seen(self, content_hash: Optional[str] = None, fingerprint: Optional[str] = None) -> bool:
+        """Whether this content was recorded before, in either the hot table or the archive."""
+        self.flush()
+        conn = self._connect()
+        for column, value in (("content_hash", content_hash), ("fingerprint", fingerprint)):
+            if not value:
+                continue
+            for table in ("file_history", "file_history_archive"):
+                if conn.execute(f"SELECT 1 FROM {table} WHERE {column} = ? LIMIT 1", (value,)).fetchone():
+                    return True
+        return False
+
+    def archive_older_than(self, max_age_seconds: float, batch_size: int = 1000) -> int:
+        """
+        Moves processed/ignored rows not updated for max_age_seconds into the
+        archive table, compressing their JSON. Works in batches so the write lock
+        is only held briefly. Returns the number of rows archived.
+        """
+        self.flush()
+        cutoff = time.time() - max_age_seconds
+        placeholders = ",".join("?" for _ in ARCHIVE_STATUSES)
+        conn = self._connect()
+        archived = 0
+        while True:
+            rows = conn.execute(f"""
+                SELECT {STATE_COLUMNS}, {BLOB_COLUMNS}
+                FROM file_history h LEFT JOIN file_history_blobs b ON b.path = h.path
+                WHERE h.last_updated < ? AND h.status IN ({placeholders})
+                LIMIT ?
+            """, (cutoff, *ARCHIVE_STATUSES, batch_size)).fetchall()
+            if not rows:
+                break
+
+            now = time.time()
+            archive_rows = []
+            for row in rows:
+                data = json.dumps({"file_list": row["file_list"], "metadata": row["metadata"]})
+                archive_rows.append((row["path"], row["content_hash"], row["status"], row["last_updated"],
+                                     row["fingerprint"], now, zlib.compress(data.encode('utf-8'))))
+            paths = [(row["path"],) for row in rows]
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO file_history_archive VALUES (?, ?, ?, ?, ?, ?, ?)", archive_rows)
+                conn.executemany("DELETE FROM file_history WHERE path = ?", paths)
+                conn.executemany("DELETE FROM file_history_blobs WHERE path = ?", paths)
+            archived += len(rows)
+            if len(rows) < batch_size:
+                break
+
+        if archived:
+            logger.info(f"Archived {archived} history rows older than {max_age_seconds / 86400:.0f} days")
+        return archived
+
+    def run_maintenance(self, retention_days: int, vacuum_pages: int = 1000):
+        """Archives old rows and returns up to vacuum_pages free pages to the filesystem."""
+        try:
+            if retention_days > 0:
+                self.archive_older_than(retention_days * 86400)
+            conn = self._connect()
+            self._enable_incremental_vacuum(conn)
+            conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+            self._db_stats = None
+        except Exception as e:
+            logger.error(f"History maintenance failed: {e}")
+
+    def get_db_stats(self) -> Dict[str, Any]:
+        """Database size and row counts per tier (cached briefly; polled by /api/status)."""
+        cached = self._db_stats
+        if cached and time.monotonic() - cached[1] < DB_STATS_TTL:
+            return cached[0]
+        try:
+            size = sum(os.path.getsize(self.db_path + suffix)
+                       for suffix in ("", "-wal") if os.path.exists(self.db_path + suffix))
+            conn = self._connect()
+            stats = {
+                "size_bytes": size,
+                "hot_rows": self.count_by_status(),
+                "archived_rows": conn.execute("SELECT COUNT(*) FROM file_history_archive").fetchone()[0],
+                "free_pages": conn.execute("PRAGMA freelist_count").fetchone()[0],
+            }
+        except Exception as e:
+            logger.error(f"Error reading history database stats: {e}")
+            return {}
+        self._db_stats = (stats, time.monotonic())
+        return stats
+
+    def _compute_hash(self, dirpath: str, sorted_files) -> str:
+        hasher = hashlib.sha256()
+
+        for filepath in sorted_files:
+            try:
+                # A missing file raises here and is skipped (one stat per file)
                 stat = os.stat(filepath)
                 # Use relative path + size + mtime
                 rel_path = os.path.relpath(filepath, dirpath)
@@ -52,70 +503,204 @@ class HistoryManager:
             except Exception:
                 # File might have disappeared or permission issue
                 continue
-                
+
         return hasher.hexdigest()
 
     def get_state(self, path: str):
+        # Read-your-writes: an unflushed update is the current state
+        with self._pending_lock:
+            pending = self._pending.get(path)
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM file_history WHERE path = ?", (path,))
-                row = cursor.fetchone()
-                if row:
-                    return dict(row)
-                return None
+            row = self._connect().execute(f"""
+                SELECT {STATE_COLUMNS}, {BLOB_COLUMNS}
+                FROM file_history h LEFT JOIN file_history_blobs b ON b.path = h.path
+                WHERE h.path = ?
+            """, (path,)).fetchone()
+            state = dict(row) if row else None
+            if state is None and not pending:
+                state = self._get_archived(path)
         except Exception as e:
             logger.error(f"Error reading history for {path}: {e}")
-            return None
+            state = None
+
+        if pending:
+            _, content_hash, status, last_updated, fingerprint, files_json, meta_json = pending
+            state = {
+                "path": path,
+                "content_hash": content_hash,
+                "status": status,
+                "last_updated": last_updated,
+                "fingerprint": fingerprint if fingerprint is not None else (state or {}).get("fingerprint"),
+                "file_list": files_json if files_json is not None else (state or {}).get("file_list"),
+                "metadata": meta_json if meta_json is not None else (state or {}).get("metadata"),
+            }
+        return state
 
     def get_all_pending(self) -> List[Dict[str, Any]]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM file_history WHERE status = 'pending'")
-                return [dict(row) for row in cursor.fetchall()]
+            return list(self.iter_by_status('pending', include_blobs=True))
         except Exception as e:
             logger.error(f"Error reading pending items: {e}")
             return []
 
-    def update_state(self, path: str, content_hash: str, status: str, files: List[str] = None, metadata: Any = None):
+    def get_page_by_status(self, status: str, after: Optional[str] = None, limit: int = 100,
+                           include_blobs: bool = False) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Returns up to `limit` rows with the given status ordered by path, starting
+        after the `after` cursor, plus the cursor for the next page (None at the end).
+        """
+        self.flush()
+        columns = f"{STATE_COLUMNS}, {BLOB_COLUMNS}" if include_blobs else STATE_COLUMNS
+        join = "LEFT JOIN file_history_blobs b ON b.path = h.path" if include_blobs else ""
+        rows = self._connect().execute(f"""
+            SELECT {columns} FROM file_history h {join}
+            WHERE h.status = ? AND h.path > ?
+            ORDER BY h.path
+            LIMIT ?
+        """, (status, after or "", limit)).fetchall()
+        items = [dict(row) for row in rows]
+        next_cursor = items[-1]["path"] if len(items) == limit else None
+        return items, next_cursor
+
+    def iter_by_status(self, status: str, page_size: int = 500, include_blobs: bool = False) -> Iterator[Dict[str, Any]]:
+        """Streams rows with the given status one page at a time (no long-lived read transaction)."""
+        cursor = None
+        while True:
+            items, cursor = self.get_page_by_status(status, cursor, page_size, include_blobs)
+            yield from items
+            if cursor is None:
+                return
+
+    def count_by_status(self, status: Optional[str] = None):
+        """Row count for one status, or a {status: count} dict when status is None."""
+        self.flush()
+        conn = self._connect()
+        if status is not None:
+            return conn.execute("SELECT COUNT(*) FROM file_history WHERE status = ?", (status,)).fetchone()[0]
+        rows = conn.execute("SELECT status, COUNT(*) FROM file_history GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def get_blobs(self, path: str) -> Dict[str, Any]:
+        """Lazily loads the file list and metadata JSON for one row."""
+        state = self.get_state(path) or {}
+        return {"file_list": state.get("file_list"), "metadata": state.get("metadata")}
+
+    def update_state(self, path: str, content_hash: str, status: str, files: List[str] = None, metadata: Any = None,
+                     fingerprint: Optional[str] = None):
         try:
             meta_json = json.dumps(metadata.__dict__) if hasattr(metadata, '__dict__') else json.dumps(metadata) if metadata else None
             files_json = json.dumps(files) if files else None
-            
-            # If files/metadata not provided, retain existing if updating status? 
-            # For simplicity, we assume we update everything or we need to fetch first.
-            # But usually we have full context when updating.
-            
-            with sqlite3.connect(self.db_path) as conn:
-                # Upsert logic
-                # SQLite 3.24+ supports ON CONFLICT DO UPDATE, but let's be safe with simple logic
-                # or just REPLACE (which deletes and inserts, fine for this)
-                 
-                # If we use REPLACE, we wipe columns if we pass None.
-                # So we should probably do a smart update or just always provide all data.
-                
-                # Let's try to get existing data if we are missing some fields?
-                existing = self.get_state(path)
-                if existing:
-                    if files_json is None: files_json = existing['file_list']
-                    if meta_json is None: meta_json = existing['metadata']
-
-                conn.execute("""
-                    INSERT OR REPLACE INTO file_history (path, content_hash, status, last_updated, file_list, metadata)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (path, content_hash, status, time.time(), files_json, meta_json))
-                conn.commit()
-                logger.info(f"Updated history for {path} | Status: {status}")
+            # Missing files/metadata/fingerprint keep their stored values (COALESCE in the upsert)
+            row = (path, content_hash, status, time.time(), fingerprint, files_json, meta_json)
+
+            if self.write_behind and not self._closed:
+                with self._pending_lock:
+                    previous = self._pending.get(path)
+                    if previous:
+                        # Coalesce with the unflushed update for the same path
+                        row = row[:4] + tuple(
+                            new if new is not None else old for new, old in zip(row[4:], previous[4:])
+                        )
+                    self._pending[path] = row
+                logger.debug(f"Queued history update for {path} | Status: {status}")
+                return
+
+            conn = self._connect()
+            with metrics.history_write_seconds.time(), conn:
+                self._write_rows(conn, [row])
+            logger.info(f"Updated history for {path} | Status: {status}")
         except Exception as e:
             logger.error(f"Error updating history for {path}: {e}")
 
     def remove_state(self, path: str):
+        with self._pending_lock:
+            self._pending.pop(path, None)
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            conn = self._connect()
+            with conn:
                 conn.execute("DELETE FROM file_history WHERE path = ?", (path,))
-                conn.commit()
+                conn.execute("DELETE FROM file_history_blobs WHERE path = ?", (path,))
+                conn.execute("DELETE FROM file_history_archive WHERE path = ?", (path,))
         except Exception as e:
             logger.error(f"Error removing history for {path}: {e}")
+
+    def save_groups(self, groups: Dict[str, Dict[str, Any]], removed: Iterable[str] = ()):
+        """Stores the FileGrouper's changed groups and drops emitted ones, in one transaction."""
+        conn = self._connect()
+        with metrics.history_write_seconds.time(), conn:
+            conn.executemany(
+                "INSERT INTO pending_groups (path, files, created, last_update) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET files = excluded.files, last_update = excluded.last_update",
+                [(path, json.dumps(sorted(group['files'])), group['created'], group['last_update'])
+                 for path, group in groups.items()])
+            conn.executemany("DELETE FROM pending_groups WHERE path = ?", [(path,) for path in removed])
+
+    def load_groups(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._connect().execute("SELECT path, files, created, last_update FROM pending_groups").fetchall()
+        return {
+            row['path']: {'files': set(json.loads(row['files'])), 'created': row['created'], 'last_update': row['last_update']}
+            for row in rows
+        }
+
+    def get_library_dir(self, source_dir: str) -> Optional[str]:
+        """The library folder source_dir was last published to, if any."""
+        row = self._connect().execute(
+            "SELECT book_dir FROM library_index WHERE source_dir = ?", (source_dir,)).fetchone()
+        return row['book_dir'] if row else None
+
+    def set_library_dir(self, source_dir: str, book_dir: str):
+        try:
+            conn = self._connect()
+            with metrics.history_write_seconds.time(), conn:
+                conn.execute("INSERT INTO library_index (source_dir, book_dir) VALUES (?, ?) "
+                             "ON CONFLICT(source_dir) DO UPDATE SET book_dir = excluded.book_dir",
+                             (source_dir, book_dir))
+        except Exception as e:
+            logger.warning(f"Failed to update library index for {source_dir}: {e}")
+
+    def flush(self):
+        """Writes all queued write-behind updates in a single transaction."""
+        with self._pending_lock:
+            if not self._pending:
+                return
+            rows = list(self._pending.values())
+            self._pending.clear()
+        try:
+            conn = self._connect()
+            with metrics.history_write_seconds.time(), conn:
+                self._write_rows(conn, rows)
+            logger.debug(f"Flushed {len(rows)} history updates")
+        except Exception as e:
+            logger.error(f"Error flushing {len(rows)} history updates: {e}")
+            # Put them back unless a newer update for the same path arrived meanwhile
+            with self._pending_lock:
+                for row in rows:
+                    self._pending.setdefault(row[0], row)
+
+    def _write_rows(self, conn, rows):
+        metrics.history_rows_written_total.inc(len(rows))
+        conn.executemany(UPSERT_SQL, [row[:5] for row in rows])
+        blob_rows = [(row[0], row[5], row[6]) for row in rows if row[5] is not None or row[6] is not None]
+        if blob_rows:
+            conn.executemany(UPSERT_BLOBS_SQL, blob_rows)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            self.flush()
+
+    def close(self):
+        self._closed = True
+        self._flush_event.set()
+        if self._flusher:
+            self._flusher.join(timeout=5)
+        self.flush()
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
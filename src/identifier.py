@@ -1,3 +1,4 @@
+import io
 import os
 import re
 import logging
@@ -6,6 +7,8 @@ from mutagen.easyid3 import EasyID3
 from mutagen.easymp4 import EasyMP4
 from mutagen.id3 import ID3
 from mutagen.mp4 import MP4
+from src import metrics
+from src import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +52,10 @@ class Identifier:
         ]
         
     def identify(self, dirpath, files):
+        with metrics.identify_seconds.time(), tracing.span("identify", files=len(files)):
+            return self._identify(dirpath, files)
+
+    def _identify(self, dirpath, files):
         logger.info(f"Identifying content in {dirpath}")
         
         # 1. Try embedded tags
@@ -72,26 +79,44 @@ class Identifier:
         # we can assume that if multiple files are grouped, the folder name is likely the book name.
         # If it's a single file, the filename is likely more descriptive if the folder is generic.
         
-        path_name = os.path.basename(dirpath)
-        if not path_name or path_name in ['.', 'root', 'input']: 
-             path_name = os.path.basename(files[0])
-             
-        filename_result = self._extract_from_string(path_name)
+        filename_result = self._extract_from_string(self._name_for(dirpath, files[0]))
 
         # 3. Merge (prefer tags for specific fields, fallback to filename)
         final_result = self._merge_results(tag_result, filename_result)
         
         return final_result
 
+    def identify_archive(self, dirpath, member, header):
+        """
+        Identifies an archive before it is extracted into dirpath, from the name
+        of its first audio member and that member's leading bytes (tag headers).
+        Gives the same result as identify() on the extracted folder when that
+        member is the one whose tags identify() uses.
+        """
+        with metrics.identify_seconds.time():
+            tag_result = IdentificationResult()
+            if self._is_audio(member) and header:
+                fileobj = io.BytesIO(header)
+                fileobj.name = member # mutagen also guesses the format from the name
+                tag_result = self._extract_from_tags(member, fileobj=fileobj)
+            filename_result = self._extract_from_string(self._name_for(dirpath, member))
+            return self._merge_results(tag_result, filename_result)
+
+    def _name_for(self, dirpath, first_file):
+        path_name = os.path.basename(dirpath)
+        if not path_name or path_name in ['.', 'root', 'input']: 
+             path_name = os.path.basename(first_file)
+        return path_name
+
     def _is_audio(self, filepath):
         ext = os.path.splitext(filepath)[1].lower()
         return ext in ['.mp3', '.m4b', '.m4a', '.flac', '.opus', '.wma']
 
-    def _extract_from_tags(self, filepath):
+    def _extract_from_tags(self, filepath, fileobj=None):
         result = IdentificationResult()
         result.source = "tags"
         try:
-            audio = mutagen.File(filepath)
+            audio = mutagen.File(fileobj if fileobj is not None else filepath)
             if audio is None:
                 return result
             
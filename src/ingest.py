@@ -1,47 +1,265 @@
 import os
+import re
+import heapq
+import queue
 import shutil
+import struct
 import logging
+import functools
+import tempfile
+import threading
 import zipfile
 import tarfile
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import NamedTuple, Optional
 from src.config import config
+from src import metrics
+from src.monitor import IgnoreList, EXTRACTING_SUFFIX, ARCHIVE_FORMATS, archive_suffix
 import time
 
 logger = logging.getLogger(__name__)
 
+# Members are written in chunks of this size, so memory use doesn't depend on member size
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+# How long an extracted folder stays ignored by the monitor after it is renamed into place
+EXTRACTED_IGNORE_SECONDS = 60
+# Archives inside archives are decoded this many levels deep; deeper nesting fails the extraction
+MAX_NESTED_DEPTH = 3
+# Nested zips are buffered for random access; in memory up to this size
+NESTED_ZIP_MEMORY = 64 * 1024 * 1024
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4b', '.m4a', '.flac', '.opus', '.wma')
+# Read past a member's tag header: mutagen wants a few audio frames after the tags
+TAG_PEEK_BYTES = 256 * 1024
+# Tag headers (ID3 with embedded cover art, MP4 moov) beyond this size aren't read from archives
+MAX_TAG_BYTES = 16 * 1024 * 1024
+
+
+class ArchivePeek(NamedTuple):
+    """The first audio member of an archive, read without extracting it."""
+    archive: str
+    dest_dir: str  # Folder the archive extracts to
+    member: str    # Member name inside the archive
+    header: bytes  # Its leading bytes, enough for mutagen to read the tags
+
+
+class ExtractionAbandoned(Exception):
+    """Stops an extraction whose archive was handled without it."""
+
+
+class ArchiveTooLarge(Exception):
+    """An archive decompresses to more than EXTRACT_MAX_SIZE_MB."""
+
+
+class _SizeBudget:
+    # Decompressed bytes written by one extraction (zip bomb protection); shared
+    # by the workers extracting its members
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def check_declared(self, size):
+        if self.limit and size > self.limit:
+            raise ArchiveTooLarge(f"decompresses to more than {self.limit // 1048576} MB")
+
+    def consume(self, size):
+        with self._lock:
+            self.used += size
+            self.check_declared(self.used)
+
+
+def _zstd_reader(fileobj):
+    try:
+        from compression import zstd # Python 3.14+
+        return zstd.ZstdFile(fileobj)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("extracting .tar.zst needs Python 3.14 or the zstandard package")
+    return zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+
+def _open_tar_stream(fileobj, fmt):
+    # Stream mode ('r|'): decompressed as it is read, without seeking back
+    if fmt == 'zst':
+        return tarfile.open(fileobj=_zstd_reader(fileobj), mode='r|')
+    return tarfile.open(fileobj=fileobj, mode='r|*')
+
+
+def read_tag_header(stream, name):
+    """
+    Reads the tag-bearing start of an audio stream: the ID3 tag plus the first
+    audio frames for MP3, the ftyp and moov atoms for MP4, a fixed prefix otherwise.
+    """
+    if os.path.splitext(name)[1].lower() in ('.m4a', '.m4b'):
+        return _read_mp4_header(stream)
+    head = stream.read(10)
+    if len(head) == 10 and head[:3] == b'ID3':
+        # Syncsafe size, excluding the 10-byte header (and the footer, if flagged)
+        size = (head[6] & 0x7f) << 21 | (head[7] & 0x7f) << 14 | (head[8] & 0x7f) << 7 | (head[9] & 0x7f)
+        if head[5] & 0x10:
+            size += 10
+        return head + stream.read(min(size, MAX_TAG_BYTES) + TAG_PEEK_BYTES)
+    return head + stream.read(TAG_PEEK_BYTES)
+
+
+def _read_mp4_header(stream):
+    # Top-level atoms up to moov; the audio (mdat) is skipped, unless it is too
+    # large to read through before a trailing moov
+    atoms = []
+    read = 0
+    while True:
+        head = stream.read(8)
+        if len(head) < 8:
+            break
+        size, kind = struct.unpack('>I4s', head)
+        if size == 1:
+            extended = stream.read(8)
+            head += extended
+            size = struct.unpack('>Q', extended)[0]
+        if size < len(head) or read + size > MAX_TAG_BYTES:
+            # 0 (runs to end of file), malformed, or too large
+            break
+        body = stream.read(size - len(head))
+        read += size
+        if kind in (b'ftyp', b'moov'):
+            atoms.append(head + body)
+        if kind == b'moov':
+            break
+    return b''.join(atoms)
+
+# Disc/part markers ("CD1", "Disc 02", "Disk 1 of 2", "Part 3"); group 1 is whatever precedes
+# the marker, e.g. "Title" in "Title - CD2"
+DISC_FOLDER_RE = re.compile(r'^(.*?)[\s._-]*(?<![^\s._-])(?:cd|dis[ck]|part|pt)[\s._-]*\d{1,3}(?:\s*of\s*\d{1,3})?$', re.IGNORECASE)
+
+
+def _folder_key(name):
+    return re.sub(r'[\s._-]+', ' ', name).strip().lower()
+
+
+def _is_disc_folder(path):
+    """
+    True for a bare marker ("CD1") or a marker after the parent folder's own name
+    (Title/Title - CD2). "Dune Part 1" under an author folder is a book of its own.
+    """
+    match = DISC_FOLDER_RE.match(os.path.basename(path))
+    if not match:
+        return False
+    prefix = _folder_key(match.group(1))
+    return not prefix or prefix == _folder_key(os.path.basename(os.path.dirname(path)))
+
+
+@functools.lru_cache(maxsize=4096)
+def book_root(dirpath, input_dir):
+    """
+    The folder a book's files are grouped under: dirpath, or for disc/part folders
+    (Book/CD1, Book/Part 1/CD2, Book/Book - CD3) the nearest parent that isn't one.
+    Never goes above input_dir.
+    """
+    input_root = os.path.abspath(input_dir)
+    root = dirpath
+    while _is_disc_folder(root):
+        parent = os.path.dirname(root)
+        if parent == root or os.path.abspath(parent) == input_root:
+            break
+        root = parent
+    return root
+
+
 class FileGrouper:
-    def __init__(self, callback, window=5):
+    """
+    Collects files into book groups and emits a group once nothing has been added
+    to it for `window` seconds. With a store (HistoryManager), waiting groups are
+    saved on every tick and can be restored after a restart.
+    """
+    def __init__(self, callback, window=5, store=None):
         self.callback = callback
         self.window = window
-        self.groups = {} # dirpath -> {'files': set(), 'last_update': time}
+        self.store = store
+        self.groups = {} # dirpath -> {'files': set(), 'last_update': time, 'created': time}
+        # One (last_update, dirpath) entry per group, oldest first, so a tick only looks
+        # at groups that may be due. Entries are not updated when files are added; a
+        # stale entry is pushed back with the group's latest time when it comes up.
+        self._expiry = []
+        self._dirty = set() # groups changed or emitted since the last save
 
     def add_file(self, filepath):
-        dirpath = os.path.dirname(filepath)
-        # If the file is in the root INPUT_DIR, we might want to treat it specially,
-        # but for now, grouping by directory is the safest bet.
+        # Files are grouped by book folder; disc/part subfolders join their book.
         # If multiple files are in root, they will be grouped together.
-        
-        if dirpath not in self.groups:
-            self.groups[dirpath] = {'files': set(), 'last_update': time.time()}
-        
-        self.groups[dirpath]['files'].add(filepath)
-        self.groups[dirpath]['last_update'] = time.time()
+        dirpath = book_root(os.path.dirname(filepath), config.INPUT_DIR)
+        now = time.time()
+
+        group = self.groups.get(dirpath)
+        if group is None:
+            group = self.groups[dirpath] = {'files': set(), 'last_update': now, 'created': now}
+            heapq.heappush(self._expiry, (now, dirpath))
+
+        group['files'].add(filepath)
+        group['last_update'] = now
+        self._dirty.add(dirpath)
         logger.info(f"Added {os.path.basename(filepath)} to group {dirpath}")
 
     def check_groups(self):
         current_time = time.time()
-        to_emit = []
-        
-        for dirpath, data in list(self.groups.items()):
-            if current_time - data['last_update'] >= self.window:
-                to_emit.append(dirpath)
-        
-        for dirpath in to_emit:
-            files = list(self.groups[dirpath]['files'])
+
+        while self._expiry and current_time - self._expiry[0][0] >= self.window:
+            last_update, dirpath = heapq.heappop(self._expiry)
+            group = self.groups.get(dirpath)
+            if group is None:
+                continue
+            if group['last_update'] > last_update:
+                # Files were added since; wait out the window from the latest one
+                heapq.heappush(self._expiry, (group['last_update'], dirpath))
+                continue
+
+            del self.groups[dirpath]
+            self._dirty.add(dirpath)
             # Verify files still exist
-            valid_files = [f for f in files if os.path.exists(f)]
+            valid_files = [f for f in group['files'] if os.path.exists(f)]
             if valid_files:
+                metrics.group_wait_seconds.observe(current_time - group['created'])
+                metrics.groups_ready_total.inc()
                 self.callback(dirpath, valid_files)
-            del self.groups[dirpath]
+
+        self._save()
+
+    def _save(self):
+        if not self.store or not self._dirty:
+            return
+        changed = {dirpath: self.groups[dirpath] for dirpath in self._dirty if dirpath in self.groups}
+        removed = [dirpath for dirpath in self._dirty if dirpath not in self.groups]
+        try:
+            self.store.save_groups(changed, removed)
+        except Exception as e:
+            logger.error(f"Failed to save {len(changed)} pending groups: {e}")
+            return
+        self._dirty.clear()
+
+    def restore(self):
+        """
+        Loads the groups saved before a restart. They wait a full window again,
+        since their files may still be arriving. Returns the number restored.
+        """
+        if not self.store:
+            return 0
+        now = time.time()
+        restored = 0
+        for dirpath, saved in self.store.load_groups().items():
+            files = {f for f in saved['files'] if os.path.exists(f)}
+            self._dirty.add(dirpath)
+            if not files:
+                continue
+            group = self.groups.get(dirpath)
+            if group is None:
+                group = self.groups[dirpath] = {'files': set(), 'last_update': now, 'created': saved['created']}
+                heapq.heappush(self._expiry, (now, dirpath))
+                restored += 1
+            group['files'] |= files
+        self._save()
+        return restored
 
     def get_stats(self):
         count = sum(len(data['files']) for data in self.groups.values())
@@ -51,14 +269,29 @@ class FileGrouper:
         }
 
 class IngestionManager:
-    def __init__(self, processing_callback):
+    def __init__(self, processing_callback, ignored=None, store=None):
         self.processing_callback = processing_callback # Callback to Identification Engine
-        self.grouper = FileGrouper(self.on_group_ready)
+        # store (HistoryManager) keeps groups that are still forming across restarts
+        self.grouper = FileGrouper(self.on_group_ready, store=store)
+        # Trees we write ourselves; shared with the Monitor so it doesn't track them
+        self.ignored = ignored if ignored is not None else IgnoreList()
+        # Archives are extracted off the tick thread; finished extractions are
+        # registered with the grouper on the next tick
+        self._extract_pool = ThreadPoolExecutor(max_workers=config.EXTRACT_WORKERS, thread_name_prefix="extract")
+        self._member_pool = ThreadPoolExecutor(max_workers=config.EXTRACT_MEMBER_WORKERS, thread_name_prefix="unzip")
+        self._extracting = set()
+        self._extracted = queue.SimpleQueue() # (archive, extracted files) from the workers
+        # archive_hook(ArchivePeek) is called before an archive is extracted, so the book can
+        # be identified while it extracts. It may return a Future that resolves to a handler
+        # replacing the extraction (called with no arguments) or to None to let it finish.
+        self.archive_hook = None
+        self._throughput = {} # format -> [bytes written, seconds]
+        self._throughput_lock = threading.Lock()
 
     def process_file(self, filepath):
         # 1. Archive Handling
         if self.is_archive(filepath):
-            self.extract_archive(filepath)
+            self.submit_extraction(filepath)
             return
 
         # 2. Filtering
@@ -70,41 +303,307 @@ class IngestionManager:
         self.grouper.add_file(filepath)
 
     def is_archive(self, filepath):
-        return filepath.endswith('.zip') or filepath.endswith('.tar') or filepath.endswith('.tar.gz')
+        return archive_suffix(filepath) is not None
+
+    def archive_format(self, filepath):
+        # Zip is recognised by content; tar compression by suffix, or sniffed for plain tar names
+        if zipfile.is_zipfile(filepath):
+            return 'zip'
+        fmt = ARCHIVE_FORMATS.get(archive_suffix(filepath))
+        if fmt in (None, 'zip', 'tar'):
+            return 'tar' if tarfile.is_tarfile(filepath) else None
+        return fmt
+
+    def submit_extraction(self, filepath):
+        if filepath in self._extracting:
+            return
+        self._extracting.add(filepath)
+        self._extract_pool.submit(self._extract_job, filepath)
+
+    def _extract_job(self, filepath):
+        files = []
+        try:
+            replaced_by = None
+            if self.archive_hook and not config.DRY_RUN:
+                peek = self.peek_archive(filepath)
+                if peek:
+                    try:
+                        replaced_by = self.archive_hook(peek)
+                    except Exception as e:
+                        logger.warning(f"Archive hook failed for {filepath}: {e}")
+            files = self.extract_archive(filepath, replaced_by)
+        finally:
+            self._extracted.put((filepath, files))
 
-    def extract_archive(self, filepath):
+    def extraction_dir(self, filepath):
+        # Extract to a folder with the same name (minus extension, all of '.tar.gz')
+        # Ensure we are extracting into a subdirectory to prevent dumping into root
+        name = os.path.basename(filepath)
+        suffix = archive_suffix(name)
+        base_name = name[:-len(suffix)] if suffix else os.path.splitext(name)[0]
+        return os.path.join(os.path.dirname(filepath), base_name)
+
+    def peek_archive(self, filepath) -> Optional[ArchivePeek]:
+        """
+        Reads the tag header of the first audio member straight from the archive,
+        without extracting anything. None if there is no audio member or the
+        archive can't be read.
+        """
+        try:
+            fmt = self.archive_format(filepath)
+            if fmt == 'zip':
+                with zipfile.ZipFile(filepath) as zf:
+                    # Members are randomly accessible; take the first in name order
+                    members = sorted(i.filename for i in zf.infolist()
+                                     if not i.is_dir() and "__MACOSX" not in i.filename and self._is_audio(i.filename))
+                    if not members:
+                        return None
+                    member = members[0]
+                    with zf.open(member) as src:
+                        header = read_tag_header(src, member)
+            elif fmt:
+                with open(filepath, 'rb') as f, _open_tar_stream(f, fmt) as tar_ref:
+                    # A tar is sequential; stop at the first audio member rather than decoding it all
+                    info = next((i for i in tar_ref if i.isfile() and self._is_audio(i.name)), None)
+                    if info is None:
+                        return None
+                    member = info.name
+                    header = read_tag_header(tar_ref.extractfile(info), member)
+            else:
+                return None
+        except Exception as e:
+            logger.warning(f"Could not read tags from archive {filepath}: {e}")
+            return None
+        return ArchivePeek(filepath, self.extraction_dir(filepath), member, header)
+
+    def _is_audio(self, name):
+        return os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+
+    def extract_archive(self, filepath, replaced_by=None):
+        """
+        Extracts an archive into a sibling folder named after it, then deletes it.
+        Members are written to <folder>.extracting, which is renamed into place once
+        complete, so a partial extraction is never picked up. Archives inside the
+        archive are decoded from it into folders named after them. Returns the
+        extracted file paths ([] on failure or in dry-run mode).
+
+        If replaced_by (a Future) resolves to a handler before the extraction is
+        complete, the extraction stops, the archive is left in place and the
+        handler is called instead.
+        """
         logger.info(f"Extracting archive: {filepath}")
+        dest_dir = self.extraction_dir(filepath)
+
+        if config.DRY_RUN:
+            logger.info(f"[DRY RUN] Would create extraction directory: {dest_dir}")
+            logger.info(f"[DRY RUN] Would extract archive {filepath} to {dest_dir}")
+            logger.info(f"[DRY RUN] Would delete archive {filepath}")
+            return []
+
+        temp_dir = dest_dir + EXTRACTING_SUFFIX
+        self.ignored.add(temp_dir)
+        self.ignored.add(dest_dir)
         try:
-            # Extract to a folder with the same name (minus extension)
-            # Ensure we are extracting into a subdirectory to prevent dumping into root
-            base_name = os.path.splitext(os.path.basename(filepath))[0]
-            parent_dir = os.path.dirname(filepath)
-            dest_dir = os.path.join(parent_dir, base_name)
-            
-            if config.DRY_RUN:
-                logger.info(f"[DRY RUN] Would create extraction directory: {dest_dir}")
-                logger.info(f"[DRY RUN] Would extract archive {filepath} to {dest_dir}")
-                logger.info(f"[DRY RUN] Would delete archive {filepath}")
-                return
+            if os.path.exists(temp_dir):
+                # Left over by an interrupted extraction
+                shutil.rmtree(temp_dir)
+            os.makedirs(temp_dir)
+
+            fmt = self.archive_format(filepath)
+            if fmt is None:
+                raise ValueError("unsupported archive format")
+            budget = _SizeBudget(config.EXTRACT_MAX_SIZE_MB * 1024 * 1024)
+            start = time.perf_counter()
+            with metrics.archive_extract_seconds.time(format=fmt):
+                if fmt == 'zip':
+                    self._extract_zip(filepath, temp_dir, replaced_by, budget)
+                else:
+                    with open(filepath, 'rb') as f:
+                        self._extract_tar(f, fmt, temp_dir, replaced_by, budget)
+            self._record_throughput(fmt, budget.used, time.perf_counter() - start)
+            self._check_replaced(replaced_by)
+            files = self._move_into_place(temp_dir, dest_dir)
 
-            if not os.path.exists(dest_dir):
-                os.makedirs(dest_dir)
-            
-            if zipfile.is_zipfile(filepath):
-                with zipfile.ZipFile(filepath, 'r') as zip_ref:
-                    zip_ref.extractall(dest_dir)
-            elif tarfile.is_tarfile(filepath):
-                with tarfile.open(filepath) as tar_ref:
-                    tar_ref.extractall(dest_dir)
-            
-            # Recursive extraction handled by watchdog detecting new files
-            
             # Delete archive after success
             os.remove(filepath)
-            logger.info(f"Extracted and deleted archive: {filepath}")
-            
+            logger.info(f"Extracted {len(files)} files ({budget.used / 1048576:.1f} MB) and deleted archive: {filepath}")
+            # Watchdog may still deliver events for the rename; those files are already registered
+            self.ignored.add(dest_dir, ttl=EXTRACTED_IGNORE_SECONDS)
+            return files
+
+        except ExtractionAbandoned:
+            logger.info(f"Stopped extracting {filepath}; the archive is handled without it")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            self.ignored.discard(dest_dir)
+            try:
+                replaced_by.result()()
+            except Exception as e:
+                logger.error(f"Failed to handle {filepath}: {e}")
+            return []
         except Exception as e:
             logger.error(f"Failed to extract {filepath}: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            self.ignored.discard(dest_dir)
+            return []
+        finally:
+            self.ignored.discard(temp_dir)
+
+    def _check_replaced(self, replaced_by):
+        if replaced_by is not None and replaced_by.done() and not replaced_by.exception() and replaced_by.result():
+            raise ExtractionAbandoned()
+
+    def _record_throughput(self, fmt, size, seconds):
+        metrics.archive_extract_bytes_total.inc(size, format=fmt)
+        with self._throughput_lock:
+            total = self._throughput.setdefault(fmt, [0, 0.0])
+            total[0] += size
+            total[1] += seconds
+        logger.info(f"Extracted {fmt} archive at {size / 1048576 / max(seconds, 1e-6):.1f} MB/s")
+
+    def _extract_zip(self, filepath, dest_dir, replaced_by, budget):
+        with zipfile.ZipFile(filepath) as zf:
+            jobs = []
+            for info in zf.infolist():
+                if info.is_dir() or "__MACOSX" in info.filename:
+                    continue
+                target = self._member_path(dest_dir, info.filename)
+                if target:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    jobs.append((info, target))
+        # Declared sizes can lie; written bytes are counted as well
+        budget.check_declared(sum(info.file_size for info, _ in jobs))
+
+        # Zip members are independent streams, so they are decompressed in parallel,
+        # each worker through its own handle (zlib releases the GIL)
+        buckets = [[] for _ in range(max(1, min(config.EXTRACT_MEMBER_WORKERS, len(jobs))))]
+        loads = [0] * len(buckets)
+        for job in sorted(jobs, key=lambda j: j[0].file_size, reverse=True):
+            i = loads.index(min(loads))
+            buckets[i].append(job)
+            loads[i] += job[0].file_size
+        if len(buckets) == 1:
+            self._extract_zip_members(filepath, buckets[0], replaced_by, budget)
+            return
+        # A failed bucket stops the others at their next member; the caller removes
+        # the temporary folder, so every worker has to be done writing to it first
+        cancel = threading.Event()
+        futures = [self._member_pool.submit(self._extract_zip_members, filepath, b, replaced_by, budget, cancel)
+                   for b in buckets]
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def _extract_zip_members(self, filepath, jobs, replaced_by, budget, cancel=None):
+        try:
+            with zipfile.ZipFile(filepath) as zf:
+                for info, target in jobs:
+                    if cancel is not None and cancel.is_set():
+                        return
+                    with zf.open(info) as src:
+                        self._write_member(src, info.filename, target, replaced_by, budget, depth=0)
+        except BaseException:
+            if cancel is not None:
+                cancel.set()
+            raise
+
+    def _write_member(self, src, name, target, replaced_by, budget, depth):
+        suffix = archive_suffix(name)
+        if suffix:
+            # Nested archive: decoded from the outer stream into a folder named after
+            # it; the archive itself is never written out
+            if depth >= MAX_NESTED_DEPTH:
+                raise ValueError(f"archives nested more than {MAX_NESTED_DEPTH} deep")
+            nested_dir = target[:-len(suffix)]
+            if ARCHIVE_FORMATS[suffix] == 'zip':
+                self._extract_nested_zip(src, nested_dir, replaced_by, budget, depth + 1)
+            else:
+                self._extract_tar(src, ARCHIVE_FORMATS[suffix], nested_dir, replaced_by, budget, depth + 1)
+            return
+
+        # Streamed in chunks: memory stays bounded whatever the member size
+        with open(target, 'wb') as dst:
+            while True:
+                self._check_replaced(replaced_by)
+                chunk = src.read(EXTRACT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                budget.consume(len(chunk))
+                dst.write(chunk)
+
+    def _extract_nested_zip(self, src, dest_dir, replaced_by, budget, depth):
+        # A zip is read from its central directory at the end, so it needs random
+        # access. Seeking back in a compressed outer stream restarts decompression,
+        # so the nested zip is buffered once: in memory, or in an anonymous temporary
+        # file if it is larger than NESTED_ZIP_MEMORY.
+        with tempfile.SpooledTemporaryFile(max_size=NESTED_ZIP_MEMORY) as buffer:
+            while True:
+                self._check_replaced(replaced_by)
+                chunk = src.read(EXTRACT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                budget.check_declared(budget.used + buffer.tell() + len(chunk))
+                buffer.write(chunk)
+            buffer.seek(0)
+            with zipfile.ZipFile(buffer) as zf:
+                infos = [i for i in zf.infolist() if not i.is_dir() and "__MACOSX" not in i.filename]
+                budget.check_declared(budget.used + sum(i.file_size for i in infos))
+                for info in infos:
+                    target = self._member_path(dest_dir, info.filename)
+                    if not target:
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zf.open(info) as member:
+                        self._write_member(member, info.filename, target, replaced_by, budget, depth)
+
+    def _member_path(self, dest_dir, name):
+        # Like ZipFile.extract: drop absolute prefixes and parent references
+        parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+        return os.path.join(dest_dir, *parts) if parts else None
+
+    def _extract_tar(self, fileobj, fmt, dest_dir, replaced_by, budget, depth=0):
+        # Decoded as one forward stream, member by member; only regular files are
+        # written (links and devices are skipped, directories follow from the files)
+        with _open_tar_stream(fileobj, fmt) as tar_ref:
+            for info in tar_ref:
+                self._check_replaced(replaced_by)
+                if not info.isfile() or "__MACOSX" in info.name:
+                    continue
+                target = self._member_path(dest_dir, info.name)
+                if not target:
+                    continue
+                budget.check_declared(budget.used + info.size)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                self._write_member(tar_ref.extractfile(info), info.name, target, replaced_by, budget, depth)
+
+    def _move_into_place(self, temp_dir, dest_dir):
+        rel_files = []
+        for root, _, files in os.walk(temp_dir):
+            rel_files.extend(os.path.relpath(os.path.join(root, f), temp_dir) for f in files)
+
+        if not os.path.exists(dest_dir):
+            os.rename(temp_dir, dest_dir)
+        else:
+            # Extracting into an existing folder: move the files over individually
+            for rel in rel_files:
+                target = os.path.join(dest_dir, rel)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(os.path.join(temp_dir, rel), target)
+            shutil.rmtree(temp_dir)
+        return [os.path.join(dest_dir, rel) for rel in rel_files]
+
+    def _register_extracted(self):
+        # Extracted files are complete once renamed into place, so they skip the
+        # stability wait and go straight to the grouper (nested archives were
+        # already decoded during the extraction)
+        while True:
+            try:
+                archive, files = self._extracted.get_nowait()
+            except queue.Empty:
+                return
+            self._extracting.discard(archive)
+            for path in files:
+                if self.is_valid_file(path):
+                    self.grouper.add_file(path)
 
     def is_valid_file(self, filepath):
         ext = os.path.splitext(filepath)[1].lower()
@@ -115,7 +614,16 @@ class IngestionManager:
         self.processing_callback(dirpath, files)
         
     def tick(self):
+        self._register_extracted()
         self.grouper.check_groups()
 
+    def stop(self):
+        self._extract_pool.shutdown(wait=False, cancel_futures=True)
+        self._member_pool.shutdown(wait=False)
+
     def get_stats(self):
-        return self.grouper.get_stats()
+        with self._throughput_lock:
+            throughput = {fmt: round(size / 1048576 / seconds, 1) if seconds else None
+                          for fmt, (size, seconds) in self._throughput.items()}
+        return {**self.grouper.get_stats(), "extracting_count": len(self._extracting),
+                "extract_mb_per_second": throughput}
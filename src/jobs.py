@@ -0,0 +1,195 @@
+import sqlite3
+import json
+import time
+import logging
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs older than this are dropped at startup
+JOB_RETENTION_SECONDS = 7 * 86400
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS batches (
+        id TEXT PRIMARY KEY,
+        action TEXT,
+        created_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT,
+        action TEXT,
+        dirpath TEXT,
+        payload TEXT,
+        status TEXT,
+        error TEXT,
+        created_at REAL,
+        started_at REAL,
+        finished_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+    CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id);
+"""
+
+JOB_COLUMNS = "id, batch_id, action, dirpath, status, error, created_at, started_at, finished_at"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Bounded, SQLite-backed job queue for Web UI actions (process/ignore/update).
+
+    Jobs are grouped into batches so a bulk request returns one handle. A fixed
+    number of worker threads run them, so approving hundreds of books does not
+    start hundreds of organize runs at once. Jobs that were running when the
+    process stopped are re-queued on start.
+    """
+
+    def __init__(self, db_path: str, workers: int = None, max_queued: int = None):
+        self.db_path = db_path
+        self.workers = workers or config.JOB_WORKERS
+        self.max_queued = max_queued or config.JOB_QUEUE_MAX
+        self.handlers: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        # One shared connection; job rows are tiny and every access holds self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def register(self, action: str, handler: Callable):
+        """handler(dirpath, payload) runs one job; raising marks it failed."""
+        self.handlers[action] = handler
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            conn = self._db()
+            requeued = conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'").rowcount
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                         (time.time() - JOB_RETENTION_SECONDS,))
+            conn.execute("DELETE FROM batches WHERE id NOT IN (SELECT DISTINCT batch_id FROM jobs)")
+            self._stopping = False
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        if requeued:
+            logger.info(f"Re-queued {requeued} interrupted jobs")
+
+    def stop(self, timeout: float = None):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, action: str, targets: List[str], payload: Optional[dict] = None) -> dict:
+        """Queues one job per target directory. Returns the batch handle."""
+        if action not in self.handlers:
+            raise ValueError(f"Unknown job action: {action}")
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        payload_json = json.dumps(payload or {})
+        with self._lock:
+            conn = self._db()
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if queued + len(targets) > self.max_queued:
+                raise JobQueueFull(f"Job queue is full ({queued} of {self.max_queued} queued)")
+            conn.execute("BEGIN")
+            conn.execute("INSERT INTO batches (id, action, created_at) VALUES (?, ?, ?)", (batch_id, action, now))
+            conn.executemany(
+                "INSERT INTO jobs (batch_id, action, dirpath, payload, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                [(batch_id, action, dirpath, payload_json, now) for dirpath in targets],
+            )
+            conn.execute("COMMIT")
+            self._wakeup.notify_all()
+        return {"batch_id": batch_id, "action": action, "jobs": len(targets)}
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        conn = self._db()
+        row = conn.execute(
+            "SELECT id, action, dirpath, payload FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row:
+            conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), row["id"]))
+        return row
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                job = None
+                while not self._stopping:
+                    job = self._claim()
+                    if job:
+                        break
+                    self._wakeup.wait()
+                if self._stopping:
+                    return
+            self._run(job)
+
+    def _run(self, job):
+        status, error = "done", None
+        try:
+            self.handlers[job["action"]](job["dirpath"], json.loads(job["payload"]))
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['action']} {job['dirpath']}) failed: {e}")
+            status, error = "failed", str(e)
+        with self._lock:
+            self._db().execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job["id"]),
+            )
+
+    def get_job(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._db().execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_batch(self, batch_id: str, include_jobs: bool = False) -> Optional[dict]:
+        with self._lock:
+            conn = self._db()
+            batch = conn.execute("SELECT id, action, created_at FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            if not batch:
+                return None
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+            ).fetchall())
+            jobs = None
+            if include_jobs:
+                jobs = [dict(row) for row in conn.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs WHERE batch_id = ? ORDER BY id", (batch_id,))]
+
+        result = {
+            "batch_id": batch["id"],
+            "action": batch["action"],
+            "created_at": batch["created_at"],
+            "total": sum(counts.values()),
+            "counts": counts,
+            "finished": not counts.get("queued") and not counts.get("running"),
+        }
+        if jobs is not None:
+            result["jobs"] = jobs
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            counts = dict(self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"jobs": {"workers": self.workers, "max_queued": self.max_queued, **counts}}
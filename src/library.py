@@ -0,0 +1,40 @@
+import os
+import json
+import logging
+from typing import Dict, List, Optional
+from src import permissions
+
+logger = logging.getLogger(__name__)
+
+# Hidden files are ignored by the Audiobookshelf scanner
+MANIFEST_NAME = ".abs_organizer.json"
+
+
+def input_signature(dirpath: str, files: List[str]) -> Dict[str, list]:
+    """Relative path -> [size, mtime] for every input file that still exists."""
+    signature = {}
+    for filepath in sorted(files):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue
+        signature[os.path.relpath(filepath, dirpath)] = [stat.st_size, int(stat.st_mtime)]
+    return signature
+
+
+def read_manifest(book_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(book_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(book_dir: str, manifest: dict):
+    path = os.path.join(book_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        permissions.apply_to_fd(f.fileno(), permissions.FILE_MODE, path)
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
@@ -5,7 +5,8 @@ import os
 import threading
 import uvicorn
 import json
-from concurrent.futures import ThreadPoolExecutor
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from src.config import config
 from src.monitor import Monitor
@@ -13,8 +14,14 @@ from src.ingest import IngestionManager
 from src.identifier import Identifier, IdentificationResult
 from src.providers import MetadataAggregator
 from src.organizer import Organizer
-from src.dependencies import queue_manager
+from src.dependencies import queue_manager, job_queue
+from src.queue_manager import QueueItem
 from src.history import HistoryManager
+from src.copier import copy_stats
+from src.events import event_bus
+from src import metrics
+from src import tracing
+from src.profiling import profiler
 
 # Configure logging
 logging.basicConfig(
@@ -26,31 +33,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger("AutoLibrarian")
 
+# Enrichments started for archives that are still extracting, kept until their book is processed
+MAX_PREFETCHED = 256
+# Prefetch lookups wait on the network; they get their own threads so they never hold up organizing
+PREFETCH_WORKERS = 2
+
 class AutoLibrarian:
-    def __init__(self):
+    def __init__(self, history_path=None):
         self.identifier = Identifier()
         self.aggregator = MetadataAggregator()
-        self.organizer = Organizer()
         # project_root assumption: parent of current_dir (src)
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.history = HistoryManager(os.path.join(project_root, "history.db"))
+        self.history = HistoryManager(
+            history_path or os.path.join(project_root, "history.db"),
+            write_behind=config.HISTORY_WRITE_BEHIND,
+            flush_interval=config.HISTORY_FLUSH_INTERVAL,
+            hash_cache_ttl=config.HASH_CACHE_TTL,
+        )
+        self.organizer = Organizer(store=self.history)
+        self._last_maintenance = 0.0
+        self._last_status_push = 0.0
         self.executor = ThreadPoolExecutor(max_workers=config.MAX_WORKERS if hasattr(config, 'MAX_WORKERS') else 4)
         
         # Ingestion Manager callback -> Processing Pipeline
-        self.ingestion = IngestionManager(self.process_book)
+        self.ingestion = IngestionManager(self.process_book, store=self.history)
+        # Archives are identified from their tags and enriched while they extract
+        self.ingestion.archive_hook = self.prefetch_archive
+        self._prefetched = {} # extraction dir -> (initial metadata, future of enriched metadata)
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
         
         # Monitor callback -> Ingestion Manager
-        self.monitor = Monitor(config.INPUT_DIR, self.ingestion.process_file)
+        # Archive extractions are handed to the grouper directly; the monitor skips them
+        self.monitor = Monitor(config.INPUT_DIR, self.ingestion.process_file, ignored=self.ingestion.ignored)
+        # File events invalidate memoized group hashes
+        self.monitor.add_change_listener(self.history.invalidate_path)
         queue_manager.set_monitor(self.monitor)
         queue_manager.set_history_manager(self.history)
+        self.organizer.cover_cache.pinned = queue_manager.has_cover
         queue_manager.register_status_callback("monitor", self.monitor.get_stats)
         queue_manager.register_status_callback("ingestion", self.ingestion.get_stats)
+        queue_manager.register_status_callback("copy", copy_stats.get_stats)
+        queue_manager.register_status_callback("history", self.history.get_stats)
+        queue_manager.register_status_callback("events", event_bus.get_stats)
+        queue_manager.register_status_callback("jobs", job_queue.get_stats)
+        queue_manager.register_status_callback("metrics", metrics.get_stats)
+        metrics.registry.register_collector(self._collect_gauges)
         
 
     def restore_queue(self):
-        logger.info("Restoring pending items from history...")
-        pending_items = self.history.get_all_pending()
-        for item in pending_items:
+        logger.info(f"Restoring {self.history.count_by_status('pending')} pending items from history...")
+        # Streamed page by page rather than loading the whole result set at once
+        for item in self.history.iter_by_status('pending', include_blobs=True):
             try:
                 # Reconstruct keys
                 dirpath = item['path']
@@ -76,6 +110,11 @@ class AutoLibrarian:
         logger.info(f"Output Directory: {config.OUTPUT_DIR}")
         
         self.restore_queue()
+        restored = self.ingestion.grouper.restore()
+        if restored:
+            logger.info(f"Restored {restored} book groups that were still forming")
+        # After the queue is restored, so re-queued jobs find their items
+        job_queue.start()
         
         if config.WEB_UI_ENABLED:
             logger.info(f"Starting Web API on port {config.API_PORT}")
@@ -90,17 +129,60 @@ class AutoLibrarian:
                 time.sleep(1)
                 self.monitor.tick()
                 self.ingestion.tick()
+                self._schedule_maintenance()
+                self._push_status()
         except KeyboardInterrupt:
             logger.info("Stopping...")
             self.monitor.stop()
+            self.ingestion.stop()
+            job_queue.stop(timeout=5)
             self.executor.shutdown(wait=False)
+            self._prefetch_pool.shutdown(wait=False)
+            self.history.close()
+            tracing.store.close()
+
+    def _schedule_maintenance(self):
+        # History archival/vacuum runs on the worker pool so the tick loop never waits on it
+        now = time.monotonic()
+        if now - self._last_maintenance < config.HISTORY_MAINTENANCE_INTERVAL:
+            return
+        self._last_maintenance = now
+        self.executor.submit(self.history.run_maintenance, config.HISTORY_RETENTION_DAYS)
+
+    def _collect_gauges(self):
+        # Point-in-time values the components already track, read at scrape time
+        history = self.history.get_stats()
+        return [
+            ("abs_tracked_files", "Files waiting to become stable", {}, len(self.monitor.stability_checker.tracked_files)),
+            ("abs_grouping_groups", "Book groups waiting in the grouper", {}, len(self.ingestion.grouper.groups)),
+            ("abs_queue_items", "Items in the review queue", {}, queue_manager.get_stats()["queue_size"]),
+            ("abs_event_subscribers", "Connected /api/events clients", {}, event_bus.get_stats()["event_stream"]["subscribers"]),
+            ("abs_hash_cache_entries", "Memoized group content hashes", {}, history["hash_cache_entries"]),
+            ("abs_history_db_bytes", "History database size including WAL", {}, history["history_db"].get("size_bytes")),
+        ]
+
+    def _push_status(self):
+        # Only build the status payload while someone is listening on /api/events
+        now = time.monotonic()
+        if not event_bus.has_subscribers or now - self._last_status_push < config.STATUS_PUSH_INTERVAL:
+            return
+        self._last_status_push = now
+        event_bus.publish("stats", queue_manager.get_system_status(), key="stats")
+
+    def _progress(self, dirpath, stage, **extra):
+        event_bus.publish("progress", {"path": dirpath, "stage": stage, **extra}, key=f"progress:{dirpath}")
 
     def process_book(self, dirpath, files):
+        with profiler.profiled("process_book"):
+            self._process_book(dirpath, files)
+
+    def _process_book(self, dirpath, files):
         # History Check
         # If item is pending or processed and hash matches, skip.
         # Check against History Manager
         state = self.history.get_state(dirpath)
         current_hash = self.history.calculate_hash(dirpath, files)
+        fingerprint = self.history.calculate_fingerprint(files) if config.CONTENT_FINGERPRINTS else None
         
         if state:
             if state['content_hash'] == current_hash and state['status'] in ['pending', 'processed']:
@@ -108,51 +190,144 @@ class AutoLibrarian:
                 return
             elif state['content_hash'] != current_hash:
                  logger.info(f"File content changed for {dirpath}. Re-processing.")
+        elif fingerprint and self._carry_over_moved(dirpath, files, current_hash, fingerprint):
+            return
         
         logger.info(f"Processing book group from {dirpath}")
         
-        try:
-            # 1. Identification
-            initial_metadata = self.identifier.identify(dirpath, files)
-            logger.info(f"Initial ID: {initial_metadata}")
+        # One trace per processing run of a book; later organize work joins it
+        with tracing.span("process_book", book=dirpath, new_trace=True, files=len(files)):
+            try:
+                # 1. Identification
+                self._progress(dirpath, "identifying")
+                initial_metadata = self.identifier.identify(dirpath, files)
+                logger.info(f"Initial ID: {initial_metadata}")
             
-            # 2. Metadata Enrichment (API)
-            final_metadata = self.aggregator.enrich(initial_metadata)
-            logger.info(f"Final Metadata: {final_metadata}")
+                # 2. Metadata Enrichment (API)
+                self._progress(dirpath, "enriching")
+                with tracing.span("enrich"):
+                    final_metadata = self._enrich(dirpath, initial_metadata)
+                logger.info(f"Final Metadata: {final_metadata}")
             
-            # Web UI Interception
-            if config.WEB_UI_ENABLED:
-                logger.info("Adding to processing queue for Web UI review")
-                # Add to queue manager (which syncs to history as 'pending')
-                queue_manager.add_item(dirpath, files, final_metadata)
-                return
+                # Web UI Interception
+                if config.WEB_UI_ENABLED:
+                    logger.info("Adding to processing queue for Web UI review")
+                    # Add to queue manager (which syncs to history as 'pending')
+                    queue_manager.add_item(dirpath, files, final_metadata, content_hash=current_hash, fingerprint=fingerprint)
+                    return
 
-            # Confidence Check
-            if final_metadata.confidence < config.MATCH_THRESHOLD_PROBABLE:
-                logger.warning(f"Confidence score {final_metadata.confidence} below threshold. Moving to Manual Intervention.")
-                self.organizer.move_to_manual(dirpath, files, final_metadata)
-                # Mark as processed? Yes, managed manually now.
-                self.history.update_state(dirpath, current_hash, 'processed', files, final_metadata)
-                return
+                # Confidence Check
+                if final_metadata.confidence < config.MATCH_THRESHOLD_PROBABLE:
+                    logger.warning(f"Confidence score {final_metadata.confidence} below threshold. Moving to Manual Intervention.")
+                    self.organizer.move_to_manual(dirpath, files, final_metadata)
+                    # Mark as processed? Yes, managed manually now.
+                    self.history.update_state(dirpath, current_hash, 'processed', files, final_metadata, fingerprint=fingerprint)
+                    return
 
-            # 3. Organization & Move (Async)
-            # Submit to ThreadPool
-            self.executor.submit(self._run_organize, dirpath, files, final_metadata, current_hash)
+                # 3. Organization & Move (Async)
+                # Submit to ThreadPool
+                self.executor.submit(self._run_organize, dirpath, files, final_metadata, current_hash, fingerprint)
             
-        except Exception as e:
-            logger.error(f"Error processing book: {e}", exc_info=True)
-            # Move to manual intervention folder?
+            except Exception as e:
+                logger.error(f"Error processing book: {e}", exc_info=True)
+                self._progress(dirpath, "failed", error=str(e))
+                # Move to manual intervention folder?
+
+    def prefetch_archive(self, peek):
+        """
+        Archive hook: identifies an archive from its first audio member and starts
+        enriching it while it extracts. The returned future resolves to a handler
+        that sends the unextracted archive to manual intervention when that is
+        where the book would end up anyway, or to None.
+        """
+        initial = self.identifier.identify_archive(peek.dest_dir, os.path.join(peek.dest_dir, peek.member), peek.header)
+        logger.info(f"Identified archive {peek.archive} before extraction: {initial}")
+
+        def enrich():
+            with tracing.span("enrich.prefetch", book=peek.dest_dir, new_trace=True):
+                return self.aggregator.enrich(initial.copy())
+
+        enriched = self._prefetch_pool.submit(enrich)
+        with self._prefetch_lock:
+            if len(self._prefetched) >= MAX_PREFETCHED:
+                self._prefetched.pop(next(iter(self._prefetched)))
+            self._prefetched[peek.dest_dir] = (initial, enriched)
+
+        verdict = Future()
+
+        def decide(future):
+            metadata = None if future.exception() else future.result()
+            # Whichever UI is in use: an archive that matches this poorly is not worth
+            # extracting, so it goes to manual intervention as it is
+            manual = metadata is not None and metadata.confidence < config.MATCH_THRESHOLD_PROBABLE
+            verdict.set_result(functools.partial(self._archive_to_manual, peek, metadata) if manual else None)
+
+        enriched.add_done_callback(decide)
+        return verdict
+
+    def _archive_to_manual(self, peek, metadata):
+        with self._prefetch_lock:
+            self._prefetched.pop(peek.dest_dir, None)
+        logger.warning(f"Confidence score {metadata.confidence} below threshold. Moving archive {peek.archive} to Manual Intervention unextracted.")
+        files = [peek.archive]
+        current_hash = self.history.calculate_hash(peek.dest_dir, files)
+        self.organizer.move_to_manual(peek.dest_dir, files, metadata)
+        self.history.update_state(peek.dest_dir, current_hash, 'processed', files, metadata)
+
+    def _enrich(self, dirpath, initial_metadata):
+        # Reuses the enrichment started while the book's archive was extracting,
+        # if the extracted files identified the same way
+        with self._prefetch_lock:
+            prefetched = self._prefetched.pop(dirpath, None)
+        if prefetched:
+            initial, enriched = prefetched
+            if initial == initial_metadata:
+                try:
+                    return enriched.result()
+                except Exception as e:
+                    logger.warning(f"Prefetched enrichment failed for {dirpath}: {e}")
+        return self.aggregator.enrich(initial_metadata)
+
+    def _carry_over_moved(self, dirpath, files, current_hash, fingerprint):
+        """
+        If this content was seen before under a path that no longer exists (the
+        folder was renamed or moved), move its history/queue state to the new path
+        instead of re-identifying and re-organizing it. Returns True if handled.
+        """
+        previous = self.history.find_by_fingerprint(fingerprint, exclude_path=dirpath)
+        if not previous or previous['status'] not in ['pending', 'processed', 'ignored']:
+            return False
+        if os.path.exists(previous['path']):
+            # A second copy rather than a move; process it normally
+            return False
+
+        logger.info(f"{dirpath} has the same content as {previous['path']} ({previous['status']}). Carrying over state.")
+        meta_json = json.loads(previous['metadata']) if previous['metadata'] else None
+
+        if previous['status'] == 'pending':
+            metadata = IdentificationResult(**meta_json) if meta_json else None
+            queue_manager.remove_item(QueueItem.make_id(previous['path']))
+            self.history.remove_state(previous['path'])
+            queue_manager.add_item(dirpath, files, metadata, content_hash=current_hash, fingerprint=fingerprint)
+        else:
+            self.history.update_state(dirpath, current_hash, previous['status'], files, meta_json, fingerprint=fingerprint)
+            self.history.remove_state(previous['path'])
+        return True
 
-    def _run_organize(self, dirpath, files, metadata, current_hash):
+    def _run_organize(self, dirpath, files, metadata, current_hash, fingerprint=None):
         try:
-             self.organizer.organize(dirpath, files, metadata)
+             self._progress(dirpath, "organizing")
+             with tracing.span("run_organize", book=dirpath):
+                 self.organizer.organize(dirpath, files, metadata)
              # Mark as processed
-             self.history.update_state(dirpath, current_hash, 'processed', files, metadata)
+             self.history.update_state(dirpath, current_hash, 'processed', files, metadata, fingerprint=fingerprint)
+             self._progress(dirpath, "processed")
              
              # 4. Notify ABS
              self.notify_abs()
         except Exception as e:
              logger.error(f"Async organization failed for {dirpath}: {e}")
+             self._progress(dirpath, "failed", error=str(e))
 
     def notify_abs(self):
         url = f"{config.ABS_URL}/api/libraries/scan" 
@@ -1,6 +1,7 @@
 import json
 import os
 import logging
+from src import permissions
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,7 @@ class MetadataGenerator:
         filepath = os.path.join(output_dir, "metadata.json")
         try:
             with open(filepath, 'w', encoding='utf-8') as f:
+                permissions.apply_to_fd(f.fileno(), permissions.FILE_MODE, filepath)
                 json.dump(data, f, indent=2, ensure_ascii=False)
             logger.info(f"Generated metadata.json at {filepath}")
         except Exception as e:
@@ -0,0 +1,222 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# Seconds; covers sub-millisecond SQLite writes up to multi-minute ffmpeg runs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in self._values.items()]
+
+    def summary(self):
+        with self._lock:
+            return {",".join(key) or "total": value for key, value in self._values.items()}
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry["counts"][index] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, entry in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, entry["counts"]):
+                    cumulative += count
+                    result.append((f"{self.name}_bucket", key, ("le", _format_value(float(bound))), cumulative))
+                result.append((f"{self.name}_bucket", key, ("le", "+Inf"), entry["count"]))
+                result.append((f"{self.name}_sum", key, None, entry["sum"]))
+                result.append((f"{self.name}_count", key, None, entry["count"]))
+        return result
+
+    def summary(self):
+        with self._lock:
+            return {
+                ",".join(key) or "total": {
+                    "count": entry["count"],
+                    "avg_seconds": round(entry["sum"] / entry["count"], 6) if entry["count"] else None,
+                }
+                for key, entry in self._values.items()
+            }
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], List[Tuple[str, str, dict, float]]]] = []
+
+    def _get_or_create(self, cls, name, help, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self._get_or_create(Counter, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+    def register_collector(self, collector):
+        """
+        collector() -> [(name, help, labels dict, value)] gauges read at scrape time,
+        for values other components already track (queue size, cache hit counts...).
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for sample_name, key, extra, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(metric.label_names, key, extra)} {_format_value(value)}")
+
+        seen = set()
+        for collector in collectors:
+            try:
+                gauges = collector()
+            except Exception:
+                continue
+            for name, help, labels, value in gauges:
+                if value is None:
+                    continue
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {help}")
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.summary() for metric in metrics}
+
+
+registry = Registry()
+
+# Pipeline metrics, shared by the modules that record them
+stability_wait_seconds = registry.histogram(
+    "abs_stability_wait_seconds", "Time from first seeing a file until it is considered stable")
+files_stable_total = registry.counter("abs_files_stable_total", "Files that became stable")
+group_wait_seconds = registry.histogram(
+    "abs_group_wait_seconds", "Time a book group waited in the grouper before processing")
+groups_ready_total = registry.counter("abs_groups_ready_total", "Book groups handed to processing")
+archive_extract_seconds = registry.histogram(
+    "abs_archive_extract_seconds", "Archive extraction time", labels=("format",))
+archive_extract_bytes_total = registry.counter(
+    "abs_archive_extract_bytes_total", "Bytes written by archive extraction", labels=("format",))
+identify_seconds = registry.histogram("abs_identify_seconds", "Identification (tags and filename parsing) time")
+provider_seconds = registry.histogram(
+    "abs_provider_request_seconds", "Metadata provider request latency", labels=("provider", "operation"))
+provider_errors_total = registry.counter(
+    "abs_provider_errors_total", "Failed metadata provider requests", labels=("provider",))
+convert_seconds = registry.histogram("abs_convert_seconds", "ffmpeg conversion time")
+convert_bytes_total = registry.counter("abs_convert_output_bytes_total", "Bytes written by ffmpeg conversions")
+organize_seconds = registry.histogram(
+    "abs_organize_stage_seconds", "Organizer time per stage", labels=("stage",))
+books_organized_total = registry.counter(
+    "abs_books_organized_total", "Books organized", labels=("result",))
+copy_bytes_total = registry.counter(
+    "abs_copy_bytes_total", "Bytes copied into staging", labels=("strategy",))
+history_write_seconds = registry.histogram(
+    "abs_history_write_seconds", "SQLite history write (transaction) time")
+history_rows_written_total = registry.counter("abs_history_rows_written_total", "History rows written")
+cache_requests_total = registry.counter(
+    "abs_cache_requests_total", "Cache lookups", labels=("cache", "result"))
+
+
+def cache_hit_ratios():
+    # Revalidated (304) cover requests count as hits: no image was transferred
+    totals = {}
+    for (cache, result), count in cache_requests_total.items():
+        hits, total = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (count if result in ("hit", "revalidated") else 0), total + count)
+    return {cache: round(hits / total, 4) for cache, (hits, total) in totals.items() if total}
+
+
+def get_stats():
+    """Summary of every metric for /api/status; /metrics has the full histograms."""
+    return {"metrics": registry.summary(), "cache_hit_ratio": cache_hit_ratios()}
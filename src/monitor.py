@@ -1,45 +1,118 @@
 import os
 import time
 import logging
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from src.config import config
+from src import metrics
 
 logger = logging.getLogger(__name__)
 
+# Suffix of directories that are still being written (in-progress archive extractions);
+# their contents appear under the final name in one rename
+EXTRACTING_SUFFIX = ".extracting"
+
+# Archive suffixes that are extracted -> archive format
+ARCHIVE_FORMATS = {
+    '.zip': 'zip',
+    '.tar': 'tar',
+    '.tar.gz': 'gz', '.tgz': 'gz',
+    '.tar.bz2': 'bz2', '.tbz2': 'bz2', '.tbz': 'bz2',
+    '.tar.xz': 'xz', '.txz': 'xz',
+    '.tar.zst': 'zst', '.tzst': 'zst',
+}
+_ARCHIVE_SUFFIXES = tuple(sorted(ARCHIVE_FORMATS, key=len, reverse=True))
+
+def archive_suffix(path):
+    """The archive suffix of path as listed in ARCHIVE_FORMATS ('.tar.gz', not '.gz'), or None."""
+    lower = path.lower()
+    for suffix in _ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix):
+            return suffix
+    return None
+
 class AutoLibrarianHandler(FileSystemEventHandler):
-    def __init__(self, stability_checker):
+    def __init__(self, stability_checker, change_listeners=None):
         self.stability_checker = stability_checker
+        # Called with (path, is_directory) for every change, e.g. to invalidate cached hashes
+        self.change_listeners = change_listeners if change_listeners is not None else []
+
+    def _notify(self, path, is_directory):
+        for listener in self.change_listeners:
+            try:
+                listener(path, is_directory)
+            except Exception as e:
+                logger.error(f"Change listener failed for {path}: {e}")
 
     def on_created(self, event):
+        self._notify(event.src_path, event.is_directory)
         if not event.is_directory:
             self.stability_checker.add_file(event.src_path)
 
     def on_moved(self, event):
+        self._notify(event.src_path, event.is_directory)
+        self._notify(event.dest_path, event.is_directory)
         if not event.is_directory:
             self.stability_checker.add_file(event.dest_path)
             
     # Also listen for modified events to update stability tracker?
     # Usually writes trigger modified events.
     def on_modified(self, event):
+         self._notify(event.src_path, event.is_directory)
          if not event.is_directory:
             self.stability_checker.update_activity(event.src_path)
 
+    def on_deleted(self, event):
+        self._notify(event.src_path, event.is_directory)
+
+class IgnoreList:
+    """
+    Directory trees written by AutoLibrarian itself (e.g. archive extraction).
+    Their files are handed to the grouper directly, so file events under them
+    are not tracked for stability. An entry can be given an expiry to cover
+    events that are delivered after the writes have finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._paths = {}  # directory -> monotonic expiry, or None while in use
+
+    def add(self, path, ttl=None):
+        with self._lock:
+            self._paths[path.rstrip(os.sep)] = time.monotonic() + ttl if ttl is not None else None
+
+    def discard(self, path):
+        with self._lock:
+            self._paths.pop(path.rstrip(os.sep), None)
+
+    def __contains__(self, path):
+        now = time.monotonic()
+        with self._lock:
+            for prefix, expiry in list(self._paths.items()):
+                if expiry is not None and expiry < now:
+                    del self._paths[prefix]
+                elif path == prefix or path.startswith(prefix + os.sep):
+                    return True
+        return False
+
 class StabilityChecker:
-    def __init__(self, process_callback):
+    def __init__(self, process_callback, ignored=None):
         self.process_callback = process_callback
+        self.ignored = ignored if ignored is not None else IgnoreList()
         self.tracked_files = {} # filepath -> {last_size, last_mtime, stable_start_time}
 
     def add_file(self, filepath):
-        if filepath not in self.tracked_files:
+        if filepath not in self.tracked_files and filepath not in self.ignored:
             # Check if extension is allowed before tracking
             ext = os.path.splitext(filepath)[1].lower()
-            if ext in config.ALLOWED_EXTENSIONS or ext == ".zip": # tracking zip for extraction
+            if ext in config.ALLOWED_EXTENSIONS or archive_suffix(filepath): # tracking archives for extraction
                 logger.info(f"Tracking file for stability: {filepath}")
                 self.tracked_files[filepath] = {
                     'last_size': -1,
                     'last_mtime': -1,
-                    'stable_start_time': None
+                    'stable_start_time': None,
+                    'first_seen': time.time()
                 }
     
     def update_activity(self, filepath):
@@ -82,7 +155,9 @@ class StabilityChecker:
                 data['stable_start_time'] = None
 
         for filepath in to_process:
-            del self.tracked_files[filepath]
+            data = self.tracked_files.pop(filepath)
+            metrics.stability_wait_seconds.observe(current_time - data['first_seen'])
+            metrics.files_stable_total.inc()
             logger.info(f"File stable: {filepath}")
             try:
                 self.process_callback(filepath)
@@ -95,13 +170,17 @@ class StabilityChecker:
         }
 
 class Monitor:
-    def __init__(self, path, callback):
+    def __init__(self, path, callback, ignored=None):
         self.path = path
         self.callback = callback
-        self.stability_checker = StabilityChecker(callback)
-        self.handler = AutoLibrarianHandler(self.stability_checker)
+        self.stability_checker = StabilityChecker(callback, ignored)
+        self.change_listeners = []
+        self.handler = AutoLibrarianHandler(self.stability_checker, self.change_listeners)
         self.observer = Observer()
 
+    def add_change_listener(self, listener):
+        self.change_listeners.append(listener)
+
     def start(self):
         logger.info(f"Starting monitor on {self.path}")
         if not os.path.exists(self.path):
@@ -122,6 +201,8 @@ class Monitor:
                 # but StabilityChecker handles extensions.
                 if "__mac" in filepath or ".DS_Store" in filepath: # Basic junk filter
                      continue
+                if EXTRACTING_SUFFIX + os.sep in filepath: # Left over by an interrupted extraction
+                     continue
                 self.stability_checker.add_file(filepath)
 
     def stop(self):
@@ -1,31 +1,115 @@
 import os
 import shutil
 import logging
-import requests
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import mutagen
 from mutagen.easyid3 import EasyID3
 from mutagen.mp4 import MP4, MP4Tags
 from jinja2 import Template
 from src.config import config
 from src.metadata import MetadataGenerator
+from src import permissions
+from src import metrics
+from src import tracing
+from src.profiling import profiler
 
 logger = logging.getLogger(__name__)
 
 from src.converter import AudioConverter
+from src.copier import CopyEngine
+from src.cover_cache import CoverCache
+from src.publish import publish, same_device
+from src.library import MANIFEST_NAME, input_signature, read_manifest, write_manifest
+
+# Files whose tags we rewrite in staging; these must never share an inode with the source
+TAGGED_EXTENSIONS = {'.mp3', '.m4a', '.m4b'}
+
+# Free space reserved in the tag header, so metadata edits are in-place header
+# patches rather than full-file rewrites. MP3s get it as they are copied into
+# staging; mutagen reserves it whenever a save has to grow the tag anyway.
+TAG_PADDING = 64 * 1024
+
+
+def _syncsafe(value):
+    return bytes(((value >> 21) & 0x7f, (value >> 14) & 0x7f, (value >> 7) & 0x7f, value & 0x7f))
+
+
+def padded_id3_head(path, padding=TAG_PADDING):
+    """
+    (data, skip) that replaces the first skip bytes of an MP3 so that its ID3v2
+    tag has at least `padding` free bytes; an untagged file gets an empty tag
+    that is all padding. None if the tag is left alone (enough padding already,
+    or a layout we don't rewrite: ID3v2.2, extended header, footer).
+    """
+    with open(path, 'rb') as f:
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'ID3':
+            return b'ID3\x04\x00\x00' + _syncsafe(padding) + b'\x00' * padding, 0
+        major, flags = header[3], header[5]
+        if major not in (3, 4) or flags & 0x50:
+            return None
+        size = (header[6] & 0x7f) << 21 | (header[7] & 0x7f) << 14 | (header[8] & 0x7f) << 7 | (header[9] & 0x7f)
+        body = f.read(size)
+    free = len(body) - len(body.rstrip(b'\x00'))
+    if len(body) < size or free >= padding:
+        return None
+    extra = padding - free
+    return header[:6] + _syncsafe(size + extra) + body + b'\x00' * extra, 10 + size
+
+
+def _tag_padding(info):
+    # info.padding < 0 means the new tag does not fit in the existing header
+    if info.padding >= 0:
+        return info.padding
+    return TAG_PADDING
 
 class Organizer:
-    def __init__(self):
+    def __init__(self, store=None):
+        # HistoryManager: remembers where each source was last published
+        self.store = store
         self.metadata_generator = MetadataGenerator()
         self.converter = AudioConverter()
+        self.copier = CopyEngine()
+        self.cover_cache = CoverCache()
         # Template for directory structure
         self.dir_template = Template("{{ author }}/{{ series }}/{{ title }}") 
         # Default simple template if series missing: {{ author }}/{{ title }}
         
     def organize(self, dirpath, files, metadata, mode="copy"):
+        try:
+            with metrics.organize_seconds.time(stage="total"), tracing.span("organize", mode=mode), \
+                    profiler.profiled("organize"):
+                result = self._organize(dirpath, files, metadata, mode)
+        except Exception:
+            metrics.books_organized_total.inc(result="failed")
+            raise
+        metrics.books_organized_total.inc(result=result)
+
+    @contextmanager
+    def _stage(self, name):
+        with metrics.organize_seconds.time(stage=name), tracing.span(f"organize.{name}"):
+            yield
+
+    def _organize(self, dirpath, files, metadata, mode):
         logger.info(f"Organizing {metadata.title} by {metadata.author} (Mode: {mode})")
         
         dest_base, rel_path = self.calculate_destination(metadata)
-        staging_dir = os.path.join(config.OUTPUT_DIR, ".staging", rel_path)
+        signature = input_signature(dirpath, files)
+
+        # 0. Incremental update: if this source was already published with the same
+        # inputs, only metadata changed, so skip the copy/encode entirely
+        if not config.DRY_RUN:
+            with self._stage("update_in_place"):
+                previous_dir, manifest = self._find_previous(dirpath, dest_base, signature)
+                updated = previous_dir and self._update_in_place(previous_dir, manifest, dest_base, rel_path, metadata)
+            if updated:
+                self._remember_publication(dirpath, dest_base)
+                if mode == 'move':
+                    self._cleanup_source(dirpath, files)
+                return "updated_in_place"
+
+        staging_dir = self._staging_dir_for(dest_base, rel_path)
         
         # 1. Create Staging Directory
         if config.DRY_RUN:
@@ -33,7 +117,8 @@ class Organizer:
         else:
             if os.path.exists(staging_dir):
                 shutil.rmtree(staging_dir)
-            os.makedirs(staging_dir)
+            # Ownership/mode is applied as each directory and file is created
+            permissions.makedirs(staging_dir)
         
         # 2. Copy/Process Files to Staging
         context = {
@@ -46,27 +131,43 @@ class Organizer:
         if config.CONVERT_TO_M4B and not config.DRY_RUN:
             try:
                 # Merge files into one M4B in the staging directory
-                m4b_path = self.converter.merge_files(files, metadata, staging_dir)
+                with self._stage("convert"):
+                    m4b_path = self.converter.merge_files(files, metadata, staging_dir)
                 if m4b_path:
                     logger.info(f"Converted/Merged to {m4b_path}")
                     conversion_success = True
+                    processed_files.append(os.path.basename(m4b_path))
             except Exception as e:
                 logger.error(f"Conversion failed, falling back to copy: {e}")
         
         if not conversion_success:
             # Fallback or standard copy
+            copy_jobs = []
             for i, filepath in enumerate(sorted(files)):
                 filename = os.path.basename(filepath)
                 ext = os.path.splitext(filename)[1]
                 
                 # Simple rename: Title - 01.mp3 if multi-file, else Title.mp3
-                new_filename = f"{context['title']} - {i+1:02d}{ext}" if len(files) > 1 else f"{context['title']}{ext}"
+                new_filename = self._published_name(context['title'], i, len(files), ext)
+                processed_files.append(new_filename)
                 
                 dest_file = os.path.join(staging_dir, new_filename)
                 if config.DRY_RUN:
                     logger.info(f"[DRY RUN] Would copy {filepath} to {dest_file}")
                 else:
-                    shutil.copy2(filepath, dest_file)
+                    # Hardlinking a file we later tag would modify the source too
+                    job = (filepath, dest_file, ext.lower() not in TAGGED_EXTENSIONS)
+                    if ext.lower() == '.mp3':
+                        # Tag padding is reserved by the copy, so tagging won't rewrite the file
+                        head = padded_id3_head(filepath)
+                        if head:
+                            job += (head,)
+                    copy_jobs.append(job)
+
+            if copy_jobs:
+                with self._stage("copy"):
+                    strategies = self.copier.copy_files(copy_jobs)
+                logger.info(f"Copied {len(strategies)} files to staging ({', '.join(sorted(set(strategies.values())))})")
             
         # 3. Generate metadata.json
         if config.DRY_RUN:
@@ -76,32 +177,42 @@ class Organizer:
         
         # 4. Download Cover Art
         if hasattr(metadata, 'cover_url') and metadata.cover_url:
-            self._download_cover(metadata.cover_url, staging_dir)
+            with self._stage("cover"):
+                self._download_cover(metadata.cover_url, staging_dir)
             
-        # 5. Apply Permissions
-        self._apply_permissions(staging_dir)
-        
-        # 6. Write Tags
-        self._write_tags(staging_dir, metadata)
+        # 5. Write Tags
+        with self._stage("tags"):
+            self._write_tags(staging_dir, metadata)
 
-        # 7. Move Staging to Final Destination
+        # 6. Move Staging to Final Destination
         final_dest = dest_base
+        if not config.DRY_RUN:
+            write_manifest(staging_dir, {
+                "source_dir": dirpath,
+                "inputs": signature,
+                # What was asked for and what was produced: a failed conversion falls back to copying
+                "requested_format": self._requested_format(),
+                "format": "m4b" if conversion_success else "copy",
+                "files": processed_files,
+            })
         
         if config.DRY_RUN:
              logger.info(f"[DRY RUN] Would move {staging_dir} to {final_dest}")
              if mode == 'move':
                  logger.info(f"[DRY RUN] Would remove original files from {dirpath}")
+             return "dry_run"
         else:
-            os.makedirs(os.path.dirname(final_dest), exist_ok=True)
             try:
-                 if os.path.exists(final_dest):
-                     # If exists, merge/overwrite
-                     shutil.rmtree(final_dest) 
-                 
-                 os.rename(staging_dir, final_dest)
+                 # Our own previous output is updated file by file (only changed files are replaced);
+                 # anything else is swapped atomically. Streams across devices if needed.
+                 incremental = read_manifest(final_dest) is not None
+                 with self._stage("publish"):
+                     publish(staging_dir, final_dest, self.copier, incremental=incremental)
                  logger.info(f"Successfully moved processed files from staging to {final_dest}")
+                 self._remove_empty_staging(staging_dir)
+                 self._remember_publication(dirpath, final_dest)
                  
-                 # 8. Cleanup Original Files (If Move Mode)
+                 # 7. Cleanup Original Files (If Move Mode)
                  if mode == 'move':
                      self._cleanup_source(dirpath, files)
                  else:
@@ -110,6 +221,151 @@ class Organizer:
             except Exception as e:
                 logger.error(f"Failed to move to final destination: {e}")
                 raise e
+            return "published"
+
+    def _published_name(self, title, index, count, ext):
+        return f"{title} - {index+1:02d}{ext}" if count > 1 else f"{title}{ext}"
+
+    @staticmethod
+    def _requested_format():
+        return "m4b" if config.CONVERT_TO_M4B else "copy"
+
+    def _remember_publication(self, dirpath, book_dir):
+        if self.store:
+            self.store.set_library_dir(dirpath, book_dir)
+
+    def _find_previous(self, dirpath, dest_base, signature):
+        """
+        Returns (book_dir, manifest) for an earlier publication of dirpath whose
+        inputs and conversion setting still match, or (None, None). A book whose
+        conversion fell back to a copy is reused as long as the setting is unchanged.
+        """
+        # The last publication is found even if the title, and with it the path, changed
+        candidates = [self.store.get_library_dir(dirpath) if self.store else None, dest_base]
+        for candidate in candidates:
+            if not candidate or not os.path.isdir(candidate):
+                continue
+            manifest = read_manifest(candidate)
+            if not manifest or manifest.get("source_dir") != dirpath:
+                continue
+            if manifest.get("inputs") != signature:
+                logger.info(f"Inputs changed since {candidate} was published; rebuilding")
+                continue
+            # Manifests from before formats were recorded only have "converted"
+            requested = manifest.get("requested_format") or ("m4b" if manifest.get("converted") else "copy")
+            if requested != self._requested_format():
+                continue
+            if not all(os.path.exists(os.path.join(candidate, name)) for name in manifest.get("files", [])):
+                continue
+            return candidate, manifest
+        return None, None
+
+    def _update_in_place(self, previous_dir, manifest, dest_base, rel_path, metadata):
+        """
+        Applies a metadata-only change to an already published book without
+        re-encoding it: the book is cloned into staging (reflinks where the
+        filesystem supports them), renamed and retagged there, then published over
+        dest_base like a full organize. The live book is never modified, so a
+        failure leaves it as it was. Returns False if the caller should fall back
+        to a full organize.
+        """
+        relocate = os.path.abspath(previous_dir) != os.path.abspath(dest_base)
+        if relocate and os.path.exists(dest_base):
+            return False
+        logger.info(f"Inputs unchanged since last organize; updating {previous_dir} without re-encoding")
+
+        title = self._sanitize(metadata.title or "Unknown Title")
+        names = manifest.get("files", [])
+        renames = {name: self._published_name(title, i, len(names), os.path.splitext(name)[1])
+                   for i, name in enumerate(names)}
+        # Regenerated below; a cover is only kept if there is no new one to fetch
+        regenerated = {MANIFEST_NAME, "metadata.json"}
+        if getattr(metadata, 'cover_url', None):
+            regenerated.add("cover.jpg")
+
+        staging_dir = self._staging_dir_for(dest_base, rel_path)
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+        try:
+            permissions.makedirs(staging_dir)
+            copy_jobs = []
+            for root, dirs, files in os.walk(previous_dir):
+                rel_root = os.path.relpath(root, previous_dir)
+                for filename in files:
+                    rel_name = os.path.normpath(os.path.join(rel_root, filename))
+                    if rel_name in regenerated:
+                        continue
+                    target = os.path.join(staging_dir, renames.get(rel_name, rel_name))
+                    permissions.makedirs(os.path.dirname(target))
+                    # Tagged files must not share an inode with the live book
+                    ext = os.path.splitext(filename)[1].lower()
+                    copy_jobs.append((os.path.join(root, filename), target, ext not in TAGGED_EXTENSIONS))
+            with self._stage("copy"):
+                self.copier.copy_files(copy_jobs)
+
+            self.metadata_generator.generate_json(metadata, staging_dir)
+            if "cover.jpg" in regenerated:
+                self._download_cover(metadata.cover_url, staging_dir)
+            self._write_tags(staging_dir, metadata)
+            write_manifest(staging_dir, dict(manifest, files=[renames[name] for name in names]))
+
+            with self._stage("publish"):
+                publish(staging_dir, dest_base, self.copier)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            self._remove_empty_staging(staging_dir)
+            raise
+        self._remove_empty_staging(staging_dir)
+
+        if relocate:
+            # The new copy is live; the old location is dropped
+            shutil.rmtree(previous_dir, ignore_errors=True)
+            self._prune_empty_dirs(os.path.dirname(previous_dir))
+            logger.info(f"Relocated {previous_dir} to {dest_base}")
+        return True
+
+    def _prune_empty_dirs(self, directory):
+        # Remove empty Author/Series folders left behind by a relocation, stopping at OUTPUT_DIR
+        output_root = os.path.abspath(config.OUTPUT_DIR)
+        directory = os.path.abspath(directory)
+        while directory.startswith(output_root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def _staging_roots(self):
+        return [os.path.join(config.OUTPUT_DIR, ".staging")] + list(config.STAGING_DIRS)
+
+    def _staging_dir_for(self, final_dest, rel_path):
+        """
+        Stages under the first staging root (OUTPUT_DIR/.staging, then STAGING_DIRS)
+        on the destination's device, so the publish is a rename. Staging never goes
+        inside the library folders, where Audiobookshelf would scan it; with no root
+        on that device the publish streams the book across instead.
+        """
+        roots = self._staging_roots()
+        if not config.DRY_RUN:
+            parent = os.path.dirname(final_dest)
+            permissions.makedirs(parent)
+            for root in roots:
+                if same_device(root, parent):
+                    return os.path.join(root, rel_path)
+            logger.warning(f"No staging directory on the same device as {parent}; "
+                           f"add one to STAGING_DIRS to avoid copying across devices")
+        return os.path.join(roots[0], rel_path)
+
+    def _remove_empty_staging(self, staging_dir):
+        # Prune now-empty staging parents (e.g. .staging/Author/Series) up to their staging root
+        roots = {os.path.abspath(root) for root in self._staging_roots()}
+        parent = os.path.dirname(os.path.abspath(staging_dir))
+        while parent not in roots and parent != os.path.dirname(parent):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                return
+            parent = os.path.dirname(parent)
 
     def calculate_destination(self, metadata):
         # 1. Determine Destination Path
@@ -141,6 +397,19 @@ class Organizer:
                  if os.path.exists(f):
                      os.remove(f)
              
+             # Disc/part subfolders of the book (deepest first), if now empty
+             subdirs = set()
+             for f in files:
+                 parent = os.path.dirname(f)
+                 while parent.startswith(dirpath + os.sep):
+                     subdirs.add(parent)
+                     parent = os.path.dirname(parent)
+             for subdir in sorted(subdirs, key=len, reverse=True):
+                 try:
+                     os.rmdir(subdir)
+                 except OSError:
+                     pass
+
              # Attempt to remove the directory if empty
              # If dirpath differs from specific input root check? 
              # We should only remove if it's a subdirectory of input, not input root itself.
@@ -164,41 +433,26 @@ class Organizer:
             return
             
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            with open(os.path.join(dest_dir, "cover.jpg"), 'wb') as f:
-                f.write(response.content)
-            logger.info("Downloaded cover art")
+            cached_path, entry = self.cover_cache.fetch(url)
+            if not cached_path:
+                return
+            dest_file = os.path.join(dest_dir, "cover.jpg")
+            if os.path.exists(dest_file):
+                os.remove(dest_file)
+            blob = self.cover_cache.hold(entry)
+            try:
+                # Never hardlink: the cache blob is shared between books
+                self.copier.copy_file(cached_path, dest_file, allow_hardlink=False)
+            finally:
+                self.cover_cache.release(blob)
+            logger.info("Copied cover art from cache")
         except Exception as e:
             logger.error(f"Failed to download cover: {e}")
 
-    def _apply_permissions(self, directory):
-        if config.DRY_RUN:
-            logger.info(f"[DRY RUN] Would apply permissions {config.PUID}:{config.PGID} to {directory}")
-            return
-
-        uid = config.PUID
-        gid = config.PGID
-        logger.info(f"Applying permissions {uid}:{gid} to {directory}")
-        try:
-            for root, dirs, files in os.walk(directory):
-                os.chown(root, uid, gid)
-                os.chmod(root, 0o775)
-                for f in files:
-                    filepath = os.path.join(root, f)
-                    os.chown(filepath, uid, gid)
-                    os.chmod(filepath, 0o664)
-            # Apply to the directory itself if not covered by walk (it usually is if we walk it)
-            os.chown(directory, uid, gid)
-            os.chmod(directory, 0o775)
-        except Exception as e:
-            logger.error(f"Failed to apply permissions: {e}")
-
     def move_to_manual(self, dirpath, files, metadata):
         manual_dir = os.path.join(config.OUTPUT_DIR, "Manual_Intervention")
         if not config.DRY_RUN:
-            if not os.path.exists(manual_dir):
-                os.makedirs(manual_dir)
+            permissions.makedirs(manual_dir)
             
         # Move source folder to manual dir
         dest = os.path.join(manual_dir, os.path.basename(dirpath))
@@ -219,14 +473,18 @@ class Organizer:
              if os.path.exists(dest):
                   shutil.rmtree(dest)
              
-             # If dirpath is not root input
-             if os.path.abspath(dirpath) != os.path.abspath(config.INPUT_DIR):
+             # If dirpath is not root input (or doesn't exist, for an archive that was never extracted)
+             if os.path.isdir(dirpath) and os.path.abspath(dirpath) != os.path.abspath(config.INPUT_DIR):
                  shutil.move(dirpath, dest)
+                 # Moved, not created by us, so ownership has to be applied afterwards
+                 permissions.apply_to_tree(dest)
              else:
                  # Move individual files
-                 os.makedirs(dest, exist_ok=True)
+                 permissions.makedirs(dest)
                  for f in files:
-                     shutil.move(f, os.path.join(dest, os.path.basename(f)))
+                     target = os.path.join(dest, os.path.basename(f))
+                     shutil.move(f, target)
+                     permissions.apply_to_path(target, permissions.FILE_MODE)
                      
              # Write metadata.json with what we found anyway to help
              self.metadata_generator.generate_json(metadata, dest)
@@ -240,42 +498,70 @@ class Organizer:
              return
 
         logger.info(f"Writing tags to files in {directory}")
+        targets = []
         for root, dirs, files in os.walk(directory):
             for filename in files:
-                filepath = os.path.join(root, filename)
-                ext = os.path.splitext(filename)[1].lower()
-                
+                if os.path.splitext(filename)[1].lower() in TAGGED_EXTENSIONS:
+                    targets.append(os.path.join(root, filename))
+
+        if not targets:
+            return
+
+        # Saves are I/O bound, so tag the files of a group in parallel
+        with ThreadPoolExecutor(max_workers=max(1, min(config.TAG_WORKERS, len(targets)))) as pool:
+            results = list(pool.map(lambda f: self._tag_file(f, metadata), targets))
+
+        logger.info(f"Tags written: {results.count('written')}, already up to date: {results.count('skipped')}, failed: {results.count(None)}")
+
+    def _tag_file(self, filepath, metadata):
+        """Returns 'written', 'skipped' (tags already match) or None on failure."""
+        ext = os.path.splitext(filepath)[1].lower()
+        try:
+            if ext == '.mp3':
                 try:
-                    if ext == '.mp3':
-                        try:
-                            audio = EasyID3(filepath)
-                        except mutagen.id3.ID3NoHeaderError:
-                            # Create a new tag and verify it's saved
-                            audio = EasyID3()
-                            audio.save(filepath, v2_version=3)
-                            # Reload so valid filename is associated
-                            audio = EasyID3(filepath)
-                            
-                        audio['title'] = metadata.title
-                        audio['artist'] = metadata.author
-                        if metadata.year:
-                            audio['date'] = metadata.year
-                        audio.save()
-                        
-                    elif ext in ['.m4b', '.m4a']:
-                        audio = MP4(filepath)
-                        # Mutagen MP4 tags are complex, using standard keys
-                        if audio.tags is None:
-                            audio.add_tags()
-                        
-                        audio.tags['\xa9nam'] = metadata.title # Title
-                        audio.tags['\xa9ART'] = metadata.author # Artist
-                        audio.tags['\xa9alb'] = metadata.title # Album (often same as title for Audiobooks)
-                        if metadata.year:
-                            audio.tags['\xa9day'] = metadata.year
-                        if hasattr(metadata, 'description') and metadata.description:
-                            audio.tags['desc'] = metadata.description
-                        
-                        audio.save()
-                except Exception as e:
-                    logger.warning(f"Failed to write tags for {filepath}: {e}")
+                    audio = EasyID3(filepath)
+                except mutagen.id3.ID3NoHeaderError:
+                    # No tag yet; it is created (with padding) by the single save below
+                    audio = EasyID3()
+
+                target = {'title': metadata.title, 'artist': metadata.author}
+                if metadata.year:
+                    target['date'] = metadata.year
+
+                if audio.filename and all(audio.get(k) == [v] for k, v in target.items() if v):
+                    return 'skipped'
+
+                for k, v in target.items():
+                    if v:
+                        audio[k] = v
+                audio.save(filepath, padding=_tag_padding)
+
+            elif ext in ['.m4b', '.m4a']:
+                audio = MP4(filepath)
+                # Mutagen MP4 tags are complex, using standard keys
+                if audio.tags is None:
+                    audio.add_tags()
+
+                target = {
+                    '\xa9nam': metadata.title, # Title
+                    '\xa9ART': metadata.author, # Artist
+                    '\xa9alb': metadata.title, # Album (often same as title for Audiobooks)
+                }
+                if metadata.year:
+                    target['\xa9day'] = metadata.year
+                if hasattr(metadata, 'description') and metadata.description:
+                    target['desc'] = metadata.description
+
+                if all(audio.tags.get(k) == [v] for k, v in target.items() if v):
+                    return 'skipped'
+
+                for k, v in target.items():
+                    if v:
+                        audio.tags[k] = v
+                audio.save(padding=_tag_padding)
+            else:
+                return 'skipped'
+            return 'written'
+        except Exception as e:
+            logger.warning(f"Failed to write tags for {filepath}: {e}")
+            return None
@@ -0,0 +1,80 @@
+import os
+import logging
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+FILE_MODE = 0o664
+DIR_MODE = 0o775
+
+_warned = False
+
+
+def _report(path, e):
+    # Not running as root (or PUID/PGID unmapped): warn once instead of per file
+    global _warned
+    if not _warned:
+        logger.warning(f"Failed to apply permissions {config.PUID}:{config.PGID} to {path}: {e}")
+        _warned = True
+    else:
+        logger.debug(f"Failed to apply permissions to {path}: {e}")
+
+
+def apply_to_fd(fd, mode=FILE_MODE, path=None):
+    """Sets ownership and mode on an open file descriptor (no extra path lookups)."""
+    if config.DRY_RUN:
+        return
+    try:
+        os.fchown(fd, config.PUID, config.PGID)
+    except OSError as e:
+        _report(path or fd, e)
+    try:
+        os.fchmod(fd, mode)
+    except OSError as e:
+        _report(path or fd, e)
+
+
+def apply_to_path(path, mode=None):
+    """For files created by external processes (ffmpeg) or moved rather than written."""
+    if config.DRY_RUN:
+        return
+    if mode is None:
+        mode = DIR_MODE if os.path.isdir(path) else FILE_MODE
+    try:
+        os.chown(path, config.PUID, config.PGID)
+        os.chmod(path, mode)
+    except OSError as e:
+        _report(path, e)
+
+
+def makedirs(path):
+    """os.makedirs(exist_ok=True) that applies ownership and mode to every directory it creates."""
+    path = os.path.abspath(path)
+    missing = []
+    while not os.path.isdir(path):
+        missing.append(path)
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+
+    for directory in reversed(missing):
+        try:
+            os.mkdir(directory, DIR_MODE)
+        except FileExistsError:
+            continue
+        apply_to_path(directory, DIR_MODE)
+
+
+def apply_to_tree(directory):
+    """
+    Walks a tree that was moved into place rather than created by us
+    (Manual_Intervention). Everything the organizer writes itself gets
+    permissions at creation time instead.
+    """
+    if config.DRY_RUN:
+        return
+    for root, dirs, files in os.walk(directory):
+        apply_to_path(root, DIR_MODE)
+        for f in files:
+            apply_to_path(os.path.join(root, f), FILE_MODE)
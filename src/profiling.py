@@ -0,0 +1,226 @@
+import io
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+# Bounds for API-supplied parameters
+MAX_SAMPLE_SECONDS = 600
+MIN_SAMPLE_INTERVAL = 0.001
+MAX_PROFILED_CALLS = 1000
+
+
+def _thread_group(name: str) -> str:
+    # "ThreadPoolExecutor-0_3" and "job-worker-1" are reported per pool, not per thread
+    return re.sub(r"[-_]?\d+(_\d+)?$", "", name) or name
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Profiler:
+    """
+    On-demand profiling of a running instance.
+
+    - Sampling: a background thread snapshots every thread's stack at a fixed
+      interval for N seconds and writes collapsed stacks (flamegraph.pl,
+      speedscope) grouped by thread pool.
+    - cProfile: wraps the next K calls of a hot path (process_book, organize)
+      and writes a combined .pstats file.
+
+    When neither is active the only cost is one attribute check per hot-path call.
+    """
+
+    TARGETS = ("process_book", "organize")
+
+    def __init__(self, output_dir: Optional[str] = None):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._sampling: Optional[Dict] = None
+        # target -> calls left to profile; empty when off (checked on every call)
+        self._armed: Dict[str, int] = {}
+        self._cprofile = None
+        self._cprofile_meta: Optional[Dict] = None
+        # cProfile supports one active profiler at a time
+        self._cprofile_lock = threading.Lock()
+
+    @property
+    def directory(self) -> str:
+        directory = self.output_dir or config.PROFILE_DIR or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profiles")
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    # Sampling
+
+    def start_sampling(self, seconds: float, interval: float = 0.01) -> Dict:
+        seconds = min(max(seconds, 0.1), MAX_SAMPLE_SECONDS)
+        interval = max(interval, MIN_SAMPLE_INTERVAL)
+        with self._lock:
+            if self._sampler and self._sampler.is_alive():
+                raise RuntimeError("A sampling session is already running")
+            name = time.strftime("sample-%Y%m%d-%H%M%S") + ".collapsed"
+            self._sampling = {"name": name, "seconds": seconds, "interval": interval, "started": time.time()}
+            self._sampler = threading.Thread(target=self._sample, args=(name, seconds, interval),
+                                             name="profiler-sampler", daemon=True)
+            self._sampler.start()
+        logger.info(f"Sampling all threads every {interval * 1000:.1f}ms for {seconds}s")
+        return dict(self._sampling)
+
+    def _sample(self, name, seconds, interval):
+        stacks = Counter()
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        samples = 0
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(_thread_group(names.get(thread_id, str(thread_id))))
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(interval)
+
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote {samples} samples to {path}")
+        with self._lock:
+            self._sampling = None
+
+    # cProfile
+
+    def profile_next(self, calls: int, targets=None) -> Dict:
+        targets = [t for t in (targets or self.TARGETS) if t in self.TARGETS]
+        if not targets:
+            raise ValueError(f"Unknown target; expected one of {', '.join(self.TARGETS)}")
+        calls = min(max(int(calls), 1), MAX_PROFILED_CALLS)
+        with self._lock:
+            if self._armed:
+                raise RuntimeError("A cProfile session is already armed")
+            self._cprofile = cProfile.Profile()
+            name = time.strftime("cprofile-%Y%m%d-%H%M%S") + ".pstats"
+            self._cprofile_meta = {"name": name, "targets": targets, "calls": calls, "profiled": 0}
+            self._armed = {target: calls for target in targets}
+        logger.info(f"Profiling the next {calls} calls of {', '.join(targets)}")
+        return dict(self._cprofile_meta)
+
+    @contextmanager
+    def profiled(self, target: str):
+        """Wraps a hot-path call; profiles it if a cProfile session is armed for target."""
+        if not self._armed or not self._claim(target):
+            yield
+            return
+        try:
+            self._cprofile.enable()
+            try:
+                yield
+            finally:
+                self._cprofile.disable()
+        finally:
+            try:
+                self._finish_call(target)
+            finally:
+                self._cprofile_lock.release()
+
+    def _claim(self, target) -> bool:
+        # Calls that overlap a profiled call run unprofiled rather than waiting
+        if not self._cprofile_lock.acquire(blocking=False):
+            return False
+        with self._lock:
+            if self._armed.get(target, 0) <= 0:
+                self._cprofile_lock.release()
+                return False
+            self._armed[target] -= 1
+            return True
+
+    def _finish_call(self, target):
+        # Runs under _cprofile_lock, like stop_cprofile's dump, so a session is written once
+        with self._lock:
+            self._cprofile_meta["profiled"] += 1
+            if any(self._armed.values()):
+                return
+        self._write_session()
+
+    def stop_cprofile(self) -> Dict:
+        """
+        Ends the armed session early (e.g. a target that never runs) and writes the
+        calls profiled so far. A call being profiled right now is included.
+        """
+        with self._lock:
+            if not self._cprofile_meta or not any(self._armed.values()):
+                raise RuntimeError("No cProfile session is armed")
+            meta = dict(self._cprofile_meta)
+            self._armed = {target: 0 for target in self._armed}
+        # Busy: the call in flight sees nothing left armed and writes the session itself
+        if self._cprofile_lock.acquire(blocking=False):
+            try:
+                self._write_session()
+            finally:
+                self._cprofile_lock.release()
+        logger.info(f"Stopped cProfile session {meta['name']}")
+        return meta
+
+    def _write_session(self):
+        with self._lock:
+            profile, meta = self._cprofile, self._cprofile_meta
+            self._armed, self._cprofile, self._cprofile_meta = {}, None, None
+        if meta is None:
+            return
+        path = os.path.join(self.directory, meta["name"])
+        profile.dump_stats(path)
+        logger.info(f"Wrote cProfile results for {meta['profiled']} calls to {path}")
+
+    # Results
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return {
+                "sampling": dict(self._sampling) if self._sampling else None,
+                "cprofile": dict(self._cprofile_meta, remaining=dict(self._armed)) if self._cprofile_meta else None,
+                "results": self.list_results(),
+            }
+
+    def list_results(self) -> List[Dict]:
+        directory = self.directory
+        results = []
+        for name in sorted(os.listdir(directory), reverse=True):
+            if name.endswith((".collapsed", ".pstats")):
+                stat = os.stat(os.path.join(directory, name))
+                results.append({"name": name, "size": stat.st_size, "created": stat.st_mtime})
+        return results
+
+    def result_path(self, name: str) -> Optional[str]:
+        # Only plain file names from list_results(); no path traversal
+        if os.path.basename(name) != name or not name.endswith((".collapsed", ".pstats")):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def pstats_text(self, path: str, sort: str = "cumulative", limit: int = 50) -> str:
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+profiler = Profiler()
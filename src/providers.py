@@ -1,19 +1,32 @@
 import requests
 import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 from src.identifier import IdentificationResult
 from src.config import config
+from src import metrics
+from src import tracing
 from thefuzz import fuzz
 
 logger = logging.getLogger(__name__)
 
 class MetadataProvider:
+    @property
+    def name(self):
+        return self.__class__.__name__
+
     def search(self, query, author=None):
         raise NotImplementedError
 
+    def _failed(self, message):
+        metrics.provider_errors_total.inc(provider=self.name)
+        logger.error(message)
+
 class OpenLibraryProvider(MetadataProvider):
     def search(self, query, author=None):
         logger.info(f"Searching OpenLibrary for: {query}, author: {author}")
-        base_url = "https://openlibrary.org/search.json"
+        base_url = f"{config.OPENLIBRARY_URL}/search.json"
         params = {'q': query}
         if author:
             params['author'] = author
@@ -29,7 +42,7 @@ class OpenLibraryProvider(MetadataProvider):
                     results.append(self._parse_doc(doc))
             return results
         except Exception as e:
-            logger.error(f"OpenLibrary search failed: {e}")
+            self._failed(f"OpenLibrary search failed: {e}")
             return []
 
     def _parse_doc(self, doc):
@@ -50,7 +63,7 @@ class OpenLibraryProvider(MetadataProvider):
 class GoogleBooksProvider(MetadataProvider):
     def search(self, query, author=None):
         logger.info(f"Searching Google Books for: {query}, author: {author}")
-        base_url = "https://www.googleapis.com/books/v1/volumes"
+        base_url = f"{config.GOOGLE_BOOKS_URL}/volumes"
         q = query
         if author:
             q += f"+inauthor:{author}"
@@ -68,7 +81,7 @@ class GoogleBooksProvider(MetadataProvider):
                     results.append(self._parse_volume(item))
             return results
         except Exception as e:
-            logger.error(f"Google Books search failed: {e}")
+            self._failed(f"Google Books search failed: {e}")
             return []
 
     def _parse_volume(self, item):
@@ -101,7 +114,7 @@ class GoogleBooksProvider(MetadataProvider):
 class AudibleProvider(MetadataProvider):
     def search(self, query, author=None):
         logger.info(f"Searching Audible for: {query}, author: {author}")
-        base_url = "https://api.audible.com/1.0/catalog/products"
+        base_url = f"{config.AUDIBLE_API_URL}/catalog/products"
         
         q = query
         if author:
@@ -125,7 +138,7 @@ class AudibleProvider(MetadataProvider):
                     results.append(self._parse_product(item))
             return results
         except Exception as e:
-            logger.error(f"Audible search failed: {e}")
+            self._failed(f"Audible search failed: {e}")
             return []
 
     def _parse_product(self, item):
@@ -175,7 +188,7 @@ class AudibleProvider(MetadataProvider):
 
     def get_by_id(self, asin):
         logger.info(f"Looking up Audible ASIN: {asin}")
-        base_url = f"https://api.audible.com/1.0/catalog/products/{asin}"
+        base_url = f"{config.AUDIBLE_API_URL}/catalog/products/{asin}"
         
         params = {
             "response_groups": "media,product_attrs,product_desc,product_extended_attrs,series,contributors"
@@ -194,7 +207,7 @@ class AudibleProvider(MetadataProvider):
                 return res
             return None
         except Exception as e:
-            logger.error(f"Audible ID lookup failed: {e}")
+            self._failed(f"Audible ID lookup failed: {e}")
             return None
 
 class AudnexusProvider(MetadataProvider):
@@ -216,7 +229,7 @@ class AudnexusProvider(MetadataProvider):
             
             return self._parse_book(data)
         except Exception as e:
-            logger.error(f"Audnexus ID lookup failed: {e}")
+            self._failed(f"Audnexus ID lookup failed: {e}")
             return None
 
     def _parse_book(self, data):
@@ -262,6 +275,10 @@ class MetadataAggregator:
         if 'audnexus' in config.METADATA_PROVIDERS or 'audible' in config.METADATA_PROVIDERS:
             # Add Audnexus if audible is enabled, as it enhances it
             self.providers.append(AudnexusProvider())
+        # Shared across searches (threads start lazily); a provider that overruns
+        # the search deadline finishes in the background
+        self._search_pool = ThreadPoolExecutor(max_workers=max(2, 2 * len(self.providers)),
+                                               thread_name_prefix="search")
             
     def enrich(self, initial_result):
         # Use initial result (from filename/tags) to query providers
@@ -276,17 +293,21 @@ class MetadataAggregator:
         highest_score = 0
         
         for provider in self.providers:
-            results = provider.search(query, author)
+            results = self._call(provider, "search", query, author)
             
             for res in results:
                 # Calculate match score
-                score = self._calculate_score(initial_result, res)
+                score = int(self._calculate_score(initial_result, res))
                 res.confidence = score
                 
                 if score > highest_score:
                     highest_score = score
                     best_match = self._merge(best_match, res)
-        
+
+        if highest_score:
+            # The merged result carries the score of its best provider match, not the
+            # confidence of the initial guess; main compares it to MATCH_THRESHOLD_PROBABLE
+            best_match.confidence = highest_score
         return best_match
 
     def _calculate_score(self, target, candidate):
@@ -325,8 +346,104 @@ class MetadataAggregator:
             
         return base
 
+    def _call(self, provider, operation, *args):
+        with metrics.provider_seconds.time(provider=provider.name, operation=operation), \
+                tracing.span(f"provider.{operation}", provider=provider.name):
+            return getattr(provider, operation)(*args)
+
     def get_by_id(self, provider_name, identifier):
         for provider in self.providers:
             if provider.__class__.__name__ == provider_name and hasattr(provider, 'get_by_id'):
-                return provider.get_by_id(identifier)
+                return self._call(provider, "get_by_id", identifier)
         return None
+
+    def search_stream(self, query, author=None, audible_id=None, target=None, deadline=None):
+        """
+        Queries every provider concurrently and yields events as they answer:
+        {"type": "candidate"|"update", "key", "provider", "candidate"} and finally
+        {"type": "done", "timed_out", "elapsed"}. Candidates are scored against
+        target (or the query) and collapsed across providers by ASIN, ISBN or
+        normalized title/author; "update" re-sends a candidate that a later
+        provider merged into. Stops waiting after `deadline` seconds.
+        """
+        deadline = config.SEARCH_DEADLINE if deadline is None else deadline
+        target = target if target and target.title else IdentificationResult(title=query, author=author)
+        start = time.monotonic()
+
+        futures = {}
+        if audible_id:
+            futures[self._search_pool.submit(tracing.wrap(self.get_by_id), "AudibleProvider", audible_id)] = "AudibleProvider"
+        for provider in self.providers:
+            futures[self._search_pool.submit(tracing.wrap(self._call), provider, "search", query, author)] = provider.name
+
+        candidates = {}  # candidate id -> (result, provider)
+        key_index = {}   # dedup key -> candidate id
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                provider_name = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logger.error(f"Provider error: {e}")
+                    continue
+                if results is None:
+                    continue
+                if not isinstance(results, list):
+                    # get_by_id returns a single exact match
+                    results = [results]
+                    exact = True
+                else:
+                    exact = False
+
+                for res in results:
+                    if not res or not res.title:
+                        continue
+                    res.confidence = 100 if exact else int(self._calculate_score(target, res))
+                    keys = self._dedup_keys(res)
+                    existing = next((key_index[k] for k in keys if k in key_index), None)
+                    if existing is None:
+                        cid = str(len(candidates))
+                        candidates[cid] = res
+                        event_type = "candidate"
+                    else:
+                        cid = existing
+                        candidates[cid] = self._combine(candidates[cid], res)
+                        event_type = "update"
+                    for k in keys:
+                        key_index.setdefault(k, cid)
+                    yield {"type": event_type, "key": cid, "provider": provider_name,
+                           "candidate": candidates[cid].model_dump()}
+        except FuturesTimeout:
+            pass
+
+        timed_out = sorted({name for future, name in futures.items() if not future.done()})
+        if timed_out:
+            logger.warning(f"Search deadline of {deadline}s reached; no answer from {', '.join(timed_out)}")
+        yield {"type": "done", "timed_out": timed_out, "elapsed": round(time.monotonic() - start, 3)}
+
+    @staticmethod
+    def _normalize(text):
+        words = re.sub(r"[^\w\s]", " ", (text or "").lower()).split()
+        if words and words[0] in ("the", "a", "an"):
+            words = words[1:]
+        return " ".join(words)
+
+    def _dedup_keys(self, res):
+        keys = []
+        if res.asin:
+            keys.append(f"asin:{res.asin.upper()}")
+        if res.isbn:
+            keys.append(f"isbn:{re.sub(r'[^0-9Xx]', '', res.isbn).upper()}")
+        # Word order ignored, so "Weir, Andy" and "Andy Weir" collapse too
+        author = " ".join(sorted(self._normalize(res.author).split()))
+        keys.append(f"title:{self._normalize(res.title)}|{author}")
+        return keys
+
+    def _combine(self, current, new):
+        """Keeps the better-scored candidate and fills its gaps from the other."""
+        best, other = (new, current) if new.confidence > current.confidence else (current, new)
+        for field, value in other.model_dump().items():
+            if value and not getattr(best, field, None):
+                setattr(best, field, value)
+        return best
+
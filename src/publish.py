@@ -0,0 +1,173 @@
+import os
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import shutil
+import logging
+import uuid
+from src import permissions
+
+logger = logging.getLogger(__name__)
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 1 << 1
+
+_renameat2 = None
+if os.name == "posix":
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        _renameat2 = getattr(_libc, "renameat2", None)
+        if _renameat2 is not None:
+            _renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+            _renameat2.restype = ctypes.c_int
+    except OSError:
+        _renameat2 = None
+
+
+def device_of(path):
+    """Returns st_dev of path, or of its nearest existing ancestor."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return os.stat(path).st_dev
+
+
+def same_device(a, b):
+    return device_of(a) == device_of(b)
+
+
+def rename_exchange(src, dst):
+    """
+    Atomically swaps src and dst (both must exist). Raises OSError if the
+    platform or filesystem does not support RENAME_EXCHANGE.
+    """
+    if _renameat2 is None:
+        raise OSError(errno.ENOSYS, "renameat2 not available")
+    res = _renameat2(AT_FDCWD, os.fsencode(src), AT_FDCWD, os.fsencode(dst), RENAME_EXCHANGE)
+    if res != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), src)
+
+
+def _file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            hasher.update(chunk)
+    return hasher.digest()
+
+
+def files_match(src_file, dst_file):
+    """
+    Equality check: same size and the same nanosecond mtime (copies keep the
+    source's), otherwise a content hash. A same-size retag or re-encode
+    always changes the mtime, so it is never taken for the old file.
+    """
+    try:
+        src_stat = os.stat(src_file)
+        dst_stat = os.stat(dst_file)
+    except FileNotFoundError:
+        return False
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return True
+    return _file_digest(src_file) == _file_digest(dst_file)
+
+
+def sync_tree(src, dst, copier, same_dev=True, delete_extra=False):
+    """
+    Brings dst in line with src file by file, skipping files that already match.
+    On the same device changed files are renamed into place; across devices they
+    are streamed to a temporary name first. Resumption is per file: a re-run after
+    an interruption skips the files that were already copied and restarts the one
+    in flight from the beginning. Every file in dst is always either the old or
+    the new version.
+    """
+    copied = skipped = removed = 0
+    seen = set()
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        target_root = os.path.normpath(os.path.join(dst, rel_root))
+        permissions.makedirs(target_root)
+        for filename in files:
+            src_file = os.path.join(root, filename)
+            dst_file = os.path.join(target_root, filename)
+            seen.add(os.path.normpath(os.path.join(rel_root, filename)))
+            if files_match(src_file, dst_file):
+                skipped += 1
+                continue
+
+            if same_dev:
+                os.replace(src_file, dst_file)
+            else:
+                tmp_file = f"{dst_file}.part"
+                copier.copy_file(src_file, tmp_file, allow_hardlink=False)
+                os.replace(tmp_file, dst_file)
+            copied += 1
+
+    if delete_extra:
+        for root, dirs, files in os.walk(dst, topdown=False):
+            rel_root = os.path.relpath(root, dst)
+            for filename in files:
+                if os.path.normpath(os.path.join(rel_root, filename)) not in seen:
+                    os.remove(os.path.join(root, filename))
+                    removed += 1
+            if root != dst and not os.listdir(root):
+                os.rmdir(root)
+
+    logger.info(f"Synced {src} -> {dst}: {copied} updated, {skipped} unchanged, {removed} removed")
+    return copied
+
+
+def publish(staging_dir, final_dest, copier, incremental=False):
+    """
+    Moves a fully prepared staging directory to final_dest, replacing any existing
+    directory without a window where final_dest is missing (where supported).
+    With incremental=True an existing final_dest is updated in place and only
+    files that differ from the staged version are replaced.
+    """
+    parent = os.path.dirname(final_dest)
+    permissions.makedirs(parent)
+    same_dev = same_device(staging_dir, parent)
+
+    if incremental and os.path.isdir(final_dest):
+        sync_tree(staging_dir, final_dest, copier, same_dev=same_dev, delete_extra=True)
+        shutil.rmtree(staging_dir)
+        return
+
+    if not same_dev:
+        # Unavoidable cross-device move: stream into a sibling of the destination,
+        # then publish that sibling with a same-device rename.
+        partial = os.path.join(parent, f".{os.path.basename(final_dest)}.partial")
+        # A .partial left by an interrupted attempt is reused, minus anything not in this version
+        sync_tree(staging_dir, partial, copier, same_dev=False, delete_extra=True)
+        shutil.rmtree(staging_dir)
+        staging_dir = partial
+
+    if not os.path.exists(final_dest):
+        os.rename(staging_dir, final_dest)
+        return
+
+    try:
+        rename_exchange(staging_dir, final_dest)
+        # staging_dir now holds the previous version
+        shutil.rmtree(staging_dir)
+        return
+    except OSError as e:
+        logger.debug(f"RENAME_EXCHANGE unavailable for {final_dest}: {e}")
+
+    # Fallback: move the old version aside, then rename the new one in.
+    # The destination is only missing between two renames.
+    backup = os.path.join(parent, f".{os.path.basename(final_dest)}.old-{uuid.uuid4().hex[:8]}")
+    os.rename(final_dest, backup)
+    try:
+        os.rename(staging_dir, final_dest)
+    except OSError:
+        os.rename(backup, final_dest)
+        raise
+    shutil.rmtree(backup, ignore_errors=True)
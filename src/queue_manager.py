@@ -1,6 +1,10 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import itertools
 import threading
+import time
+import uuid
 from pydantic import BaseModel, Field
+from src.events import event_bus
 
 class QueueItem(BaseModel):
     id: str
@@ -8,13 +12,18 @@ class QueueItem(BaseModel):
     files: List[str]
     metadata: Optional[object] = None # Will hold IdentificationResult
     status: str = "pending" # pending, processing, approved, rejected, completed
+    error: Optional[str] = None
 
     class Config:
         arbitrary_types_allowed = True
 
+    @staticmethod
+    def make_id(dirpath: str) -> str:
+        return str(hash(dirpath))
+
     @staticmethod
     def create(dirpath: str, files: List[str], metadata=None, status="pending"):
-        item_id = str(hash(dirpath))
+        item_id = QueueItem.make_id(dirpath)
         return QueueItem(id=item_id, dirpath=dirpath, files=files, metadata=metadata, status=status)
 
     def to_dict(self):
@@ -22,12 +31,73 @@ class QueueItem(BaseModel):
         # Or simple rely on .dict()
         return self.dict()
 
-class QueueManager:
+class TimedLock:
+    """threading.Lock that records how long callers waited to acquire it."""
+
+    def __init__(self, stats: "LockStats", name: str):
+        self._lock = threading.Lock()
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        if self._lock.acquire(blocking=False):
+            self._stats.record(self._name, 0.0)
+            return self
+        start = time.perf_counter()
+        self._lock.acquire()
+        self._stats.record(self._name, time.perf_counter() - start)
+        return self
+
+    def __exit__(self, *args):
+        self._lock.release()
+        return False
+
+class LockStats:
     def __init__(self):
-        self._queue: Dict[str, QueueItem] = {}
         self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, waited):
+        with self._lock:
+            entry = self._stats.setdefault(name, {"acquisitions": 0, "contended": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0})
+            entry["acquisitions"] += 1
+            if waited > 0:
+                entry["contended"] += 1
+                entry["wait_seconds"] += waited
+                entry["max_wait_seconds"] = max(entry["max_wait_seconds"], waited)
+
+    def get_stats(self):
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._stats.items()}
+
+class QueueManager:
+    """
+    Readers never take a lock: every mutation re-serializes just the changed item and
+    publishes a new immutable (version, items) view, which get_items() returns as-is.
+    Mutations of one item are serialized by a per-item lock; the map lock only guards
+    membership and view publication and is never held across serialization or I/O.
+    """
+
+    def __init__(self, events=None):
+        self._queue: Dict[str, QueueItem] = {}
+        self.events = events or event_bus
+        self.lock_stats = LockStats()
+        self._lock = TimedLock(self.lock_stats, "queue")
+        self._history_lock = TimedLock(self.lock_stats, "history")
+        self._item_locks: Dict[str, TimedLock] = {}
+        # Persist sequence numbers are drawn under the item lock, so they follow the
+        # order of an item's mutations; history drops writes older than the last one
+        self._persist_seq = itertools.count(1)
+        self._persisted: Dict[str, int] = {}
+        # (version, {item_id: serialized item}); replaced wholesale, never mutated
+        self._view = (0, {})
+        # cover_url -> number of queued items showing it, kept in step with the view
+        self._cover_refs: Dict[str, int] = {}
+        self.history_manager = None
         self.monitor = None
-        self.status_callbacks = {}
+        self.status_callbacks = {"queue": self.get_stats}
+        # Distinguishes versions of this process from a previous run's (ETags survive restarts)
+        self.epoch = uuid.uuid4().hex[:8]
 
     def set_monitor(self, monitor):
         self.monitor = monitor
@@ -50,66 +120,193 @@ class QueueManager:
             except Exception:
                 pass
         return status
-    
-    def add_item(self, dirpath: str, files: List[str], metadata=None, from_history=False) -> str:
+
+    def get_stats(self):
+        version, items = self._view
+        return {
+            "queue_size": len(items),
+            "queue_version": version,
+            "lock_stats": self.lock_stats.get_stats(),
+        }
+
+    @property
+    def version(self) -> int:
+        return self._view[0]
+
+    def _item_lock(self, item_id: str) -> TimedLock:
+        lock = self._item_locks.get(item_id)
+        if lock is None:
+            with self._lock:
+                lock = self._item_locks.setdefault(item_id, TimedLock(self.lock_stats, "item"))
+        return lock
+
+    def _publish(self, item: QueueItem, data: Dict):
+        # Serialized outside the map lock; the lock only covers swapping the view
         with self._lock:
-            item = QueueItem.create(dirpath, files, metadata)
-            # Prevent duplicates if ID exists, but update if needed
-            self._queue[item.id] = item
-            
-            # If adding fresh item, sync to history if manager present and not restoring
-            if hasattr(self, 'history_manager') and self.history_manager and not from_history:
-                 # Calculate hash effectively or assume caller handled it?
-                 # Caller (AutoLibrarian) handles history creation usually.
-                 # But if we want to ensure sync:
-                 hash_val = self.history_manager.calculate_hash(dirpath, files)
-                 self.history_manager.update_state(dirpath, hash_val, "pending", files, metadata)
-            
-            return item.id
+            if self._queue.get(item.id) is not item:
+                return
+            version, items = self._view
+            event_type = "item.updated" if item.id in items else "item.added"
+            self._count_cover(items.get(item.id), -1)
+            self._count_cover(data, 1)
+            items = dict(items)
+            items[item.id] = data
+            self._view = (version + 1, items)
+            # Published with the view swap so the event order matches the versions
+            self.events.publish(event_type, {"version": version + 1, "item": data}, key=f"item:{item.id}")
+
+    def _count_cover(self, data: Optional[Dict], delta: int):
+        # Caller holds _lock
+        url = ((data or {}).get("metadata") or {}).get("cover_url")
+        if not url:
+            return
+        count = self._cover_refs.get(url, 0) + delta
+        if count > 0:
+            self._cover_refs[url] = count
+        else:
+            self._cover_refs.pop(url, None)
+
+    def has_cover(self, url: str) -> bool:
+        """Whether any queued item's metadata points at this cover URL."""
+        return url in self._cover_refs
+
+    def add_item(self, dirpath: str, files: List[str], metadata=None, from_history=False, content_hash=None,
+                 fingerprint=None) -> str:
+        item = QueueItem.create(dirpath, files, metadata)
+        data = item.dict()
+        with self._item_lock(item.id):
+            with self._lock:
+                # Prevent duplicates if ID exists, but update if needed
+                self._queue[item.id] = item
+            self._publish(item, data)
+            seq = next(self._persist_seq)
+
+        # If adding fresh item, sync to history if manager present and not restoring.
+        # Hashing and SQLite I/O happen outside the queue lock so readers aren't blocked.
+        if not from_history:
+            self._persist(item.id, seq, dirpath, files, "pending", metadata, content_hash, fingerprint)
+
+        return item.id
 
     def get_items(self) -> List[Dict]:
-        with self._lock:
-            # We used to do item.to_dict() which called metadata.__dict__
-            # QueueItem(BaseModel).dict() will recursively convert metadata if it's a Pydantic model
-            return [item.dict() for item in self._queue.values()]
+        # Lock-free: the view is an immutable snapshot. The dicts are shared, don't mutate them.
+        return list(self._view[1].values())
+
+    def get_snapshot(self):
+        """Returns (version, {item_id: item dict}) from one consistent view."""
+        return self._view
+
+    SORT_KEYS = {
+        "id": lambda item: item["id"],
+        "status": lambda item: item["status"],
+        "title": lambda item: ((item.get("metadata") or {}).get("title") or "").lower(),
+        "author": lambda item: ((item.get("metadata") or {}).get("author") or "").lower(),
+        "confidence": lambda item: (item.get("metadata") or {}).get("confidence") or 0,
+    }
+
+    @staticmethod
+    def matches(item: Dict, status: Optional[List[str]] = None, author: Optional[str] = None,
+                min_confidence: Optional[int] = None) -> bool:
+        metadata = item.get("metadata") or {}
+        if status and item["status"] not in status:
+            return False
+        if author and author.lower() not in (metadata.get("author") or "").lower():
+            return False
+        if min_confidence is not None and (metadata.get("confidence") or 0) < min_confidence:
+            return False
+        return True
+
+    def query(self, status: Optional[List[str]] = None, author: Optional[str] = None,
+              min_confidence: Optional[int] = None, sort: str = "id", descending: bool = False,
+              after: Optional[list] = None, limit: int = 100, snapshot=None) -> Tuple[List[Dict], Optional[list], int]:
+        """
+        Filters and sorts one snapshot and returns (page, next_cursor, total).
+        The cursor is the (sort key, id) of the last item, so pages stay stable
+        while items are added or removed between requests.
+        """
+        key_fn = self.SORT_KEYS.get(sort)
+        if key_fn is None:
+            raise ValueError(f"Unknown sort key: {sort}")
+        _, items = snapshot or self._view
+
+        keyed = [((key_fn(item), item["id"]), item) for item in items.values()
+                 if self.matches(item, status, author, min_confidence)]
+        keyed.sort(key=lambda pair: pair[0], reverse=descending)
+        total = len(keyed)
+
+        if after is not None:
+            after = tuple(after)
+            keyed = [pair for pair in keyed if (pair[0] < after if descending else pair[0] > after)]
+
+        page = keyed[:limit]
+        next_cursor = list(page[-1][0]) if len(keyed) > limit else None
+        return [item for _, item in page], next_cursor, total
 
     def get_item(self, item_id: str) -> Optional[QueueItem]:
-        with self._lock:
-            return self._queue.get(item_id)
+        return self._queue.get(item_id)
 
     def mark_processed(self, item_id: str):
-        with self._lock:
-            item = self._queue.get(item_id)
-            if item and self.history_manager:
-                item.status = "processed"
-                hash_val = self.history_manager.calculate_hash(item.dirpath, item.files)
-                self.history_manager.update_state(item.dirpath, hash_val, "processed", item.files, item.metadata)
-                
+        self._set_status(item_id, "processed")
+
     def mark_ignored(self, item_id: str):
-        with self._lock:
-            item = self._queue.get(item_id)
-            if item and self.history_manager:
-                item.status = "ignored"
-                hash_val = self.history_manager.calculate_hash(item.dirpath, item.files)
-                self.history_manager.update_state(item.dirpath, hash_val, "ignored", item.files, item.metadata)
+        self._set_status(item_id, "ignored")
 
-    def update_item(self, item_id: str, **kwargs):
-        with self._lock:
-            item = self._queue.get(item_id)
-            if item:
-                for k, v in kwargs.items():
-                    setattr(item, k, v)
-                
-                # Sync to history
-                if hasattr(self, 'history_manager') and self.history_manager:
-                    hash_val = self.history_manager.calculate_hash(item.dirpath, item.files)
-                    self.history_manager.update_state(item.dirpath, hash_val, item.status, item.files, item.metadata)
-                
-                return True
+    def mark_processing(self, item_id: str) -> bool:
+        """Claims an item for processing; False if it is gone or already claimed."""
+        # Transient UI state; history keeps the last durable status
+        return self.update_item(item_id, _persist=False, _unless_status="processing", status="processing")
+
+    def _set_status(self, item_id: str, status: str, persist: bool = True):
+        self.update_item(item_id, _persist=persist, status=status)
+
+    def update_item(self, item_id: str, _persist: bool = True, _unless_status: Optional[str] = None, **kwargs):
+        item = self._queue.get(item_id)
+        if not item:
             return False
+        with self._item_lock(item_id):
+            if self._queue.get(item_id) is not item:
+                # Removed (or replaced) while this update waited for the lock
+                return False
+            if _unless_status is not None and item.status == _unless_status:
+                return False
+            for k, v in kwargs.items():
+                setattr(item, k, v)
+            self._publish(item, item.dict())
+            snapshot = (item.dirpath, list(item.files), item.status, item.metadata)
+            seq = next(self._persist_seq)
+
+        # Sync to history
+        if _persist:
+            self._persist(item_id, seq, *snapshot)
+        return True
+
+    def _persist(self, item_id, seq, dirpath, files, status, metadata, content_hash=None, fingerprint=None):
+        history = getattr(self, 'history_manager', None)
+        if not history:
+            return
+        if content_hash is None:
+            # Memoized in HistoryManager (and thread-safe); only stats the files after a change event
+            content_hash = history.calculate_hash(dirpath, files)
+        # Serializes history writes without holding the queue lock. A snapshot taken
+        # before one that was already written is stale, so it is dropped.
+        with self._history_lock:
+            if seq < self._persisted.get(item_id, 0):
+                return
+            self._persisted[item_id] = seq
+            history.update_state(dirpath, content_hash, status, files, metadata, fingerprint=fingerprint)
 
     def remove_item(self, item_id: str):
-        with self._lock:
-            if item_id in self._queue:
-                item = self._queue[item_id]
-                del self._queue[item_id]
+        # Held like any other mutation, so no update of the item is still running once
+        # its lock is dropped; a later add_item starts over with a fresh lock
+        with self._item_lock(item_id):
+            with self._lock:
+                if self._queue.pop(item_id, None) is None:
+                    return
+                self._item_locks.pop(item_id, None)
+                version, items = self._view
+                items = dict(items)
+                self._count_cover(items.pop(item_id, None), -1)
+                self._view = (version + 1, items)
+                self.events.publish("item.removed", {"version": version + 1, "id": item_id}, key=f"item:{item_id}")
+        with self._history_lock:
+            self._persisted.pop(item_id, None)
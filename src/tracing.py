@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+# How many finished spans are written between prunes of the oldest ones
+PRUNE_EVERY = 1000
+# Finished spans are buffered and written in batches by a background thread
+FLUSH_INTERVAL = 0.5
+FLUSH_BATCH = 500
+# Spans beyond this are dropped (and counted) if the writer falls behind
+MAX_BUFFERED_SPANS = 20000
+# Books whose current trace id is kept in memory
+ACTIVE_TRACES = 10000
+
+SPAN_COLUMNS = "trace_id, span_id, parent_id, book, name, start, duration, thread, attrs, error"
+
+# (trace_id, span_id, book) of the innermost open span in this context
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class SpanStore:
+    """
+    Bounded SQLite store of finished spans. Each book group (keyed by its source
+    directory) gets a trace id when processing starts; later work on the same
+    book, e.g. organizing it after review, joins that trace.
+
+    Finishing a span only appends to an in-memory buffer; a background thread
+    writes the buffer in one transaction every FLUSH_INTERVAL seconds, so hot
+    paths never wait on SQLite. Reads flush first.
+    """
+
+    def __init__(self, db_path: str, max_spans: int = None):
+        self.db_path = db_path
+        self.max_spans = max_spans or config.TRACE_MAX_SPANS
+        self._lock = threading.Lock()
+        self._conn = None
+        self._traces: "OrderedDict[str, str]" = OrderedDict()
+        self._since_prune = 0
+        self._buffer: List[tuple] = []
+        self._buffer_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self.dropped = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS spans (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    trace_id TEXT, span_id TEXT, parent_id TEXT, book TEXT, name TEXT,
+                    start REAL, duration REAL, thread TEXT, attrs TEXT, error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_spans_trace ON spans (trace_id);
+                CREATE INDEX IF NOT EXISTS idx_spans_book ON spans (book, id);
+            """)
+        return self._conn
+
+    def new_trace(self, book: str) -> str:
+        return self._remember(book, uuid.uuid4().hex)
+
+    def trace_for(self, book: str) -> str:
+        with self._lock:
+            trace_id = self._traces.get(book)
+            if trace_id:
+                self._traces.move_to_end(book)
+        if trace_id:
+            return trace_id
+        trace_id = self.latest_trace(book)
+        if trace_id:
+            # Cached like a new trace, so the next call doesn't query SQLite again
+            return self._remember(book, trace_id, replace=False)
+        return self.new_trace(book)
+
+    def _remember(self, book: str, trace_id: str, replace: bool = True) -> str:
+        """Stores book's trace id in the bounded LRU; returns the id now cached for it."""
+        with self._lock:
+            # replace=False: a trace started while this one was loaded from SQLite wins
+            if replace or book not in self._traces:
+                self._traces[book] = trace_id
+            self._traces.move_to_end(book)
+            while len(self._traces) > ACTIVE_TRACES:
+                self._traces.popitem(last=False)
+            return self._traces[book]
+
+    def latest_trace(self, book: str) -> Optional[str]:
+        self.flush()
+        with self._lock:
+            row = self._db().execute(
+                "SELECT trace_id FROM spans WHERE book = ? ORDER BY id DESC LIMIT 1", (book,)
+            ).fetchone()
+        return row["trace_id"] if row else None
+
+    def record(self, span: Dict):
+        row = (span["trace_id"], span["span_id"], span["parent_id"], span["book"], span["name"],
+               span["start"], span["duration"], span["thread"],
+               json.dumps(span["attrs"], default=str) if span["attrs"] else None, span["error"])
+        with self._buffer_lock:
+            if len(self._buffer) >= MAX_BUFFERED_SPANS:
+                self.dropped += 1
+                return
+            self._buffer.append(row)
+            if len(self._buffer) >= FLUSH_BATCH:
+                self._flush_event.set()
+            if self._writer is None and not self._closed:
+                self._writer = threading.Thread(target=self._flush_loop, name="SpanWriter", daemon=True)
+                self._writer.start()
+
+    def flush(self):
+        """Writes all buffered spans in a single transaction."""
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        try:
+            with self._lock:
+                conn = self._db()
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany(f"INSERT INTO spans ({SPAN_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    self._since_prune += len(rows)
+                    if self._since_prune >= PRUNE_EVERY:
+                        self._since_prune = 0
+                        conn.execute("DELETE FROM spans WHERE id <= (SELECT MAX(id) FROM spans) - ?", (self.max_spans,))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            logger.debug(f"Failed to record {len(rows)} spans: {e}")
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._flush_event.wait(FLUSH_INTERVAL)
+            self._flush_event.clear()
+            self.flush()
+
+    def get_trace(self, trace_id: str) -> List[Dict]:
+        self.flush()
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT {SPAN_COLUMNS} FROM spans WHERE trace_id = ? ORDER BY start", (trace_id,)
+            ).fetchall()
+        spans = []
+        for row in rows:
+            span = dict(row)
+            span["attrs"] = json.loads(span["attrs"]) if span["attrs"] else {}
+            spans.append(span)
+        return spans
+
+    def close(self):
+        with self._buffer_lock:
+            self._closed = True
+            writer = self._writer
+        self._flush_event.set()
+        if writer:
+            writer.join(timeout=5)
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+store = SpanStore(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "traces.db"))
+
+
+@contextmanager
+def span(name: str, book: Optional[str] = None, new_trace: bool = False, **attrs):
+    """
+    Records a span around the block. Passing `book` (a source directory) starts
+    (new_trace=True) or joins that book's trace; otherwise the span nests under
+    the current span of this context and is dropped if there is none.
+    """
+    parent = _current.get() if config.TRACING_ENABLED else None
+    if not config.TRACING_ENABLED or (book is None and parent is None):
+        yield
+        return
+
+    if book is not None and (new_trace or parent is None or parent[2] != book):
+        trace_id = store.new_trace(book) if new_trace else store.trace_for(book)
+        parent_id = None
+    else:
+        trace_id, parent_id, book = parent
+
+    span_id = uuid.uuid4().hex[:16]
+    token = _current.set((trace_id, span_id, book))
+    start, started = time.time(), time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        _current.reset(token)
+        store.record({
+            "trace_id": trace_id, "span_id": span_id, "parent_id": parent_id, "book": book,
+            "name": name, "start": start, "duration": time.perf_counter() - started,
+            "thread": threading.current_thread().name, "attrs": attrs, "error": error,
+        })
+
+
+def wrap(fn):
+    """Binds fn to the caller's trace context, for work handed to a thread pool."""
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return run
+
+
+def to_chrome_trace(spans: List[Dict]) -> Dict:
+    """Chrome trace-event format (chrome://tracing, Perfetto, speedscope)."""
+    threads = {}
+    events = []
+    for s in spans:
+        tid = threads.setdefault(s["thread"], len(threads) + 1)
+        args = dict(s["attrs"])
+        if s["error"]:
+            args["error"] = s["error"]
+        events.append({
+            "name": s["name"], "cat": "pipeline", "ph": "X", "pid": 1, "tid": tid,
+            "ts": int(s["start"] * 1_000_000), "dur": int(s["duration"] * 1_000_000), "args": args,
+        })
+    for thread, tid in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
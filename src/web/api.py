@@ -1,11 +1,27 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import logging
 import os
-from src.dependencies import queue_manager
+import json
+import base64
+import asyncio
+import time
+import threading
+from collections import OrderedDict
+from src.config import config
+from src.dependencies import queue_manager, job_queue
+from src.jobs import JobQueueFull
+from src.queue_manager import QueueItem
+from src.events import event_bus
+from src import metrics
+from src import tracing
+from src.profiling import profiler
 from src.providers import MetadataAggregator
 from src.organizer import Organizer
 from src.identifier import IdentificationResult
@@ -19,6 +35,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Queue listings with full metadata get large; small responses aren't worth compressing
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 logger = logging.getLogger("WebAPI")
 
@@ -41,11 +59,91 @@ class SearchQuery(BaseModel):
 # Services
 aggregator = MetadataAggregator()
 organizer = Organizer()
+organizer.cover_cache.pinned = queue_manager.has_cover
+
+# Cover URLs of recent search candidates, which /api/cover may fetch besides queued items' covers
+MAX_OFFERED_COVERS = 2048
+_offered_covers = OrderedDict()
+_offered_covers_lock = threading.Lock()
+
+def _offer_cover(candidate):
+    url = candidate.get("cover_url") if isinstance(candidate, dict) else None
+    if not url:
+        return
+    with _offered_covers_lock:
+        _offered_covers[url] = True
+        _offered_covers.move_to_end(url)
+        while len(_offered_covers) > MAX_OFFERED_COVERS:
+            _offered_covers.popitem(last=False)
+
+def _cover_allowed(url):
+    # Only covers we handed to the UI ourselves; never an arbitrary caller-supplied URL
+    if queue_manager.has_cover(url):
+        return True
+    with _offered_covers_lock:
+        return url in _offered_covers
+
+def _encode_cursor(cursor):
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(value, list) or len(value) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+def _project(item, fields, exclude):
+    if fields:
+        item = {k: v for k, v in item.items() if k in fields or k == "id"}
+    for path in exclude:
+        # One level of nesting is enough for "metadata.description"
+        parent, _, child = path.partition(".")
+        if not child:
+            item = {k: v for k, v in item.items() if k != parent}
+        elif isinstance(item.get(parent), dict):
+            item = dict(item)
+            item[parent] = {k: v for k, v in item[parent].items() if k != child}
+    return item
+
+def _split(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
 
 @app.get("/api/queue")
-def get_queue():
-    # queue_manager.get_items() returns list of dicts now
-    return queue_manager.get_items()
+def get_queue(request: Request, status: Optional[str] = None, author: Optional[str] = None,
+              min_confidence: Optional[int] = None, sort: str = "id", order: str = "asc",
+              cursor: Optional[str] = None, limit: int = 100, fields: Optional[str] = None,
+              exclude: Optional[str] = None):
+    # Every response is derived from one snapshot, so its version identifies the content
+    # for a given URL. Check it before doing any filtering or serialization work.
+    snapshot = queue_manager.get_snapshot()
+    etag = f'W/"{queue_manager.epoch}-{snapshot[0]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if sort not in queue_manager.SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort}")
+    after = _decode_cursor(cursor) if cursor else None
+    try:
+        items, next_cursor, total = queue_manager.query(
+            status=_split(status), author=author, min_confidence=min_confidence,
+            sort=sort, descending=order == "desc", after=after,
+            limit=max(1, min(limit, 1000)), snapshot=snapshot)
+    except TypeError:
+        # Cursor from a different sort key
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    field_set, exclude_list = set(_split(fields)), _split(exclude)
+    if field_set or exclude_list:
+        items = [_project(item, field_set, exclude_list) for item in items]
+
+    body = {"items": items, "next_cursor": _encode_cursor(next_cursor), "total": total, "version": snapshot[0]}
+    return Response(content=json.dumps(body, default=str), media_type="application/json", headers=headers)
 
 @app.post("/api/refresh")
 def refresh_monitor():
@@ -56,6 +154,114 @@ def refresh_monitor():
 def get_status():
     return queue_manager.get_system_status()
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# How often a connected client checks for new events; also the window in which
+# bursts of updates to the same item are coalesced into one message
+EVENT_POLL_INTERVAL = 0.25
+EVENT_HEARTBEAT_INTERVAL = 15
+
+def _sse(event_type, data, event_id=None):
+    lines = [f"event: {event_type}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.get("/api/events")
+async def stream_events(request: Request, last_event_id: Optional[str] = None):
+    """
+    Server-sent events: item.added / item.updated / item.removed, progress and stats.
+    Reconnecting clients send Last-Event-ID (EventSource does this automatically) and
+    receive only what they missed, or a "resync" event if that is no longer possible.
+    """
+    resume_from = request.headers.get("last-event-id") or last_event_id
+
+    async def generate():
+        event_bus.subscribe()
+        try:
+            last_id = event_bus.parse_id(resume_from)
+            if last_id is None:
+                # Fresh (or unresumable) connection: start from now, client loads /api/queue
+                last_id = event_bus.last_id
+                yield _sse("resync", {"version": queue_manager.version}, event_bus.format_id(last_id))
+            last_sent = time.monotonic()
+
+            while not await request.is_disconnected():
+                events, resync = event_bus.since(last_id)
+                if resync:
+                    last_id = event_bus.last_id
+                    yield _sse("resync", {"version": queue_manager.version}, event_bus.format_id(last_id))
+                    last_sent = time.monotonic()
+                    continue
+                if events:
+                    for event in event_bus.coalesce(events):
+                        yield _sse(event.type, event.data, event_bus.format_id(event.id))
+                    last_id = events[-1].id
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent > EVENT_HEARTBEAT_INTERVAL:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+                await asyncio.sleep(EVENT_POLL_INTERVAL)
+        finally:
+            event_bus.unsubscribe()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
+
+@app.get("/api/cover")
+def get_cover(url: str, request: Request):
+    if not url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="Invalid cover URL")
+    if not _cover_allowed(url):
+        raise HTTPException(status_code=404, detail="Unknown cover")
+
+    cache = organizer.cover_cache
+    path, entry = cache.fetch(url)
+    if not path:
+        raise HTTPException(status_code=404, detail="Cover not available")
+
+    etag = f'"{entry["hash"]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400", "X-Content-Type-Options": "nosniff"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    # Held until the response has been streamed, so eviction can't delete it mid-send
+    blob = cache.hold(entry)
+    if not os.path.exists(path):
+        cache.release(blob)
+        raise HTTPException(status_code=404, detail="Cover not available")
+    return FileResponse(path, media_type=cache.media_type(entry), headers=headers,
+                        background=BackgroundTask(cache.release, blob))
+
+@app.get("/api/history")
+def get_history(status: str = "processed", cursor: Optional[str] = None, limit: int = 100):
+    history = getattr(queue_manager, "history_manager", None)
+    if not history:
+        raise HTTPException(status_code=503, detail="History not available")
+    items, next_cursor = history.get_page_by_status(status, after=cursor, limit=max(1, min(limit, 1000)))
+    return {"items": items, "next_cursor": next_cursor, "total": history.count_by_status(status)}
+
+@app.get("/api/trace")
+def get_trace_by_path(path: str, format: str = "json"):
+    trace_id = tracing.store.latest_trace(path)
+    if not trace_id:
+        raise HTTPException(status_code=404, detail="No trace recorded for this path")
+    spans = tracing.store.get_trace(trace_id)
+    if format == "chrome":
+        return tracing.to_chrome_trace(spans)
+    return {"trace_id": trace_id, "path": path, "spans": spans}
+
+@app.get("/api/trace/{item_id}")
+def get_trace(item_id: str, format: str = "json"):
+    """Spans of the latest trace for a queued book; format=chrome for chrome://tracing / Perfetto."""
+    item = queue_manager.get_item(item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return get_trace_by_path(item.dirpath, format)
+
 @app.get("/api/queue/{item_id}")
 def get_item(item_id: str):
     item = queue_manager.get_item(item_id)
@@ -63,39 +269,36 @@ def get_item(item_id: str):
         raise HTTPException(status_code=404, detail="Item not found")
     return item.dict()
 
+def _search(item, query: SearchQuery):
+    for event in aggregator.search_stream(query.query, query.author, audible_id=query.audible_id, target=item.metadata):
+        _offer_cover(event.get("candidate"))
+        yield event
+
 @app.post("/api/queue/{item_id}/search")
 def search_metadata(item_id: str, query: SearchQuery):
     item = queue_manager.get_item(item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    
-    results = []
 
-    # Priority 1: Audible ID Search
-    if query.audible_id:
-        res = aggregator.get_by_id("AudibleProvider", query.audible_id)
-        if res:
-            results.append(res.dict())
+    # Providers are queried in parallel; duplicates across providers are collapsed
+    results = {}
+    for event in _search(item, query):
+        if event["type"] in ("candidate", "update"):
+            results[event["key"]] = event["candidate"]
+    return list(results.values())
 
-    # Priority 2: Standard Search
-    # Only search if we don't have a perfect ID match or if we want more options
-    # Let's search anyway to provide alternatives
-    
-    for provider in aggregator.providers:
-        try:
-            # Skip if we already used this provider for ID lookup? 
-            # Well, audible provider search() uses query text, get_by_id uses ASIN.
-            # It might return the same book, but that's fine.
-            res = provider.search(query.query, query.author)
-            # Convert to dict
-            for r in res:
-                # Avoid duplicates based on title/author/source if possible?
-                # or just append
-                results.append(r.dict())
-        except Exception as e:
-            logger.error(f"Provider error: {e}")
-            
-    return results
+@app.post("/api/queue/{item_id}/search/stream")
+def search_metadata_stream(item_id: str, query: SearchQuery):
+    """NDJSON: one line per candidate (or update to one) as each provider answers, then a "done" line."""
+    item = queue_manager.get_item(item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    def generate():
+        for event in _search(item, query):
+            yield json.dumps(event, default=str) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
 
 @app.post("/api/queue/{item_id}/update")
 def update_metadata(item_id: str, updates: MetadataUpdate):
@@ -103,21 +306,21 @@ def update_metadata(item_id: str, updates: MetadataUpdate):
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    # Update the metadata object
-    if not item.metadata:
-        item.metadata = IdentificationResult()
-        
     logger.info(f"Received update request for {item_id}: {updates}")
-    for k, v in updates.dict(exclude_unset=True).items():
-        logger.info(f"Updating {k} to {v}")
-        setattr(item.metadata, k, v)
-        
-    queue_manager.update_item(item_id) # Signal update if needed (lock is already handled if we just modify object reference, but update_item is safer if we replace)
-    
+    apply_metadata_update(item, updates.dict(exclude_unset=True))
+
     updated_item = item.dict()
     logger.info(f"Updated item state: {updated_item['metadata']}")
     return updated_item
 
+def apply_metadata_update(item, updates: Dict[str, Any]):
+    # Built as a new object: the item's metadata is only replaced under its lock
+    metadata = item.metadata.copy() if item.metadata else IdentificationResult()
+    for k, v in updates.items():
+        logger.info(f"Updating {k} to {v}")
+        setattr(metadata, k, v)
+    queue_manager.update_item(item.id, metadata=metadata) # Re-publishes the item snapshot and syncs history
+
 @app.get("/api/queue/{item_id}/preview")
 def preview_item(item_id: str):
     item = queue_manager.get_item(item_id)
@@ -134,7 +337,7 @@ class ProcessRequest(BaseModel):
     mode: str = "copy"
 
 @app.post("/api/queue/{item_id}/process")
-def process_item(item_id: str, request: ProcessRequest, background_tasks: BackgroundTasks):
+def process_item(item_id: str, request: ProcessRequest):
     item = queue_manager.get_item(item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -142,20 +345,131 @@ def process_item(item_id: str, request: ProcessRequest, background_tasks: Backgr
     if not item.metadata:
          raise HTTPException(status_code=400, detail="No metadata for item")
 
-    # Set status to processing
-    item.status = "processing"
-    
-    background_tasks.add_task(run_organizer, item_id, item.dirpath, item.files, item.metadata, request.mode)
-    return {"status": "started", "mode": request.mode}
+    batch = _submit("process", [item], {"mode": request.mode})
+    if batch["skipped"]:
+        raise HTTPException(status_code=409, detail="Item is already being processed")
+    return {"status": "started", "mode": request.mode, "batch_id": batch["batch_id"]}
 
 def run_organizer(item_id, dirpath, files, metadata, mode="copy"):
+    event_bus.publish("progress", {"path": dirpath, "stage": "organizing"}, key=f"progress:{dirpath}")
     try:
-        organizer.organize(dirpath, files, metadata, mode=mode)
+        # The history manager is attached by AutoLibrarian after this module is imported
+        organizer.store = getattr(queue_manager, "history_manager", None)
+        with tracing.span("run_organizer", book=dirpath, mode=mode):
+            organizer.organize(dirpath, files, metadata, mode=mode)
         queue_manager.mark_processed(item_id)
         queue_manager.remove_item(item_id)
+        event_bus.publish("progress", {"path": dirpath, "stage": "processed"}, key=f"progress:{dirpath}")
     except Exception as e:
         logger.error(f"Failed to organize {item_id}: {e}")
         queue_manager.update_item(item_id, status="error", error=str(e))
+        event_bus.publish("progress", {"path": dirpath, "stage": "failed", "error": str(e)}, key=f"progress:{dirpath}")
+        raise
+
+# Job handlers. Jobs store the source directory rather than the item id, since
+# ids are derived from hash() and change between runs.
+def _queued_item(dirpath):
+    item = queue_manager.get_item(QueueItem.make_id(dirpath))
+    if not item:
+        raise LookupError(f"{dirpath} is no longer in the queue")
+    return item
+
+def _process_job(dirpath, payload):
+    item = _queued_item(dirpath)
+    if not item.metadata:
+        raise ValueError("No metadata for item")
+    run_organizer(item.id, item.dirpath, item.files, item.metadata, payload.get("mode", "copy"))
+
+def _ignore_job(dirpath, payload):
+    item = _queued_item(dirpath)
+    queue_manager.mark_ignored(item.id)
+    queue_manager.remove_item(item.id)
+
+def _update_job(dirpath, payload):
+    apply_metadata_update(_queued_item(dirpath), payload.get("updates", {}))
+
+job_queue.register("process", _process_job)
+job_queue.register("ignore", _ignore_job)
+job_queue.register("update", _update_job)
+
+def _submit(action, items, payload):
+    skipped = []
+    if action == "process":
+        # Claimed before queuing, under the item lock, so a repeated request
+        # can't queue the same book twice
+        previous = {item.id: item.status for item in items}
+        claimed = {item.id for item in items if queue_manager.mark_processing(item.id)}
+        skipped = [item.id for item in items if item.id not in claimed]
+        items = [item for item in items if item.id in claimed]
+    if not items:
+        return {"batch_id": None, "action": action, "jobs": 0, "skipped": skipped}
+    try:
+        batch = job_queue.submit(action, [item.dirpath for item in items], payload)
+    except JobQueueFull as e:
+        if action == "process":
+            for item in items:
+                queue_manager.update_item(item.id, _persist=False, status=previous[item.id])
+        raise HTTPException(status_code=429, detail=str(e))
+    batch["skipped"] = skipped
+    return batch
+
+class BulkFilter(BaseModel):
+    status: Optional[List[str]] = None
+    author: Optional[str] = None
+    min_confidence: Optional[int] = None
+
+class BulkRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    filter: Optional[BulkFilter] = None
+    mode: str = "copy"
+    updates: Optional[MetadataUpdate] = None
+
+@app.post("/api/bulk/{action}")
+def bulk_action(action: str, request: BulkRequest):
+    """Queues process/ignore/update jobs for a list of ids or every item matching a filter."""
+    if action not in ("process", "ignore", "update"):
+        raise HTTPException(status_code=404, detail=f"Unknown action: {action}")
+    if (request.ids is None) == (request.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either ids or filter")
+    if action == "update" and not request.updates:
+        raise HTTPException(status_code=400, detail="No updates given")
+
+    if request.ids is not None:
+        ids = request.ids
+    else:
+        _, items = queue_manager.get_snapshot()
+        ids = [item_id for item_id, data in items.items()
+               if queue_manager.matches(data, **request.filter.dict())]
+
+    targets, skipped = [], []
+    for item_id in ids:
+        item = queue_manager.get_item(item_id)
+        if not item or (action == "process" and not item.metadata):
+            skipped.append(item_id)
+        else:
+            targets.append(item)
+
+    payload = {"mode": request.mode}
+    if request.updates:
+        payload["updates"] = request.updates.dict(exclude_unset=True)
+    batch = _submit(action, targets, payload)
+    # Items already being processed are skipped by _submit
+    batch["skipped"] = skipped + batch["skipped"]
+    return batch
+
+@app.get("/api/jobs/batches/{batch_id}")
+def get_batch(batch_id: str, include_jobs: bool = False):
+    batch = job_queue.get_batch(batch_id, include_jobs=include_jobs)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: int):
+    job = job_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.delete("/api/queue/{item_id}")
@@ -164,6 +478,64 @@ def remove_item(item_id: str):
     queue_manager.remove_item(item_id)
     return {"status": "removed"}
 
+# Profiling (admin)
+class SampleRequest(BaseModel):
+    seconds: float = 30
+    interval: float = 0.01
+
+class CProfileRequest(BaseModel):
+    calls: int = 5
+    targets: Optional[List[str]] = None
+
+def _require_profiling():
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled (set PROFILING_ENABLED)")
+
+@app.get("/api/admin/profile")
+def get_profile_status():
+    _require_profiling()
+    return profiler.get_status()
+
+@app.post("/api/admin/profile/sample")
+def start_sampling(request: SampleRequest):
+    """Samples every thread (main loop, worker pools, API) for the given number of seconds."""
+    _require_profiling()
+    try:
+        return profiler.start_sampling(request.seconds, request.interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/api/admin/profile/cprofile")
+def start_cprofile(request: CProfileRequest):
+    """Runs cProfile around the next `calls` process_book/organize calls."""
+    _require_profiling()
+    try:
+        return profiler.profile_next(request.calls, request.targets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.delete("/api/admin/profile/cprofile")
+def stop_cprofile():
+    """Ends the armed cProfile session and writes the calls profiled so far."""
+    _require_profiling()
+    try:
+        return profiler.stop_cprofile()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/admin/profile/results/{name}")
+def get_profile_result(name: str, format: str = "raw", sort: str = "cumulative"):
+    """Raw .collapsed/.pstats file, or format=text for a pstats summary."""
+    _require_profiling()
+    path = profiler.result_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Result not found")
+    if format == "text" and name.endswith(".pstats"):
+        return PlainTextResponse(profiler.pstats_text(path, sort=sort))
+    return FileResponse(path, filename=name, media_type="application/octet-stream")
+
 # Serve Static Files (Frontend)
 # Assumes build is in src/web/ui/dist
 static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ui", "dist")
@@ -14,11 +14,20 @@ export default function App() {
 
     const fetchQueue = async () => {
         try {
-            const res = await fetch(`${API_BASE}/queue`)
-            if (!res.ok) throw new Error("Failed to connect to API")
-            const data = await res.json()
+            // Pages are followed until next_cursor runs out, so large queues are shown in full.
+            // The browser revalidates each page with its ETag, so unchanged polls are 304s.
+            const all = []
+            let cursor = null
+            do {
+                const page = cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''
+                const res = await fetch(`${API_BASE}/queue?limit=1000&sort=id&order=desc${page}`)
+                if (!res.ok) throw new Error("Failed to connect to API")
+                const data = await res.json()
+                all.push(...data.items)
+                cursor = data.next_cursor
+            } while (cursor)
             // Sort items: processing first, then ID desc
-            const sorted = data.sort((a, b) => {
+            const sorted = all.sort((a, b) => {
                 if (a.status === 'processing' && b.status !== 'processing') return -1;
                 if (b.status === 'processing' && a.status !== 'processing') return 1;
                 return b.id.localeCompare(a.id);
@@ -63,11 +72,35 @@ export default function App() {
     useEffect(() => {
         fetchQueue()
         fetchStatus()
+
+        // Push updates; EventSource reconnects by itself and resumes via Last-Event-ID
+        const events = new EventSource(`${API_BASE}/events`)
+        const upsert = (e) => {
+            const { item } = JSON.parse(e.data)
+            setItems(prev => prev.some(i => i.id === item.id)
+                ? prev.map(i => i.id === item.id ? item : i)
+                : [item, ...prev])
+        }
+        events.addEventListener('item.added', upsert)
+        events.addEventListener('item.updated', upsert)
+        events.addEventListener('item.removed', (e) => {
+            const { id } = JSON.parse(e.data)
+            setItems(prev => prev.filter(i => i.id !== id))
+        })
+        events.addEventListener('stats', (e) => setStats(JSON.parse(e.data)))
+        events.addEventListener('resync', () => fetchQueue())
+
+        // Slow fallback in case the stream is blocked by a proxy
         const interval = setInterval(() => {
-            fetchQueue()
-            fetchStatus()
-        }, 5000)
-        return () => clearInterval(interval)
+            if (events.readyState !== EventSource.OPEN) {
+                fetchQueue()
+                fetchStatus()
+            }
+        }, 30000)
+        return () => {
+            clearInterval(interval)
+            events.close()
+        }
     }, [])
 
     const pendingCount = (stats.tracked_files_count || 0) + (stats.grouping_files_count || 0)
@@ -4,6 +4,9 @@ import { toast } from 'sonner'
 
 const API_BASE = "/api"
 
+// Covers are proxied through the backend cache instead of hot-linking provider CDNs
+const coverSrc = (url) => `${API_BASE}/cover?url=${encodeURIComponent(url)}`
+
 export default function QueueItem({ item, onUpdate }) {
     const [expanded, setExpanded] = useState(false)
     const [editing, setEditing] = useState(false)
@@ -72,7 +75,7 @@ export default function QueueItem({ item, onUpdate }) {
 
         const q = formData.title || folderName || ""
         try {
-            const res = await fetch(`${API_BASE}/queue/${item.id}/search`, {
+            const res = await fetch(`${API_BASE}/queue/${item.id}/search/stream`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
@@ -81,9 +84,30 @@ export default function QueueItem({ item, onUpdate }) {
                     audible_id: formData.asin
                 })
             })
-            const data = await res.json()
-            setSearchResults(data)
+            // NDJSON: show candidates as each provider answers
+            const reader = res.body.getReader()
+            const decoder = new TextDecoder()
+            const candidates = new Map()
+            let buffer = ''
+            setSearchResults([])
             setHasSearched(true)
+            while (true) {
+                const { value, done } = await reader.read()
+                if (done) break
+                buffer += decoder.decode(value, { stream: true })
+                const lines = buffer.split('\n')
+                buffer = lines.pop()
+                for (const line of lines) {
+                    if (!line) continue
+                    const event = JSON.parse(line)
+                    if (event.type === 'candidate' || event.type === 'update') {
+                        candidates.set(event.key, event.candidate)
+                        setSearchResults([...candidates.values()].sort((a, b) => b.confidence - a.confidence))
+                    } else if (event.type === 'done' && event.timed_out.length) {
+                        toast.info(`No answer in time from ${event.timed_out.join(', ')}`)
+                    }
+                }
+            }
         } catch (e) {
             console.error(e)
             toast.error("Search failed. Check console.")
@@ -180,7 +204,7 @@ export default function QueueItem({ item, onUpdate }) {
             <div className="flex justify-between items-center">
                 <div className="flex items-center gap-4 flex-1">
                     <div className="w-[50px] h-[75px] bg-slate-800 rounded overflow-hidden flex-shrink-0 flex items-center justify-center border border-border">
-                        {formData.cover_url ? <img src={formData.cover_url} alt="Cover" className="w-full h-full object-cover" /> : <span className="text-[10px] text-muted p-1 text-center">No Cover</span>}
+                        {formData.cover_url ? <img src={coverSrc(formData.cover_url)} alt="Cover" className="w-full h-full object-cover" /> : <span className="text-[10px] text-muted p-1 text-center">No Cover</span>}
                     </div>
 
                     <div>
@@ -232,7 +256,7 @@ export default function QueueItem({ item, onUpdate }) {
                                 {searchResults.map((res, i) => (
                                     <div key={i} className="flex justify-between items-center p-2 bg-card border border-border rounded-lg hover:border-primary/50 transition-colors">
                                         <div className="flex gap-3">
-                                            {res.cover_url && <img src={res.cover_url} className="w-[30px] h-[45px] object-cover rounded" />}
+                                            {res.cover_url && <img src={coverSrc(res.cover_url)} className="w-[30px] h-[45px] object-cover rounded" />}
                                             <div>
                                                 <div className="font-bold text-sm">{res.title}</div>
                                                 <div className="text-xs text-muted">by {res.author} ({res.year})</div>
@@ -0,0 +1,59 @@
+import os
+import pytest
+from src.copier import CopyEngine, CopyStats
+
+class TestCopyEngine:
+    @pytest.fixture
+    def source_files(self, tmp_path):
+        src_dir = tmp_path / "src"
+        src_dir.mkdir()
+        files = []
+        for i in range(3):
+            f = src_dir / f"ch{i}.mp3"
+            f.write_bytes(os.urandom(1024 * (i + 1)))
+            files.append(f)
+        dest_dir = tmp_path / "dest"
+        dest_dir.mkdir()
+        return files, dest_dir
+
+    def test_copy_files_parallel(self, source_files):
+        files, dest_dir = source_files
+        stats = CopyStats()
+        engine = CopyEngine(max_workers=2, allow_hardlinks=False, stats=stats)
+
+        jobs = [(str(f), str(dest_dir / f.name), False) for f in files]
+        strategies = engine.copy_files(jobs)
+
+        assert len(strategies) == 3
+        for f in files:
+            copied = dest_dir / f.name
+            assert copied.read_bytes() == f.read_bytes()
+            assert os.stat(copied).st_ino != os.stat(f).st_ino
+            assert int(os.stat(copied).st_mtime) == int(os.stat(f).st_mtime)
+
+        recorded = stats.get_stats()["copy_stats"]
+        assert sum(entry["files"] for entry in recorded.values()) == 3
+        assert "hardlink" not in recorded
+
+    def test_hardlink_only_when_allowed(self, source_files):
+        files, dest_dir = source_files
+        engine = CopyEngine(max_workers=1, allow_hardlinks=True, stats=CopyStats())
+        # Force the reflink attempt to fail so the hardlink strategy is exercised
+        engine._try_reflink = lambda src, dst: False
+
+        linked = dest_dir / "linked.jpg"
+        assert engine.copy_file(str(files[0]), str(linked), allow_hardlink=True) == "hardlink"
+        assert os.stat(linked).st_ino == os.stat(files[0]).st_ino
+
+        copied = dest_dir / "copied.mp3"
+        assert engine.copy_file(str(files[1]), str(copied), allow_hardlink=False) != "hardlink"
+        assert os.stat(copied).st_ino != os.stat(files[1]).st_ino
+
+    def test_copy_with_head_replaces_prefix(self, source_files):
+        files, dest_dir = source_files
+        engine = CopyEngine(max_workers=1, allow_hardlinks=True, stats=CopyStats())
+
+        dest = dest_dir / "headed.mp3"
+        engine.copy_file(str(files[1]), str(dest), head=(b"HEAD", 16))
+        assert dest.read_bytes() == b"HEAD" + files[1].read_bytes()[16:]
+        assert os.stat(dest).st_ino != os.stat(files[1]).st_ino
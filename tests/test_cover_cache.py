@@ -0,0 +1,96 @@
+import os
+import pytest
+from src.config import config
+from src import cover_cache
+from src.cover_cache import CoverCache
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+class TestCoverCache:
+    @pytest.fixture
+    def cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config, "COVER_CACHE_TTL", 0)
+        monkeypatch.setattr(config, "COVER_MAX_BYTES", 1024)
+        return CoverCache(str(tmp_path / "covers"))
+
+    def test_dedup_and_conditional_request(self, cache, monkeypatch):
+        calls = []
+        def fake_get(url, headers=None, timeout=None, stream=False):
+            calls.append((url, headers))
+            if headers and headers.get("If-None-Match") == '"v1"':
+                return FakeResponse(304)
+            return FakeResponse(200, b"same image", {"Content-Type": "image/png", "ETag": '"v1"'})
+        monkeypatch.setattr(cover_cache.requests, "get", fake_get)
+
+        path_a, entry_a = cache.fetch("http://a.example/cover.png")
+        path_b, entry_b = cache.fetch("http://b.example/other.png")
+        assert path_a == path_b
+        assert path_a.endswith(".png")
+        assert len(os.listdir(cache.blob_dir)) == 1
+
+        # Revalidation sends the stored ETag and keeps the cached blob on 304
+        path_again, _ = cache.fetch("http://a.example/cover.png")
+        assert calls[-1][1] == {"If-None-Match": '"v1"'}
+        assert path_again == path_a
+
+    def test_size_cap(self, cache, monkeypatch):
+        monkeypatch.setattr(cover_cache.requests, "get",
+                            lambda url, **kwargs: FakeResponse(200, b"x" * 4096))
+        path, entry = cache.fetch("http://a.example/huge.jpg")
+        assert path is None
+        assert [f for f in os.listdir(cache.blob_dir) if f.endswith(".part")] == []
+
+    def test_rejects_non_images(self, cache, monkeypatch):
+        monkeypatch.setattr(cover_cache.requests, "get",
+                            lambda url, **kwargs: FakeResponse(200, b"<script>", {"Content-Type": "text/html"}))
+        assert cache.fetch("http://a.example/x.html") == (None, None)
+        assert os.listdir(cache.blob_dir) == []
+
+    def test_evicts_oldest_beyond_cap(self, cache, monkeypatch):
+        monkeypatch.setattr(config, "COVER_CACHE_MAX_MB", 1)
+        monkeypatch.setattr(config, "COVER_MAX_BYTES", 1024 * 1024)
+        monkeypatch.setattr(cover_cache.requests, "get", lambda url, **kwargs: FakeResponse(
+            200, url.encode() * (400 * 1024 // len(url)), {"Content-Type": "image/jpeg"}))
+
+        paths = [cache.fetch(f"http://a.example/{i}.jpg")[0] for i in range(3)]
+        # Three ~400 KB covers don't fit in 1 MB; the first one fetched is dropped
+        assert not os.path.exists(paths[0])
+        assert all(os.path.exists(p) for p in paths[1:])
+        assert cache.get_cached("http://a.example/0.jpg") == (None, None)
+        assert cache.media_type(cache.get_cached("http://a.example/2.jpg")[1]) == "image/jpeg"
+
+    def test_eviction_skips_pinned_and_held(self, cache, monkeypatch):
+        monkeypatch.setattr(config, "COVER_CACHE_MAX_MB", 1)
+        monkeypatch.setattr(config, "COVER_MAX_BYTES", 1024 * 1024)
+        monkeypatch.setattr(cover_cache.requests, "get", lambda url, **kwargs: FakeResponse(
+            200, url.encode() * (400 * 1024 // len(url)), {"Content-Type": "image/jpeg"}))
+        cache.pinned = lambda url: url == "http://a.example/0.jpg"
+
+        paths = [cache.fetch(f"http://a.example/{i}.jpg")[0] for i in range(2)]
+        blob = cache.hold(cache.get_cached("http://a.example/1.jpg")[1])
+        paths.append(cache.fetch("http://a.example/2.jpg")[0])
+        # Nothing evictable: the cache stays over the cap
+        assert all(os.path.exists(p) for p in paths)
+
+        cache.release(blob)
+        paths.append(cache.fetch("http://a.example/3.jpg")[0])
+        assert not os.path.exists(paths[1])
+        assert os.path.exists(paths[0])
@@ -0,0 +1,36 @@
+from src.events import EventBus
+from src.queue_manager import QueueManager
+
+class TestEventBus:
+    def test_resume_and_resync(self):
+        bus = EventBus(max_events=3)
+        ids = [bus.publish("progress", {"n": n}) for n in range(5)]
+
+        events, resync = bus.since(ids[2])
+        assert [e.data["n"] for e in events] == [3, 4]
+        assert not resync
+
+        # Evicted from the ring buffer
+        assert bus.since(ids[0]) == ([], True)
+        # Ids from another process can't be resumed
+        assert bus.parse_id(bus.format_id(ids[2])) == ids[2]
+        assert bus.parse_id(f"other-{ids[2]}") is None
+
+    def test_queue_events_are_coalesced_per_item(self):
+        bus = EventBus()
+        qm = QueueManager(events=bus)
+        item_id = qm.add_item("/in/book", ["a.mp3"])
+        for n in range(10):
+            qm.update_item(item_id, status=f"s{n}")
+        other = qm.add_item("/in/other", ["b.mp3"])
+        qm.remove_item(other)
+
+        events, _ = bus.since(0)
+        assert len(events) == 13
+        coalesced = bus.coalesce(events)
+        assert [(e.type, e.key) for e in coalesced] == [
+            ("item.updated", f"item:{item_id}"),
+            ("item.removed", f"item:{other}"),
+        ]
+        assert coalesced[0].data["item"]["status"] == "s9"
+        assert coalesced[-1].data["version"] == qm.version
@@ -0,0 +1,175 @@
+import json
+import sqlite3
+import threading
+import pytest
+from src.history import HistoryManager, MIGRATIONS
+from src.identifier import IdentificationResult
+
+class TestHistoryManager:
+    @pytest.fixture
+    def history(self, tmp_path):
+        manager = HistoryManager(str(tmp_path / "history.db"))
+        yield manager
+        manager.close()
+
+    def test_upsert_keeps_existing_files_and_metadata(self, history):
+        metadata = IdentificationResult(title="The Martian", author="Andy Weir")
+        history.update_state("/in/book", "h1", "pending", ["/in/book/a.mp3"], metadata)
+        history.update_state("/in/book", "h2", "processed")
+
+        state = history.get_state("/in/book")
+        assert state["status"] == "processed"
+        assert state["content_hash"] == "h2"
+        assert "a.mp3" in state["file_list"]
+        assert "The Martian" in state["metadata"]
+
+    def test_wal_mode(self, history):
+        mode = history._connect().execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode.lower() == "wal"
+
+    def test_concurrent_updates(self, history):
+        def worker(n):
+            for i in range(50):
+                history.update_state(f"/in/book{n}-{i}", "h", "pending", ["f"])
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(history.get_all_pending()) == 200
+
+    def test_write_behind_read_your_writes(self, tmp_path):
+        history = HistoryManager(str(tmp_path / "history.db"), write_behind=True, flush_interval=60)
+        try:
+            history.update_state("/in/book", "h1", "pending", ["a.mp3"])
+            history.update_state("/in/book", "h2", "processed")
+            # Not flushed yet, but visible and coalesced
+            state = history.get_state("/in/book")
+            assert state["status"] == "processed"
+            assert "a.mp3" in state["file_list"]
+        finally:
+            history.close()
+
+        reopened = HistoryManager(str(tmp_path / "history.db"))
+        assert reopened.get_state("/in/book")["status"] == "processed"
+        reopened.close()
+
+    def test_migrates_legacy_schema(self, tmp_path):
+        db_path = str(tmp_path / "legacy.db")
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("""
+                CREATE TABLE file_history (
+                    path TEXT PRIMARY KEY, content_hash TEXT, status TEXT,
+                    last_updated REAL, file_list TEXT, metadata TEXT
+                )
+            """)
+            conn.execute("INSERT INTO file_history VALUES (?, ?, ?, ?, ?, ?)",
+                         ("/in/old", "h", "pending", 1.0, '["a.mp3"]', '{"title": "Old"}'))
+
+        history = HistoryManager(db_path)
+        try:
+            assert history.schema_version() == len(MIGRATIONS)
+            state = history.get_state("/in/old")
+            assert state["status"] == "pending"
+            assert json.loads(state["file_list"]) == ["a.mp3"]
+            indexes = {row[0] for row in history._connect().execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            assert "idx_file_history_status" in indexes
+        finally:
+            history.close()
+
+    def test_paginated_status_queries(self, history):
+        for i in range(25):
+            history.update_state(f"/in/book{i:02d}", "h", "pending" if i % 5 else "processed", ["f"], {"title": str(i)})
+
+        assert history.count_by_status("pending") == 20
+        assert history.count_by_status() == {"pending": 20, "processed": 5}
+
+        page, cursor = history.get_page_by_status("pending", limit=8)
+        assert len(page) == 8 and cursor == page[-1]["path"]
+        assert "metadata" not in page[0]
+
+        streamed = list(history.iter_by_status("pending", page_size=7, include_blobs=True))
+        assert [row["path"] for row in streamed] == sorted(row["path"] for row in streamed)
+        assert len(streamed) == 20
+        assert json.loads(streamed[0]["metadata"])["title"] == "1"
+
+    def test_hash_memoized_until_invalidated(self, history, tmp_path):
+        book = tmp_path / "book"
+        book.mkdir()
+        f = book / "ch1.mp3"
+        f.write_bytes(b"abc")
+
+        first = history.calculate_hash(str(book), [str(f)])
+        f.write_bytes(b"abcdef")
+        # No monitor event yet: served from the cache without touching the file
+        assert history.calculate_hash(str(book), [str(f)]) == first
+        assert history.get_stats()["hash_cache_hits"] == 1
+
+        history.invalidate_path(str(f))
+        assert history.calculate_hash(str(book), [str(f)]) != first
+
+        # Directory events invalidate every group underneath
+        second = history.calculate_hash(str(book), [str(f)])
+        f.write_bytes(b"abcdefghi")
+        history.invalidate_path(str(tmp_path), is_directory=True)
+        assert history.calculate_hash(str(book), [str(f)]) != second
+
+    def test_fingerprint_survives_rename(self, history, tmp_path):
+        old_dir = tmp_path / "Book (2011)"
+        old_dir.mkdir()
+        for i in range(2):
+            (old_dir / f"part{i}.mp3").write_bytes(bytes([i]) * (300 * 1024))
+        old_files = [str(p) for p in old_dir.iterdir()]
+        fingerprint = history.calculate_fingerprint(old_files)
+        history.update_state(str(old_dir), "h", "processed", old_files, {"title": "Book"}, fingerprint=fingerprint)
+
+        new_dir = tmp_path / "Author - Book"
+        old_dir.rename(new_dir)
+        (new_dir / "part0.mp3").rename(new_dir / "Chapter 01.mp3")
+        new_files = [str(p) for p in new_dir.iterdir()]
+
+        assert history.calculate_hash(str(new_dir), new_files) != "h"
+        assert history.calculate_fingerprint(new_files) == fingerprint
+        match = history.find_by_fingerprint(fingerprint, exclude_path=str(new_dir))
+        assert match["path"] == str(old_dir)
+        assert json.loads(match["metadata"]) == {"title": "Book"}
+
+    def test_incremental_vacuum_conversion_waits_for_maintenance(self, tmp_path):
+        path = str(tmp_path / "old.db")
+        legacy = sqlite3.connect(path)
+        legacy.execute("CREATE TABLE leftover (x)")
+        legacy.commit()
+        legacy.close()
+
+        history = HistoryManager(path)
+        # Opening an existing database never runs the full VACUUM
+        assert history._connect().execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+        history.run_maintenance(retention_days=0)
+        assert history._connect().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        history.close()
+
+        fresh = HistoryManager(str(tmp_path / "new.db"))
+        assert fresh._connect().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        fresh.close()
+
+    def test_archive_tier(self, history):
+        history.update_state("/in/old", "h-old", "processed", ["a.mp3"], {"title": "Old"}, fingerprint="fp-old")
+        history.update_state("/in/waiting", "h-wait", "pending", ["b.mp3"])
+        history._connect().execute("UPDATE file_history SET last_updated = 0")
+        history._connect().commit()
+
+        assert history.archive_older_than(86400) == 1
+        assert history.count_by_status() == {"pending": 1}
+
+        # Archived rows are still found by path, content hash and fingerprint
+        state = history.get_state("/in/old")
+        assert state["archived"] and state["status"] == "processed"
+        assert json.loads(state["metadata"]) == {"title": "Old"}
+        assert history.has_seen(content_hash="h-old")
+        assert history.find_by_fingerprint("fp-old")["path"] == "/in/old"
+
+        history.run_maintenance(retention_days=30)
+        stats = history.get_db_stats()
+        assert stats["archived_rows"] == 1
+        assert stats["hot_rows"] == {"pending": 1}
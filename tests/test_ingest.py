@@ -2,6 +2,7 @@ import os
 import shutil
 import pytest
 import time
+import threading
 from src.ingest import IngestionManager, FileGrouper
 from src.config import config
 
@@ -61,3 +62,309 @@ class TestIngestion:
         assert not os.path.exists(zip_path) # Should be deleted
         extracted_file = input_dir / "test" / "book.mp3"
         assert extracted_file.exists()
+
+    def test_background_extraction_skips_stability(self, setup_dirs):
+        import zipfile
+        from src.monitor import StabilityChecker
+        input_dir = setup_dirs
+        zip_path = input_dir / "Author - Book.zip"
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for i in range(6):
+                zf.writestr(f"CD{i % 2 + 1}/track{i}.mp3", os.urandom(1000) * (i + 1))
+            zf.writestr("../escape.mp3", "x")
+            zf.writestr("__MACOSX/CD1/._track0.mp3", "x")
+
+        manager = IngestionManager(lambda d, f: None)
+        checker = StabilityChecker(manager.process_file, manager.ignored)
+        manager.process_file(str(zip_path))
+
+        deadline = time.time() + 5
+        while time.time() < deadline and not manager.grouper.groups:
+            manager.tick()
+            time.sleep(0.05)
+
+        dest = input_dir / "Author - Book"
+        assert not zip_path.exists()
+        assert not (input_dir / "Author - Book.extracting").exists()
+        assert not (input_dir / "escape.mp3").exists()
+        assert (dest / "escape.mp3").exists()
+        assert not (dest / "__MACOSX").exists()
+        # CD1/CD2 are grouped with their book
+        assert set(manager.grouper.groups) == {str(dest)}
+        assert len(manager.grouper.groups[str(dest)]['files']) == 7
+        assert (dest / "CD2" / "track5.mp3").stat().st_size == 6000
+        assert manager.get_stats()["extracting_count"] == 0
+
+        # Watchdog events for the files we extracted are not tracked again
+        checker.add_file(str(dest / "CD1" / "track0.mp3"))
+        assert checker.tracked_files == {}
+
+    def test_ignore_list_expiry(self, setup_dirs):
+        from src.monitor import IgnoreList
+        ignored = IgnoreList()
+        ignored.add("/input/Book", ttl=0.05)
+        assert "/input/Book/a.mp3" in ignored
+        assert "/input/Book 2/a.mp3" not in ignored
+        time.sleep(0.1)
+        assert "/input/Book/a.mp3" not in ignored
+
+    def _tagged_mp3(self, path):
+        from mutagen.id3 import ID3, TIT2, TPE1
+        with open(path, 'wb') as f:
+            f.write((b"\xff\xfb\x90\x64" + b"\x00" * 413) * 8) # Silent MPEG frames
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text="The Martian"))
+        tags.add(TPE1(encoding=3, text="Andy Weir"))
+        tags.save(path)
+
+    def test_peek_archive_reads_tags_without_extracting(self, setup_dirs, tmp_path):
+        import tarfile
+        import zipfile
+        from src.identifier import Identifier
+        input_dir = setup_dirs
+        mp3 = tmp_path / "01.mp3"
+        self._tagged_mp3(str(mp3))
+        zip_path = input_dir / "Some Release.zip"
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("cover.jpg", "x")
+            zf.write(mp3, "02.mp3")
+            zf.write(mp3, "01.mp3")
+        tar_path = input_dir / "Other Release.tar"
+        with tarfile.open(tar_path, 'w') as tf:
+            tf.add(mp3, "disc/01.mp3")
+
+        manager = IngestionManager(lambda d, f: None)
+        peek = manager.peek_archive(str(zip_path))
+        assert peek.member == "01.mp3"
+        assert peek.dest_dir == str(input_dir / "Some Release")
+        assert not peek.dest_dir.endswith(".zip") and not os.path.exists(peek.dest_dir)
+        result = Identifier().identify_archive(peek.dest_dir, peek.member, peek.header)
+        assert (result.title, result.author) == ("The Martian", "Andy Weir")
+
+        peek = manager.peek_archive(str(tar_path))
+        assert peek.member == "disc/01.mp3"
+        result = Identifier().identify_archive(peek.dest_dir, peek.member, peek.header)
+        assert (result.title, result.author) == ("The Martian", "Andy Weir")
+
+    def test_extraction_replaced_by_handler(self, setup_dirs):
+        import zipfile
+        from concurrent.futures import Future
+        input_dir = setup_dirs
+        zip_path = input_dir / "Unknown.zip"
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            zf.writestr("track.mp3", "audio content")
+
+        handled = []
+        verdict = Future()
+        verdict.set_result(lambda: handled.append(True))
+        manager = IngestionManager(lambda d, f: None)
+        assert manager.extract_archive(str(zip_path), verdict) == []
+        assert handled == [True]
+        # The archive is left for the handler; nothing is extracted
+        assert zip_path.exists()
+        assert not (input_dir / "Unknown").exists()
+        assert not (input_dir / "Unknown.extracting").exists()
+
+        # A verdict of None lets the extraction finish
+        verdict = Future()
+        verdict.set_result(None)
+        assert manager.extract_archive(str(zip_path), verdict) == [str(input_dir / "Unknown" / "track.mp3")]
+
+    @pytest.mark.parametrize("suffix,mode", [(".tar", "w"), (".tar.gz", "w:gz"), (".tgz", "w:gz"),
+                                             (".tar.bz2", "w:bz2"), (".tar.xz", "w:xz")])
+    def test_compressed_tar_extraction(self, setup_dirs, tmp_path, suffix, mode):
+        import tarfile
+        from src.monitor import StabilityChecker
+        input_dir = setup_dirs
+        src = tmp_path / "01.mp3"
+        src.write_bytes(os.urandom(5000))
+        archive = input_dir / f"Author - Book{suffix}"
+        with tarfile.open(archive, mode) as tf:
+            tf.add(src, "CD1/01.mp3")
+
+        checker = StabilityChecker(lambda path: None)
+        checker.add_file(str(archive))
+        assert str(archive) in checker.tracked_files
+
+        manager = IngestionManager(lambda d, f: None)
+        assert manager.is_archive(str(archive))
+        files = manager.extract_archive(str(archive))
+        dest = input_dir / "Author - Book"
+        assert files == [str(dest / "CD1" / "01.mp3")]
+        assert (dest / "CD1" / "01.mp3").read_bytes() == src.read_bytes()
+        assert not archive.exists()
+        fmt = manager.get_stats()["extract_mb_per_second"]
+        assert list(fmt) == ["tar" if suffix == ".tar" else mode[2:]]
+
+    def test_tar_zst_extraction(self, setup_dirs):
+        import io
+        import tarfile
+        zstandard = pytest.importorskip("zstandard")
+        input_dir = setup_dirs
+        raw = io.BytesIO()
+        with tarfile.open(fileobj=raw, mode="w") as tf:
+            info = tarfile.TarInfo("01.mp3")
+            info.size = 5
+            tf.addfile(info, io.BytesIO(b"audio"))
+        archive = input_dir / "Book.tar.zst"
+        archive.write_bytes(zstandard.ZstdCompressor().compress(raw.getvalue()))
+
+        manager = IngestionManager(lambda d, f: None)
+        assert manager.extract_archive(str(archive)) == [str(input_dir / "Book" / "01.mp3")]
+
+    def test_nested_archives_are_decoded_in_stream(self, setup_dirs, tmp_path):
+        import io
+        import tarfile
+        import zipfile
+        input_dir = setup_dirs
+        inner_zip = io.BytesIO()
+        with zipfile.ZipFile(inner_zip, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("01.mp3", b"a" * 1000)
+        inner_tar = io.BytesIO()
+        with tarfile.open(fileobj=inner_tar, mode="w:gz") as tf:
+            info = tarfile.TarInfo("02.mp3")
+            info.size = 1000
+            tf.addfile(info, io.BytesIO(b"b" * 1000))
+        outer = input_dir / "Series.tar.xz"
+        with tarfile.open(outer, "w:xz") as tf:
+            for name, data in (("Book 1.zip", inner_zip), ("Book 2.tar.gz", inner_tar)):
+                info = tarfile.TarInfo(name)
+                info.size = len(data.getvalue())
+                data.seek(0)
+                tf.addfile(info, data)
+
+        manager = IngestionManager(lambda d, f: None)
+        files = manager.extract_archive(str(outer))
+        dest = input_dir / "Series"
+        assert sorted(files) == [str(dest / "Book 1" / "01.mp3"), str(dest / "Book 2" / "02.mp3")]
+        # The intermediate archives never reach the disk
+        assert sorted(os.listdir(dest)) == ["Book 1", "Book 2"]
+
+    def test_decompressed_size_limit(self, setup_dirs, monkeypatch):
+        import zipfile
+        input_dir = setup_dirs
+        monkeypatch.setattr(config, "EXTRACT_MAX_SIZE_MB", 1)
+        # Small on disk, over the limit once the nested zip is decoded
+        inner = input_dir / "inner.zip"
+        with zipfile.ZipFile(inner, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("big.mp3", b"\0" * (2 * 1024 * 1024))
+        bomb = input_dir / "bomb.zip"
+        with zipfile.ZipFile(bomb, 'w', zipfile.ZIP_STORED) as zf:
+            zf.write(inner, "inner.zip")
+        os.remove(inner)
+
+        manager = IngestionManager(lambda d, f: None)
+        assert manager.extract_archive(str(bomb)) == []
+        assert bomb.exists()
+        assert not (input_dir / "bomb").exists()
+        assert not (input_dir / "bomb.extracting").exists()
+
+    def test_failed_zip_bucket_cancels_and_waits_for_others(self, setup_dirs, monkeypatch):
+        import zipfile
+        input_dir = setup_dirs
+        monkeypatch.setattr(config, "EXTRACT_MEMBER_WORKERS", 2)
+        archive = input_dir / "book.zip"
+        with zipfile.ZipFile(archive, 'w') as zf:
+            # Buckets by size: [bad.mp3] and [slow.mp3, c.mp3, d.mp3]
+            zf.writestr("bad.mp3", b"b" * 1000)
+            zf.writestr("slow.mp3", b"s" * 10)
+            zf.writestr("c.mp3", b"c" * 5)
+            zf.writestr("d.mp3", b"d" * 5)
+
+        manager = IngestionManager(lambda d, f: None)
+        written, finished = [], []
+        slow_started = threading.Event()
+        def write_member(src, name, target, replaced_by, budget, depth):
+            written.append(name)
+            if name == "bad.mp3":
+                slow_started.wait(2)
+                raise OSError("disk full")
+            slow_started.set()
+            time.sleep(0.3)
+            finished.append(name)
+        manager._write_member = write_member
+
+        assert manager.extract_archive(str(archive)) == []
+        # The other bucket was waited for before cleanup, and stopped at its next member
+        assert finished == ["slow.mp3"]
+        assert sorted(written) == ["bad.mp3", "slow.mp3"]
+        assert not (input_dir / "book.extracting").exists()
+        assert archive.exists()
+        manager.stop()
+
+    def test_disc_folders_grouped_under_book_root(self, setup_dirs, monkeypatch):
+        from src.ingest import book_root
+        input_dir = setup_dirs
+        monkeypatch.setattr(config, "INPUT_DIR", str(input_dir))
+        book = input_dir / "Author - Book"
+        assert book_root(str(book / "CD1"), str(input_dir)) == str(book)
+        assert book_root(str(book / "Part 1" / "Disc 02"), str(input_dir)) == str(book)
+        assert book_root(str(book / "Author - Book - CD 3 of 4"), str(input_dir)) == str(book)
+        assert book_root(str(book / "author.book.cd3"), str(input_dir)) == str(book)
+        # Author/Title Part N: numbered releases are separate books, not discs of the author
+        author = input_dir / "Frank Herbert"
+        assert book_root(str(author / "Dune Part 1"), str(input_dir)) == str(author / "Dune Part 1")
+        assert book_root(str(author / "Dune - Part 2"), str(input_dir)) == str(author / "Dune - Part 2")
+        assert book_root(str(author / "Dune Part 1" / "CD2"), str(input_dir)) == str(author / "Dune Part 1")
+        # Series folders hold separate books; a disc folder directly in the input has no book folder
+        assert book_root(str(input_dir / "Series" / "Book 1"), str(input_dir)) == str(input_dir / "Series" / "Book 1")
+        assert book_root(str(input_dir / "CD1"), str(input_dir)) == str(input_dir / "CD1")
+
+        received = []
+        grouper = FileGrouper(lambda d, f: received.append((d, sorted(f))), window=0)
+        paths = [book / "CD1" / "01.mp3", book / "CD2" / "01.mp3", book / "cover.jpg"]
+        for path in paths:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+            grouper.add_file(str(path))
+        grouper.check_groups()
+        assert received == [(str(book), sorted(str(p) for p in paths))]
+
+    def test_group_expiry_is_deadline_ordered(self, setup_dirs):
+        input_dir = setup_dirs
+        received = []
+        grouper = FileGrouper(lambda d, f: received.append(d), window=0.4)
+        first, second = input_dir / "first" / "a.mp3", input_dir / "second" / "a.mp3"
+        for path in (first, second):
+            path.parent.mkdir()
+            path.touch()
+
+        grouper.add_file(str(first))
+        grouper.add_file(str(second))
+        time.sleep(0.3)
+        # Keeps "first" open; its queued deadline is now stale
+        grouper.add_file(str(first))
+        time.sleep(0.2)
+        grouper.check_groups()
+        assert received == [str(second.parent)]
+        assert len(grouper._expiry) == 1 # "first", pushed back with its new deadline
+
+        time.sleep(0.3)
+        grouper.check_groups()
+        assert received == [str(second.parent), str(first.parent)]
+        assert grouper._expiry == []
+
+    def test_groups_survive_restart(self, setup_dirs, tmp_path):
+        from src.history import HistoryManager
+        input_dir = setup_dirs
+        history = HistoryManager(str(tmp_path / "history.db"))
+        book = input_dir / "Book"
+        book.mkdir()
+        for name in ("01.mp3", "02.mp3"):
+            (book / name).touch()
+
+        grouper = FileGrouper(lambda d, f: None, window=3600, store=history)
+        grouper.add_file(str(book / "01.mp3"))
+        grouper.add_file(str(book / "02.mp3"))
+        grouper.check_groups() # Saves the waiting group
+        (book / "02.mp3").unlink()
+
+        received = []
+        restarted = FileGrouper(lambda d, f: received.append((d, f)), window=0, store=history)
+        assert restarted.restore() == 1
+        assert restarted.groups[str(book)]['files'] == {str(book / "01.mp3")}
+        restarted.check_groups()
+        assert received == [(str(book), [str(book / "01.mp3")])]
+        # Emitted groups are dropped from the store
+        assert history.load_groups() == {}
+        history.close()
@@ -0,0 +1,93 @@
+import threading
+import time
+import pytest
+from src.jobs import JobQueue, JobQueueFull
+from src.queue_manager import QueueManager
+from src.identifier import IdentificationResult
+
+def wait_finished(queue, batch_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        batch = queue.get_batch(batch_id)
+        if batch["finished"]:
+            return batch
+        time.sleep(0.01)
+    raise AssertionError("batch did not finish")
+
+class TestJobQueue:
+    @pytest.fixture
+    def queue(self, tmp_path):
+        queue = JobQueue(str(tmp_path / "jobs.db"), workers=2, max_queued=10)
+        yield queue
+        queue.stop(timeout=5)
+
+    def test_batch_runs_with_bounded_concurrency(self, queue):
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+
+        def handler(dirpath, payload):
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            time.sleep(0.02)
+            with lock:
+                running["now"] -= 1
+            if dirpath == "/in/bad":
+                raise ValueError("boom")
+
+        queue.register("process", handler)
+        queue.start()
+        batch = queue.submit("process", [f"/in/book{i}" for i in range(5)] + ["/in/bad"], {"mode": "copy"})
+
+        result = wait_finished(queue, batch["batch_id"])
+        assert result["counts"] == {"done": 5, "failed": 1}
+        assert running["max"] == 2
+
+        jobs = queue.get_batch(batch["batch_id"], include_jobs=True)["jobs"]
+        assert jobs[-1]["error"] == "boom"
+
+    def test_bounded_and_persistent(self, tmp_path, queue):
+        queue.register("ignore", lambda dirpath, payload: None)
+        batch = queue.submit("ignore", [f"/in/book{i}" for i in range(8)])
+        with pytest.raises(JobQueueFull):
+            queue.submit("ignore", ["/in/a", "/in/b", "/in/c"])
+
+        # Simulate a crash mid-job: a second queue on the same db re-queues and runs it
+        queue._db().execute("UPDATE jobs SET status = 'running' WHERE id = 1")
+        restarted = JobQueue(str(tmp_path / "jobs.db"), workers=1)
+        restarted.register("ignore", lambda dirpath, payload: None)
+        restarted.start()
+        try:
+            assert wait_finished(restarted, batch["batch_id"])["counts"] == {"done": 8}
+        finally:
+            restarted.stop(timeout=5)
+
+class TestBulkApi:
+    def test_bulk_update_by_filter(self, tmp_path, monkeypatch):
+        from src.web import api
+
+        qm = QueueManager()
+        jobs = JobQueue(str(tmp_path / "jobs.db"), workers=1)
+        monkeypatch.setattr(api, "queue_manager", qm)
+        monkeypatch.setattr(api, "job_queue", jobs)
+        for action, handler in (("update", api._update_job), ("ignore", api._ignore_job)):
+            jobs.register(action, handler)
+
+        for i, author in enumerate(["Frank Herbert", "Andy Weir", "Frank Herbert"]):
+            qm.add_item(f"/in/book{i}", ["a.mp3"], IdentificationResult(title=f"T{i}", author=author))
+        jobs.start()
+        try:
+            batch = api.bulk_action("update", api.BulkRequest(
+                filter=api.BulkFilter(author="herbert"), updates=api.MetadataUpdate(series="Dune")))
+            assert batch["jobs"] == 2
+            wait_finished(jobs, batch["batch_id"])
+
+            series = sorted(str(item["metadata"]["series"]) for item in qm.get_items())
+            assert series == ["Dune", "Dune", "None"]
+
+            batch = api.bulk_action("ignore", api.BulkRequest(ids=[qm.get_items()[0]["id"], "missing"]))
+            assert batch["skipped"] == ["missing"]
+            wait_finished(jobs, batch["batch_id"])
+            assert len(qm.get_items()) == 2
+        finally:
+            jobs.stop(timeout=5)
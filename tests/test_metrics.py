@@ -0,0 +1,38 @@
+from src.metrics import Registry
+
+class TestMetrics:
+    def test_prometheus_text_format(self):
+        registry = Registry()
+        latency = registry.histogram("test_seconds", "Latency", labels=("provider",), buckets=(0.1, 1))
+        errors = registry.counter("test_errors_total", "Errors", labels=("provider",))
+        latency.observe(0.05, provider="Audible")
+        latency.observe(0.5, provider="Audible")
+        latency.observe(5, provider="Audible")
+        errors.inc(provider='Open"Library')
+        registry.register_collector(lambda: [("test_queue_items", "Queue size", {}, 3)])
+
+        text = registry.render()
+        assert "# TYPE test_seconds histogram" in text
+        assert 'test_seconds_bucket{provider="Audible",le="0.1"} 1' in text
+        assert 'test_seconds_bucket{provider="Audible",le="1.0"} 2' in text
+        assert 'test_seconds_bucket{provider="Audible",le="+Inf"} 3' in text
+        assert 'test_seconds_count{provider="Audible"} 3' in text
+        assert 'test_errors_total{provider="Open\\"Library"} 1' in text
+        assert "# TYPE test_queue_items gauge\ntest_queue_items 3" in text
+
+        summary = registry.summary()
+        assert summary["test_seconds"]["Audible"]["count"] == 3
+
+    def test_hash_cache_hits_are_counted(self, tmp_path):
+        from src import metrics
+        from src.history import HistoryManager
+
+        history = HistoryManager(str(tmp_path / "history.db"))
+        try:
+            before = metrics.cache_requests_total.value(cache="content_hash", result="hit")
+            history.calculate_hash(str(tmp_path), [])
+            history.calculate_hash(str(tmp_path), [])
+            assert metrics.cache_requests_total.value(cache="content_hash", result="hit") == before + 1
+            assert "content_hash" in metrics.get_stats()["cache_hit_ratio"]
+        finally:
+            history.close()
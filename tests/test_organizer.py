@@ -0,0 +1,238 @@
+import os
+import pytest
+from mutagen.easyid3 import EasyID3
+from src.config import config
+from src.identifier import IdentificationResult
+from src.organizer import Organizer
+from src import organizer as organizer_module
+from src import publish
+from src.history import HistoryManager
+
+class TestOrganizer:
+    @pytest.fixture
+    def setup_dirs(self, tmp_path, monkeypatch):
+        input_dir = tmp_path / "input"
+        output_dir = tmp_path / "output"
+        input_dir.mkdir()
+        output_dir.mkdir()
+        monkeypatch.setattr(config, "INPUT_DIR", str(input_dir))
+        monkeypatch.setattr(config, "OUTPUT_DIR", str(output_dir))
+        monkeypatch.setattr(config, "CONVERT_TO_M4B", False)
+        monkeypatch.setattr(config, "DRY_RUN", False)
+        monkeypatch.setattr(config, "PUID", os.getuid())
+        monkeypatch.setattr(config, "PGID", os.getgid())
+
+        book_dir = input_dir / "Andy Weir - The Martian"
+        book_dir.mkdir()
+        files = []
+        for i in range(2):
+            f = book_dir / f"ch{i}.txt"
+            f.write_text(f"chapter {i}")
+            files.append(str(f))
+        return book_dir, output_dir, files
+
+    def _metadata(self, title="The Martian"):
+        return IdentificationResult(title=title, author="Andy Weir")
+
+    def test_organize_copy_mode(self, setup_dirs):
+        book_dir, output_dir, files = setup_dirs
+        Organizer().organize(str(book_dir), files, self._metadata())
+
+        dest = output_dir / "Andy Weir" / "The Martian"
+        assert (dest / "The Martian - 01.txt").read_text() == "chapter 0"
+        assert (dest / "The Martian - 02.txt").read_text() == "chapter 1"
+        assert (dest / "metadata.json").exists()
+        # Sources preserved, staging cleaned up
+        assert all(os.path.exists(f) for f in files)
+        assert not (output_dir / ".staging" / "Andy Weir").exists()
+
+    def test_reorganize_replaces_existing(self, setup_dirs):
+        book_dir, output_dir, files = setup_dirs
+        dest = output_dir / "Andy Weir" / "The Martian"
+        dest.mkdir(parents=True)
+        (dest / "stale.txt").write_text("old")
+
+        Organizer().organize(str(book_dir), files, self._metadata())
+
+        assert not (dest / "stale.txt").exists()
+        assert (dest / "The Martian - 01.txt").exists()
+        assert [p for p in os.listdir(dest.parent) if p.startswith(".")] == []
+
+    def test_cross_device_publish(self, setup_dirs, monkeypatch):
+        book_dir, output_dir, files = setup_dirs
+        dest = output_dir / "Andy Weir" / "The Martian"
+        dest.mkdir(parents=True)
+        (dest / "stale.txt").write_text("old")
+
+        # Pretend staging and destination live on different devices
+        monkeypatch.setattr(publish, "same_device", lambda a, b: False)
+        organizer = Organizer()
+        staging = output_dir / ".staging" / "Andy Weir" / "The Martian"
+        staging.mkdir(parents=True)
+        (staging / "book.txt").write_text("new")
+        # Left behind by an interrupted attempt at an older version
+        partial = output_dir / "Andy Weir" / ".The Martian.partial"
+        partial.mkdir()
+        (partial / "old cover.jpg").write_text("old")
+
+        publish.publish(str(staging), str(dest), organizer.copier)
+
+        assert (dest / "book.txt").read_text() == "new"
+        assert not (dest / "stale.txt").exists()
+        assert not (dest / "old cover.jpg").exists()
+        assert not staging.exists()
+
+    def test_staging_root_on_destination_device(self, setup_dirs, monkeypatch, tmp_path):
+        _, output_dir, _ = setup_dirs
+        mounted = tmp_path / "mounted-staging"
+        monkeypatch.setattr(config, "STAGING_DIRS", [str(mounted)])
+        organizer = Organizer()
+        dest = str(output_dir / "Andy Weir" / "The Martian")
+
+        # Author folder on another device: the extra root on that device is used
+        monkeypatch.setattr(organizer_module, "same_device", lambda a, b: a == str(mounted))
+        assert organizer._staging_dir_for(dest, "Andy Weir/The Martian") == str(mounted / "Andy Weir/The Martian")
+
+        # No root on that device: stage under OUTPUT_DIR, never inside the library folders
+        monkeypatch.setattr(organizer_module, "same_device", lambda a, b: False)
+        staging = organizer._staging_dir_for(dest, "Andy Weir/The Martian")
+        assert staging == str(output_dir / ".staging" / "Andy Weir/The Martian")
+
+    def test_metadata_only_update_in_place(self, setup_dirs, monkeypatch, tmp_path):
+        book_dir, output_dir, files = setup_dirs
+        history = HistoryManager(str(tmp_path / "history.db"))
+        organizer = Organizer(store=history)
+        organizer.organize(str(book_dir), files, self._metadata("The Martain"))
+        old_dest = output_dir / "Andy Weir" / "The Martain"
+        assert (old_dest / "The Martain - 01.txt").exists()
+
+        # Inputs unchanged: fixing the title clones the published book, not the sources
+        copy_files = organizer.copier.copy_files
+        sources = []
+        def record_copy(jobs):
+            jobs = list(jobs)
+            sources.extend(job[0] for job in jobs)
+            return copy_files(jobs)
+        monkeypatch.setattr(organizer.copier, "copy_files", record_copy)
+        organizer.organize(str(book_dir), files, self._metadata("The Martian"))
+
+        assert sources and all(src.startswith(str(old_dest) + os.sep) for src in sources)
+        new_dest = output_dir / "Andy Weir" / "The Martian"
+        assert not old_dest.exists()
+        assert (new_dest / "The Martian - 01.txt").read_text() == "chapter 0"
+        assert (new_dest / "The Martian - 02.txt").read_text() == "chapter 1"
+        assert '"The Martian"' in (new_dest / "metadata.json").read_text()
+        assert history.get_library_dir(str(book_dir)) == str(new_dest)
+        history.close()
+
+    def test_failed_metadata_update_leaves_live_book_untouched(self, setup_dirs, monkeypatch):
+        book_dir, output_dir, files = setup_dirs
+        organizer = Organizer()
+        organizer.organize(str(book_dir), files, self._metadata())
+        dest = output_dir / "Andy Weir" / "The Martian"
+        before = sorted(p.name for p in dest.iterdir())
+        metadata_json = (dest / "metadata.json").read_text()
+
+        def fail_tags(directory, metadata):
+            raise OSError("disk full")
+        monkeypatch.setattr(organizer, "_write_tags", fail_tags)
+        updated = self._metadata()
+        updated.description = "Stranded on Mars"
+        with pytest.raises(OSError):
+            organizer.organize(str(book_dir), files, updated)
+
+        assert sorted(p.name for p in dest.iterdir()) == before
+        assert (dest / "metadata.json").read_text() == metadata_json
+        assert not (output_dir / ".staging" / "Andy Weir").exists()
+
+    def test_fallback_copy_is_reused_when_conversion_is_enabled(self, setup_dirs, monkeypatch):
+        book_dir, output_dir, files = setup_dirs
+        monkeypatch.setattr(config, "CONVERT_TO_M4B", True)
+        organizer = Organizer()
+        def fail_merge(*args):
+            raise RuntimeError("ffmpeg missing")
+        monkeypatch.setattr(organizer.converter, "merge_files", fail_merge)
+        organizer.organize(str(book_dir), files, self._metadata())
+
+        # The conversion fell back to a copy; a metadata edit reuses that copy
+        monkeypatch.setattr(organizer.converter, "merge_files",
+                            lambda *args: pytest.fail("book should not be converted again"))
+        organizer.organize(str(book_dir), files, self._metadata("The Martian"))
+        assert (output_dir / "Andy Weir" / "The Martian" / "The Martian - 01.txt").exists()
+
+    def test_changed_inputs_sync_changed_files_only(self, setup_dirs):
+        book_dir, output_dir, files = setup_dirs
+        organizer = Organizer()
+        organizer.organize(str(book_dir), files, self._metadata())
+        dest = output_dir / "Andy Weir" / "The Martian"
+        unchanged_inode = os.stat(dest / "The Martian - 01.txt").st_ino
+
+        with open(files[1], "w") as f:
+            f.write("chapter 1, revised")
+        os.utime(files[1], (1, 1))
+        organizer.organize(str(book_dir), files, self._metadata())
+
+        assert os.stat(dest / "The Martian - 01.txt").st_ino == unchanged_inode
+        assert (dest / "The Martian - 02.txt").read_text() == "chapter 1, revised"
+
+    def test_permissions_applied_at_creation(self, setup_dirs):
+        book_dir, output_dir, files = setup_dirs
+        for f in files:
+            os.chmod(f, 0o600)
+        Organizer().organize(str(book_dir), files, self._metadata())
+
+        dest = output_dir / "Andy Weir" / "The Martian"
+        for name in ("The Martian - 01.txt", "metadata.json"):
+            assert os.stat(dest / name).st_mode & 0o777 == 0o664
+        assert os.stat(dest).st_mode & 0o777 == 0o775
+        assert os.stat(dest.parent).st_mode & 0o777 == 0o775
+
+    def test_write_tags_skips_matching_and_patches_in_place(self, tmp_path):
+        mp3 = tmp_path / "book.mp3"
+        mp3.write_bytes(b"\xff\xfb" + b"\x00" * 4096)
+        organizer = Organizer()
+
+        organizer._write_tags(str(tmp_path), self._metadata("The Martain"))
+        first_size = os.path.getsize(mp3)
+
+        # Unchanged metadata leaves the file untouched
+        os.utime(mp3, (1, 1))
+        organizer._write_tags(str(tmp_path), self._metadata("The Martain"))
+        assert os.stat(mp3).st_mtime == 1
+
+        # A changed title fits in the reserved padding, so the file does not grow
+        organizer._write_tags(str(tmp_path), self._metadata("The Martian"))
+        assert os.path.getsize(mp3) == first_size
+        assert EasyID3(str(mp3))["title"] == ["The Martian"]
+
+    def test_copied_mp3_gets_padding_before_tagging(self, setup_dirs):
+        book_dir, output_dir, _ = setup_dirs
+        audio = b"\xff\xfb" + os.urandom(4096)
+        src = book_dir / "ch0.mp3"
+        src.write_bytes(audio)
+        for f in book_dir.glob("*.txt"):
+            f.unlink()
+
+        Organizer().organize(str(book_dir), [str(src)], self._metadata())
+
+        # The empty padded tag written during the copy absorbs the tags in place
+        dest = output_dir / "Andy Weir" / "The Martian" / "The Martian.mp3"
+        data = dest.read_bytes()
+        assert len(data) == 10 + organizer_module.TAG_PADDING + len(audio)
+        assert data.endswith(audio)
+        assert EasyID3(str(dest))["title"] == ["The Martian"]
+        assert src.read_bytes() == audio
+
+    def test_files_match_catches_same_size_change_within_a_second(self, tmp_path):
+        src, dst = tmp_path / "a.mp3", tmp_path / "b.mp3"
+        big = os.urandom(2 * 1024 * 1024)
+        src.write_bytes(big)
+        dst.write_bytes(big[:-1] + bytes([big[-1] ^ 1]))
+        # Same size and same whole second, different content
+        os.utime(src, ns=(1_000_000_100, 1_000_000_100))
+        os.utime(dst, ns=(1_000_000_200, 1_000_000_200))
+        assert not publish.files_match(str(src), str(dst))
+
+        dst.write_bytes(big)
+        os.utime(dst, ns=(1_000_000_200, 1_000_000_200))
+        assert publish.files_match(str(src), str(dst))
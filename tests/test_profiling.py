@@ -0,0 +1,62 @@
+import time
+import pstats
+import pytest
+from src.profiling import Profiler
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+class TestProfiler:
+    def test_cprofile_next_calls(self, tmp_path):
+        profiler = Profiler(str(tmp_path))
+        profiler.profile_next(2, ["organize"])
+
+        for _ in range(3):
+            with profiler.profiled("organize"):
+                busy_work()
+            # Not armed for this target
+            with profiler.profiled("process_book"):
+                busy_work()
+
+        status = profiler.get_status()
+        assert status["cprofile"] is None
+        [result] = status["results"]
+        stats = pstats.Stats(profiler.result_path(result["name"]))
+        calls = [v for k, v in stats.stats.items() if k[2] == "busy_work"]
+        assert calls[0][1] == 2  # primitive call count
+        assert "busy_work" in profiler.pstats_text(profiler.result_path(result["name"]))
+
+    def test_stop_session_when_a_target_never_runs(self, tmp_path):
+        profiler = Profiler(str(tmp_path))
+        profiler.profile_next(2, ["organize", "process_book"])
+        for _ in range(2):
+            with profiler.profiled("organize"):
+                busy_work()
+
+        # process_book never ran, so the session is still armed
+        assert profiler.get_status()["cprofile"]["remaining"] == {"organize": 0, "process_book": 2}
+        with pytest.raises(RuntimeError):
+            profiler.profile_next(1, ["organize"])
+
+        profiler.stop_cprofile()
+        status = profiler.get_status()
+        assert status["cprofile"] is None
+        [result] = status["results"]
+        stats = pstats.Stats(profiler.result_path(result["name"]))
+        assert [v for k, v in stats.stats.items() if k[2] == "busy_work"][0][1] == 2
+        with pytest.raises(RuntimeError):
+            profiler.stop_cprofile()
+        profiler.profile_next(1, ["organize"])
+
+    def test_sampling_writes_collapsed_stacks(self, tmp_path):
+        profiler = Profiler(str(tmp_path))
+        info = profiler.start_sampling(0.2, interval=0.005)
+        deadline = time.monotonic() + 0.3
+        while time.monotonic() < deadline:
+            busy_work()
+        profiler._sampler.join(timeout=5)
+
+        path = profiler.result_path(info["name"])
+        lines = open(path).read().splitlines()
+        assert any(line.startswith("MainThread;") and "busy_work" in line for line in lines)
+        assert profiler.result_path("../etc/passwd") is None
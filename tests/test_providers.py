@@ -0,0 +1,89 @@
+import time
+from src.config import config
+from src.providers import MetadataAggregator, MetadataProvider
+from src.identifier import IdentificationResult
+
+class FakeProvider(MetadataProvider):
+    def __init__(self, results, delay=0.0):
+        self.results = results
+        self.delay = delay
+
+    def search(self, query, author=None):
+        time.sleep(self.delay)
+        return self.results
+
+class SlowProvider(FakeProvider):
+    pass
+
+class TestSearchStream:
+    def make_aggregator(self, providers):
+        aggregator = MetadataAggregator()
+        aggregator.providers = providers
+        return aggregator
+
+    def test_dedup_across_providers(self):
+        aggregator = self.make_aggregator([
+            FakeProvider([IdentificationResult(title="The Martian", author="Andy Weir", asin="B00EMXBDMA")]),
+            FakeProvider([
+                IdentificationResult(title="Martian", author="Weir, Andy", isbn="978-0553418026",
+                                     description="Stranded on Mars"),
+                IdentificationResult(title="Project Hail Mary", author="Andy Weir"),
+            ], delay=0.05),
+        ])
+        target = IdentificationResult(title="The Martian", author="Andy Weir")
+        events = list(aggregator.search_stream("The Martian", target=target, deadline=2))
+
+        assert events[-1]["type"] == "done" and events[-1]["timed_out"] == []
+        final = {}
+        for event in events[:-1]:
+            final[event["key"]] = event["candidate"]
+        assert len(final) == 2
+        martian = next(c for c in final.values() if c["asin"])
+        # Better-scored candidate kept, gaps filled from the duplicate
+        assert martian["title"] == "The Martian"
+        assert martian["description"] == "Stranded on Mars"
+        assert events[0]["type"] == "candidate" and events[1]["type"] == "update"
+        # Scores are stored as the model's int field, not raw fuzzy-match floats
+        assert all(type(c["confidence"]) is int for c in final.values())
+
+    def test_deadline(self):
+        aggregator = self.make_aggregator([
+            FakeProvider([IdentificationResult(title="Dune", author="Frank Herbert")]),
+            SlowProvider([IdentificationResult(title="Dune Messiah")], delay=1.0),
+        ])
+        start = time.monotonic()
+        events = list(aggregator.search_stream("Dune", deadline=0.2))
+        assert time.monotonic() - start < 0.9
+        assert [e["type"] for e in events] == ["candidate", "done"]
+        assert events[-1]["timed_out"] == ["SlowProvider"]
+
+class TestEnrich:
+    def test_merged_result_carries_best_score(self):
+        aggregator = MetadataAggregator()
+        aggregator.providers = [FakeProvider([
+            IdentificationResult(title="Dune", author="Frank Herbert", asin="B00B7NPRY8"),
+        ])]
+        result = aggregator.enrich(IdentificationResult(title="Dune", author="Frank Herbert"))
+        assert result.asin == "B00B7NPRY8"
+        assert result.confidence == 100
+        assert result.confidence >= config.MATCH_THRESHOLD_PROBABLE
+
+    def test_weak_match_falls_below_threshold(self):
+        aggregator = MetadataAggregator()
+        aggregator.providers = [FakeProvider([
+            IdentificationResult(title="The Dune Encyclopedia", author="Willis E. McNelly",
+                                 description="Companion guide"),
+        ])]
+        # Tags gave a confident guess; the merged result must carry the provider match's
+        # score, so a poor match goes to manual review instead of being organized
+        initial = IdentificationResult(title="Dune", author="Frank Herbert", confidence=95)
+        result = aggregator.enrich(initial)
+        assert result.description == "Companion guide"
+        assert isinstance(result.confidence, int)
+        assert result.confidence < config.MATCH_THRESHOLD_PROBABLE
+
+    def test_no_provider_match_keeps_initial_confidence(self):
+        aggregator = MetadataAggregator()
+        aggregator.providers = [FakeProvider([])]
+        initial = IdentificationResult(title="Dune", author="Frank Herbert", confidence=40)
+        assert aggregator.enrich(initial).confidence == 40
@@ -0,0 +1,192 @@
+import json
+import threading
+import pytest
+from src.queue_manager import QueueManager
+from src.identifier import IdentificationResult
+
+class FakeHistory:
+    def __init__(self):
+        self.writes = []
+
+    def calculate_hash(self, dirpath, files):
+        return "h"
+
+    def update_state(self, path, content_hash, status, files=None, metadata=None, fingerprint=None):
+        self.writes.append((path, status))
+
+class TestQueueManager:
+    def test_snapshot_is_immutable_and_versioned(self):
+        qm = QueueManager()
+        item_id = qm.add_item("/in/book", ["/in/book/a.mp3"], IdentificationResult(title="Dune"))
+        version, items = qm.get_snapshot()
+
+        qm.update_item(item_id, status="approved")
+        # The old view is untouched; the new one has a higher version
+        assert items[item_id]["status"] == "pending"
+        assert qm.version > version
+        assert qm.get_items()[0]["status"] == "approved"
+
+        qm.remove_item(item_id)
+        assert qm.get_items() == []
+        assert item_id in items
+
+    def test_processing_is_not_persisted(self):
+        qm = QueueManager()
+        history = FakeHistory()
+        qm.set_history_manager(history)
+        item_id = qm.add_item("/in/book", ["/in/book/a.mp3"])
+
+        qm.mark_processing(item_id)
+        qm.update_item(item_id, status="error", error="boom")
+        assert history.writes == [("/in/book", "pending"), ("/in/book", "error")]
+        assert qm.get_items()[0]["error"] == "boom"
+
+    def test_stale_history_write_is_dropped(self):
+        qm = QueueManager()
+        history = FakeHistory()
+        qm.set_history_manager(history)
+        item_id = qm.add_item("/in/book", ["/in/book/a.mp3"])
+
+        # The first update stalls while hashing, so the second reaches history first
+        hashing, release = threading.Event(), threading.Event()
+        def slow_hash(dirpath, files):
+            history.calculate_hash = FakeHistory.calculate_hash.__get__(history)
+            hashing.set()
+            release.wait(2)
+            return "h"
+        history.calculate_hash = slow_hash
+
+        first = threading.Thread(target=qm.update_item, args=(item_id,), kwargs={"status": "approved"})
+        first.start()
+        hashing.wait(2)
+        qm.update_item(item_id, status="rejected")
+        release.set()
+        first.join()
+
+        assert history.writes == [("/in/book", "pending"), ("/in/book", "rejected")]
+
+    def test_concurrent_readers_and_writers(self):
+        qm = QueueManager()
+        ids = [qm.add_item(f"/in/book{i}", ["a.mp3"]) for i in range(20)]
+        errors = []
+
+        def writer():
+            for n in range(50):
+                for item_id in ids:
+                    qm.update_item(item_id, status=f"s{n}")
+
+        def reader():
+            for _ in range(200):
+                items = qm.get_items()
+                if len(items) != len(ids):
+                    errors.append(len(items))
+
+        threads = [threading.Thread(target=writer) for _ in range(2)] + [threading.Thread(target=reader) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert errors == []
+        assert {item["status"] for item in qm.get_items()} == {"s49"}
+        assert qm.get_stats()["lock_stats"]["item"]["acquisitions"] >= 2000
+
+    def test_query_filters_sorts_and_pages(self):
+        qm = QueueManager()
+        for i, (author, confidence) in enumerate([("Frank Herbert", 90), ("Andy Weir", 40), ("frank herbert", 70)]):
+            qm.add_item(f"/in/book{i}", ["a.mp3"], IdentificationResult(title=f"T{i}", author=author, confidence=confidence))
+
+        items, cursor, total = qm.query(author="frank", sort="confidence", descending=True, limit=1)
+        assert total == 2
+        assert items[0]["metadata"]["confidence"] == 90
+        items, cursor, _ = qm.query(author="frank", sort="confidence", descending=True, after=cursor, limit=1)
+        assert items[0]["metadata"]["confidence"] == 70
+        assert cursor is None
+
+        items, _, total = qm.query(min_confidence=50, status=["pending"])
+        assert total == 2
+
+    def test_cover_urls_follow_the_view(self):
+        qm = QueueManager()
+        a = qm.add_item("/in/a", ["a.mp3"], IdentificationResult(title="A", cover_url="http://c.example/1.jpg"))
+        b = qm.add_item("/in/b", ["b.mp3"], IdentificationResult(title="B", cover_url="http://c.example/1.jpg"))
+        assert qm.has_cover("http://c.example/1.jpg")
+
+        qm.update_item(a, metadata=IdentificationResult(title="A", cover_url="http://c.example/2.jpg"))
+        assert qm.has_cover("http://c.example/1.jpg") and qm.has_cover("http://c.example/2.jpg")
+        qm.remove_item(b)
+        assert not qm.has_cover("http://c.example/1.jpg")
+        assert qm.has_cover("http://c.example/2.jpg")
+
+class TestQueueApi:
+    def test_etag_projection_and_cursor(self, monkeypatch):
+        from starlette.requests import Request
+        from src.web import api
+
+        qm = QueueManager()
+        monkeypatch.setattr(api, "queue_manager", qm)
+        for i in range(3):
+            qm.add_item(f"/in/book{i}", ["a.mp3"], IdentificationResult(title=f"T{i}", description="long text"))
+
+        def request(headers=None):
+            raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+            return Request({"type": "http", "method": "GET", "path": "/api/queue", "headers": raw})
+
+        response = api.get_queue(request(), limit=2, exclude="metadata.description,files")
+        body = json.loads(response.body)
+        assert len(body["items"]) == 2 and body["total"] == 3
+        assert "files" not in body["items"][0]
+        assert "description" not in body["items"][0]["metadata"]
+
+        second = api.get_queue(request(), cursor=body["next_cursor"], limit=2)
+        assert len(json.loads(second.body)["items"]) == 1
+
+        etag = response.headers["etag"]
+        assert api.get_queue(request({"If-None-Match": etag})).status_code == 304
+        qm.update_item(body["items"][0]["id"], status="approved")
+        assert api.get_queue(request({"If-None-Match": etag})).status_code == 200
+
+    def test_process_is_queued_once(self, monkeypatch):
+        from fastapi import HTTPException
+        from src.web import api
+
+        class FakeJobs:
+            def __init__(self):
+                self.submitted = []
+
+            def submit(self, action, targets, payload=None):
+                self.submitted.extend(targets)
+                return {"batch_id": "b1", "action": action, "jobs": len(targets)}
+
+        qm = QueueManager()
+        jobs = FakeJobs()
+        monkeypatch.setattr(api, "queue_manager", qm)
+        monkeypatch.setattr(api, "job_queue", jobs)
+        item_id = qm.add_item("/in/book", ["a.mp3"], IdentificationResult(title="T"))
+
+        assert api.process_item(item_id, api.ProcessRequest())["batch_id"] == "b1"
+        with pytest.raises(HTTPException) as excinfo:
+            api.process_item(item_id, api.ProcessRequest())
+        assert excinfo.value.status_code == 409
+        batch = api.bulk_action("process", api.BulkRequest(ids=[item_id]))
+        assert batch["skipped"] == [item_id] and batch["batch_id"] is None
+        assert jobs.submitted == ["/in/book"]
+
+    def test_remove_waits_for_the_item_lock(self):
+        qm = QueueManager()
+        item_id = qm.add_item("/in/book", ["/in/book/a.mp3"])
+        stale = qm.get_item(item_id)
+
+        # An update holding the item lock finishes before the item is removed
+        with qm._item_lock(item_id):
+            remover = threading.Thread(target=qm.remove_item, args=(item_id,))
+            remover.start()
+            remover.join(0.1)
+            assert remover.is_alive() and qm.get_item(item_id) is stale
+        remover.join()
+        assert qm.get_item(item_id) is None
+
+        # A re-added item starts over with a fresh lock
+        qm.add_item("/in/book", ["/in/book/a.mp3"])
+        assert qm.update_item(item_id, status="approved")
+        assert qm.get_items()[0]["status"] == "approved"
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src import tracing
+from src.tracing import SpanStore
+
+class TestTracing:
+    @pytest.fixture
+    def store(self, tmp_path, monkeypatch):
+        store = SpanStore(str(tmp_path / "traces.db"), max_spans=100)
+        monkeypatch.setattr(tracing, "store", store)
+        yield store
+        store.close()
+
+    def test_spans_nest_and_follow_the_book(self, store):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with tracing.span("process_book", book="/in/book", new_trace=True):
+                with tracing.span("identify"):
+                    pass
+            # Untraced work outside any book is not recorded
+            with tracing.span("orphan"):
+                pass
+            # Later work on the same book joins its trace
+            pool.submit(self._organize).result()
+
+        trace_id = store.latest_trace("/in/book")
+        spans = {s["name"]: s for s in store.get_trace(trace_id)}
+        assert set(spans) == {"process_book", "identify", "run_organize", "organize.copy"}
+        root = spans["process_book"]["span_id"]
+        assert spans["identify"]["parent_id"] == root
+        assert spans["organize.copy"]["parent_id"] == spans["run_organize"]["span_id"]
+        assert spans["organize.copy"]["error"] == "disk full"
+
+        chrome = tracing.to_chrome_trace(list(spans.values()))
+        complete = [e for e in chrome["traceEvents"] if e["ph"] == "X"]
+        assert len(complete) == 4 and all(e["dur"] >= 0 for e in complete)
+
+    def _organize(self):
+        with tracing.span("run_organize", book="/in/book"):
+            try:
+                with tracing.span("organize.copy"):
+                    raise OSError("disk full")
+            except OSError:
+                pass
+
+    def test_pool_work_is_attached_with_wrap(self, store):
+        def search():
+            with tracing.span("provider.search", provider="Audible"):
+                pass
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with tracing.span("process_book", book="/in/other", new_trace=True):
+                pool.submit(search).result()
+                pool.submit(tracing.wrap(search)).result()
+
+        spans = store.get_trace(store.latest_trace("/in/other"))
+        assert [s["name"] for s in spans].count("provider.search") == 1
+
+    def test_trace_loaded_from_db_is_cached(self, store, monkeypatch):
+        trace_id = store.new_trace("/in/book")
+        with tracing.span("process_book", book="/in/book"):
+            pass
+        # After a restart the trace id comes from SQLite, once
+        store._traces.clear()
+        loads = []
+        latest = store.latest_trace
+        monkeypatch.setattr(store, "latest_trace", lambda book: loads.append(book) or latest(book))
+        assert store.trace_for("/in/book") == trace_id
+        assert store.trace_for("/in/book") == trace_id
+        assert loads == ["/in/book"]
+
+    def test_spans_are_written_in_batches(self, store, monkeypatch):
+        # Finishing a span never touches SQLite
+        db = store._db
+        monkeypatch.setattr(store, "_db", lambda: pytest.fail("span written synchronously"))
+        for i in range(10):
+            with tracing.span(f"step{i}", book="/in/book", new_trace=i == 0):
+                pass
+        assert len(store._buffer) == 10
+
+        monkeypatch.setattr(store, "_db", db)
+        trace_id = store.latest_trace("/in/book")
+        assert len(store.get_trace(trace_id)) == 10
+        assert store._buffer == []